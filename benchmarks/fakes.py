@@ -0,0 +1,171 @@
+"""Deterministic, offline stand-ins for the embedding, vector store and chat models.
+
+Classes:
+    FakeEmbeddings: Hash-seeded random unit vectors.
+    FakeVectorStore: A brute-force in-memory store that honours the user_id filter.
+
+Functions:
+    fake_providers: Back the graphs' model clients and local vector store with the fakes.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import uuid
+from contextlib import contextmanager
+from typing import Any, Generator, Iterable, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.vectorstores import VectorStore
+
+from retrieval_graph import local_store, retrieval, utils
+
+
+class FakeEmbeddings(Embeddings):
+    """Embed each text as a unit vector seeded by its hash, so equal texts match."""
+
+    def __init__(self, size: int = 256) -> None:
+        """Initialize the embeddings with the given dimensionality."""
+        self.size = size
+
+    def _embed(self, text: str) -> list[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.size)
+        return (vector / np.linalg.norm(vector)).astype(np.float32).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embed a list of documents."""
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        """Embed a query."""
+        return self._embed(text)
+
+
+class FakeVectorStore(VectorStore):
+    """An in-memory store that scans every document of the filtered user."""
+
+    def __init__(self, embedding: Embeddings) -> None:
+        """Initialize an empty store."""
+        self._embedding = embedding
+        self._vectors: list[np.ndarray] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._docs: list[Document] = []
+
+    @property
+    def embeddings(self) -> Embeddings:
+        """The store's embedding model."""
+        return self._embedding
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[list[dict]] = None,
+        *,
+        ids: Optional[list[str]] = None,
+        **kwargs: Any,
+    ) -> list[str]:
+        """Embed and store the texts."""
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        vectors = self._embedding.embed_documents(texts)
+        self._vectors.extend(np.asarray(vectors, dtype=np.float32))
+        self._matrix = None
+        self._docs.extend(
+            Document(page_content=text, metadata=metadata, id=id_)
+            for text, metadata, id_ in zip(texts, metadatas, ids)
+        )
+        return ids
+
+    def delete(self, ids: Optional[list[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """Delete documents by id."""
+        doomed = set(ids or ())
+        keep = [i for i, doc in enumerate(self._docs) if doc.id not in doomed]
+        self._docs = [self._docs[i] for i in keep]
+        self._vectors = [self._vectors[i] for i in keep]
+        self._matrix = None
+        return True
+
+    def similarity_search(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> list[Document]:
+        """Return the `k` documents most similar to the query."""
+        if not self._docs:
+            return []
+        if self._matrix is None:
+            self._matrix = np.vstack(self._vectors)
+        scores = self._matrix @ np.asarray(
+            self._embedding.embed_query(query), dtype=np.float32
+        )
+        if filter:
+            mask = np.fromiter(
+                (
+                    all(doc.metadata.get(key) == value for key, value in filter.items())
+                    for doc in self._docs
+                ),
+                dtype=bool,
+                count=len(self._docs),
+            )
+            scores = np.where(mask, scores, -np.inf)
+        top = np.argsort(-scores)[:k]
+        return [self._docs[i] for i in top if np.isfinite(scores[i])]
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: list[str],
+        embedding: Embeddings,
+        metadatas: Optional[list[dict]] = None,
+        **kwargs: Any,
+    ) -> FakeVectorStore:
+        """Create a store holding the given texts."""
+        store = cls(embedding)
+        store.add_texts(texts, metadatas)
+        return store
+
+
+@contextmanager
+def fake_providers(
+    store: FakeVectorStore, answer: str = "The cats swim in their water bowls."
+) -> Generator[None, None, None]:
+    """Back the graphs' chat models, text encoders and local vector store with fakes.
+
+    Only the client constructors are patched: `store` stands in for the
+    ``"local"`` provider's `LocalVectorStore`. Runs configured with that provider
+    therefore go through the real `make_retriever`/`amake_retriever`, including the
+    store pool, the compiled filter plans and single-flight searches.
+    """
+    originals = (
+        local_store.LocalVectorStore,
+        retrieval._build_text_encoder,
+        utils._build_chat_model,
+    )
+    local_store.LocalVectorStore = lambda path, embedding: store  # type: ignore[assignment,misc]
+    retrieval._build_text_encoder = lambda model: store.embeddings  # type: ignore[assignment]
+    utils._build_chat_model = lambda model, provider: FakeListChatModel(  # type: ignore[assignment]
+        responses=[answer]
+    )
+    _invalidate_registries()
+    try:
+        yield
+    finally:
+        (
+            local_store.LocalVectorStore,
+            retrieval._build_text_encoder,
+            utils._build_chat_model,
+        ) = originals
+        _invalidate_registries()
+
+
+def _invalidate_registries() -> None:
+    retrieval.VECTOR_STORES.invalidate()
+    retrieval.TEXT_ENCODERS.invalidate()
+    utils.CHAT_MODELS.invalidate()
@@ -0,0 +1,209 @@
+"""Run the offline benchmarks and write the results as JSON.
+
+Every benchmark runs against the fakes in `benchmarks.fakes`, so results only
+reflect this package's own overhead and are comparable across runs on one machine:
+
+    python -m benchmarks.run --output benchmarks/results.json
+
+Measured, for each corpus size:
+    reduce_docs: Seconds to turn raw dicts into documents.
+    format_docs: Seconds to render documents, with and without a token budget.
+    index_graph: Documents indexed per second.
+    graph: Latency percentiles of `graph.ainvoke` over a corpus of that size.
+
+Each result also records the peak memory allocated while it ran once more under
+`tracemalloc`, which is kept out of the timed runs.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Optional
+
+from langchain_core.documents import Document
+
+from benchmarks.fakes import FakeEmbeddings, FakeVectorStore, fake_providers
+from retrieval_graph import utils
+from retrieval_graph.graph import graph
+from retrieval_graph.index_graph import graph as index_graph
+from retrieval_graph.state import reduce_docs
+
+USER_ID = "benchmark-user"
+QUESTION = "Where do cats perform synchronized swimming routines?"
+
+Benchmark = Callable[[], Awaitable[Any]]
+
+
+def _raw_docs(size: int) -> list[dict[str, Any]]:
+    return [
+        {
+            "page_content": f"Document {i}: cats have been observed swimming in bowl {i}.",
+            "metadata": {"source": f"doc-{i % 100}.txt", "chunk": i},
+        }
+        for i in range(size)
+    ]
+
+
+def _percentile(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def _time(benchmark: Benchmark, repeat: int) -> list[float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await benchmark()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+async def _peak_memory(benchmark: Benchmark) -> int:
+    tracemalloc.start()
+    try:
+        await benchmark()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _config(**configurable: Any) -> dict[str, Any]:
+    # The fakes stand in for the local provider's store, see `fake_providers`.
+    return {
+        "configurable": {
+            "user_id": USER_ID,
+            "retriever_provider": "local",
+            **configurable,
+        }
+    }
+
+
+async def bench_reduce_docs(size: int, repeat: int) -> dict[str, Any]:
+    """Time `reduce_docs` on `size` raw documents."""
+    raw = _raw_docs(size)
+
+    async def run() -> None:
+        reduce_docs(None, raw)
+
+    samples = await _time(run, repeat)
+    return {"seconds": statistics.median(samples), "_run": run}
+
+
+async def bench_format_docs(
+    size: int, repeat: int, token_budget: Optional[int]
+) -> dict[str, Any]:
+    """Time a `format_docs` call on `size` documents."""
+    docs = [Document(**doc) for doc in _raw_docs(size)]
+
+    async def run() -> None:
+        utils.format_docs(docs, token_budget=token_budget)
+
+    samples = await _time(run, repeat)
+    return {"seconds": statistics.median(samples), "_run": run}
+
+
+async def bench_index_graph(size: int, repeat: int) -> dict[str, Any]:
+    """Measure indexing throughput into a fresh store."""
+    raw = _raw_docs(size)
+
+    async def run() -> None:
+        with fake_providers(FakeVectorStore(FakeEmbeddings())):
+            await index_graph.ainvoke({"docs": raw}, _config())
+
+    samples = await _time(run, repeat)
+    seconds = statistics.median(samples)
+    return {"seconds": seconds, "docs_per_sec": size / seconds, "_run": run}
+
+
+async def bench_graph(size: int, iterations: int) -> dict[str, Any]:
+    """Measure end-to-end answer latency over a corpus of `size` documents."""
+    store = FakeVectorStore(FakeEmbeddings())
+    docs = reduce_docs(None, _raw_docs(size))
+    store.add_documents(
+        [
+            Document(page_content=doc.page_content, metadata={"user_id": USER_ID})
+            for doc in docs
+        ]
+    )
+
+    async def ask() -> None:
+        await graph.ainvoke({"messages": [("user", QUESTION)]}, _config())
+
+    async def run() -> None:
+        with fake_providers(store):
+            await ask()
+
+    with fake_providers(store):
+        await ask()  # Build and cache the fake clients outside the measurement.
+        samples = await _time(ask, iterations)
+    return {
+        "p50": _percentile(samples, 0.5),
+        "p90": _percentile(samples, 0.9),
+        "p99": _percentile(samples, 0.99),
+        "mean": statistics.fmean(samples),
+        "_run": run,
+    }
+
+
+async def run_benchmarks(
+    sizes: list[int], repeat: int, iterations: int, memory: bool
+) -> list[dict[str, Any]]:
+    """Run every benchmark at every size and return the results."""
+    results = []
+    for size in sizes:
+        runs = [
+            ("reduce_docs", bench_reduce_docs(size, repeat)),
+            ("format_docs", bench_format_docs(size, repeat, None)),
+            ("format_docs[budget=4000]", bench_format_docs(size, repeat, 4000)),
+            ("index_graph", bench_index_graph(size, repeat)),
+            ("graph", bench_graph(size, iterations)),
+        ]
+        for name, pending in runs:
+            result = await pending
+            run = result.pop("_run")
+            if memory:
+                result["peak_bytes"] = await _peak_memory(run)
+            result = {"name": name, "size": size, **result}
+            print(json.dumps(result), file=sys.stderr)
+            results.append(result)
+    return results
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """Parse the command line, run the benchmarks and write the JSON report."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per timing.")
+    parser.add_argument(
+        "--iterations", type=int, default=50, help="Graph runs per size."
+    )
+    parser.add_argument("--no-memory", action="store_true", help="Skip tracemalloc.")
+    parser.add_argument("--output", help="Write the JSON report here, not stdout.")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(
+        run_benchmarks(args.sizes, args.repeat, args.iterations, not args.no_memory)
+    )
+    report = {
+        "created_at": datetime.now(tz=timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -27,7 +27,47 @@ For detailed configuration options and usage instructions, refer to the Configur
 and individual component documentation within the retrieval_graph package.
 """  # noqa
 
-from retrieval_graph.graph import graph
-from retrieval_graph.index_graph import graph as index_graph
+import importlib
+import sys
+import types
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from retrieval_graph.graph import graph
+    from retrieval_graph.index_graph import graph as index_graph
+
+# The graphs are only imported on first access (PEP 562), so a worker that serves
+# just the indexer never pays for the retrieval graph's imports, and vice versa.
+_LAZY_ATTRIBUTES = {
+    "graph": ("retrieval_graph.graph", "graph"),
+    "index_graph": ("retrieval_graph.index_graph", "graph"),
+}
 
 __all__ = ["graph", "index_graph"]
+
+
+def __getattr__(name: str) -> Any:
+    try:
+        module_name, attribute = _LAZY_ATTRIBUTES[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+    value = getattr(importlib.import_module(module_name), attribute)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted([*globals(), *_LAZY_ATTRIBUTES])
+
+
+class _Package(types.ModuleType):
+    def __setattr__(self, name: str, value: Any) -> None:
+        # Importing `retrieval_graph.graph` binds the submodule to the package under
+        # the same name as the graph it defines. Keep resolving the name to the
+        # graph, as the eager imports this replaced did.
+        if name in _LAZY_ATTRIBUTES and isinstance(value, types.ModuleType):
+            return
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _Package
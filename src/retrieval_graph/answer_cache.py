@@ -0,0 +1,213 @@
+"""A per-user semantic cache of answers produced by the retrieval graph.
+
+When a user asks a question that is close enough to one they asked before, the
+graph can return the earlier answer and its sources without generating queries,
+searching or calling the response model again.
+
+Entries are scoped by user, corpus version and embedding model, so a user never
+sees another user's answers, and bumping the corpus version (or re-indexing the
+user's documents) makes earlier answers unreachable.
+
+Classes:
+    CachedAnswer: An answer stored in the cache.
+    AnswerCacheStats: Hit rate and latency saved by the cache.
+    SemanticAnswerCache: The cache itself.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Hashable, Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+
+# Misses waiting for their answer to be stored; abandoned runs age out of here.
+_MAX_PENDING = 1024
+
+
+@dataclass
+class CachedAnswer:
+    """An answer stored in the cache."""
+
+    answer: str
+    sources: list[Document]
+    latency: float
+    """Seconds it took to produce the answer the first time."""
+    created_at: float = field(default_factory=time.monotonic)
+
+
+@dataclass(frozen=True)
+class AnswerCacheStats:
+    """Hit rate and latency saved by the cache."""
+
+    hits: int
+    misses: int
+    saved_seconds: float
+
+    @property
+    def hit_rate(self) -> float:
+        """The fraction of lookups that were answered from the cache."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class _Scope:
+    """The cached answers of one (user, corpus version, model) scope."""
+
+    def __init__(self) -> None:
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.answers: list[CachedAnswer] = []
+
+    def add(self, vector: np.ndarray, answer: CachedAnswer, max_entries: int) -> None:
+        if self.answers and self.vectors.shape[1] != vector.shape[0]:
+            self.vectors = np.zeros((0, vector.shape[0]), dtype=np.float32)
+            self.answers = []
+        self.vectors = np.vstack([self.vectors.reshape(-1, vector.shape[0]), vector])
+        self.answers.append(answer)
+        if len(self.answers) > max_entries:
+            self.vectors = self.vectors[-max_entries:]
+            self.answers = self.answers[-max_entries:]
+
+    def expire(self, ttl: float) -> None:
+        deadline = time.monotonic() - ttl
+        keep = [
+            i for i, answer in enumerate(self.answers) if answer.created_at > deadline
+        ]
+        if len(keep) != len(self.answers):
+            self.vectors = self.vectors[keep]
+            self.answers = [self.answers[i] for i in keep]
+
+
+class SemanticAnswerCache:
+    """A bounded cache of answers, looked up by embedding similarity.
+
+    Lookups compare the normalized question embedding against every cached
+    question of the scope in one matrix-vector product. A miss remembers the
+    question's embedding and start time, so `store` can add the answer once it has
+    been generated without embedding the question again.
+    """
+
+    def __init__(
+        self, max_scopes: int = 1024, max_entries_per_scope: int = 256
+    ) -> None:
+        """Initialize the cache.
+
+        Args:
+            max_scopes (int): The maximum number of scopes kept; the least recently
+                used scope is dropped first.
+            max_entries_per_scope (int): The maximum number of answers per scope;
+                the oldest answer is dropped first.
+        """
+        self.max_scopes = max_scopes
+        self.max_entries_per_scope = max_entries_per_scope
+        self._lock = threading.Lock()
+        self._scopes: OrderedDict[Hashable, _Scope] = OrderedDict()
+        self._pending: OrderedDict[tuple[Hashable, str], tuple[np.ndarray, float]] = (
+            OrderedDict()
+        )
+        self._hits = 0
+        self._misses = 0
+        self._saved_seconds = 0.0
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(
+        self,
+        scope: Hashable,
+        question: str,
+        embedding: Sequence[float],
+        *,
+        threshold: float,
+        ttl: float,
+    ) -> Optional[CachedAnswer]:
+        """Return the cached answer most similar to the question, if similar enough.
+
+        Args:
+            scope (Hashable): The scope to search, e.g. (user_id, corpus_version, model).
+            question (str): The question text.
+            embedding (Sequence[float]): The question's embedding.
+            threshold (float): The minimum cosine similarity for a hit.
+            ttl (float): The maximum age of a cached answer in seconds.
+        """
+        vector = self._normalize(embedding)
+        with self._lock:
+            entries = self._scopes.get(scope)
+            if entries is not None:
+                self._scopes.move_to_end(scope)
+                entries.expire(ttl)
+                if entries.answers and entries.vectors.shape[1] == vector.shape[0]:
+                    similarities = entries.vectors @ vector
+                    best = int(np.argmax(similarities))
+                    if similarities[best] >= threshold:
+                        answer = entries.answers[best]
+                        self._hits += 1
+                        self._saved_seconds += answer.latency
+                        return answer
+            self._misses += 1
+            self._pending[(scope, question)] = (vector, time.monotonic())
+            while len(self._pending) > _MAX_PENDING:
+                self._pending.popitem(last=False)
+        return None
+
+    def store(
+        self, scope: Hashable, question: str, answer: str, sources: list[Document]
+    ) -> None:
+        """Cache the answer to a question that previously missed in `lookup`."""
+        with self._lock:
+            pending = self._pending.pop((scope, question), None)
+            if pending is None:
+                return
+            vector, started = pending
+            entries = self._scopes.get(scope)
+            if entries is None:
+                entries = self._scopes[scope] = _Scope()
+            self._scopes.move_to_end(scope)
+            entries.add(
+                vector,
+                CachedAnswer(
+                    answer=answer,
+                    sources=list(sources),
+                    latency=time.monotonic() - started,
+                ),
+                self.max_entries_per_scope,
+            )
+            while len(self._scopes) > self.max_scopes:
+                self._scopes.popitem(last=False)
+
+    def invalidate_user(self, user_id: str) -> None:
+        """Drop every answer of a user, e.g. after their documents changed.
+
+        Scopes are expected to be tuples whose first element is the user id.
+        """
+        with self._lock:
+            for scope in [s for s in self._scopes if _scope_user(s) == user_id]:
+                del self._scopes[scope]
+
+    def clear(self) -> None:
+        """Drop every cached answer."""
+        with self._lock:
+            self._scopes.clear()
+            self._pending.clear()
+
+    def stats(self) -> AnswerCacheStats:
+        """Return the hit and miss counts and the latency saved so far."""
+        with self._lock:
+            return AnswerCacheStats(
+                hits=self._hits, misses=self._misses, saved_seconds=self._saved_seconds
+            )
+
+
+def _scope_user(scope: Hashable) -> Optional[Hashable]:
+    return scope[0] if isinstance(scope, tuple) and scope else None
+
+
+ANSWER_CACHE = SemanticAnswerCache()
+"""The process-wide answer cache used by the retrieval graph."""
@@ -0,0 +1,210 @@
+"""Token-aware splitting of documents into chunks before they are indexed.
+
+A long document indexed as a single vector matches almost nothing well, so the
+index graph splits every document that exceeds `chunk_size` tokens into
+overlapping chunks along paragraph, sentence and word boundaries. Each chunk keeps
+the metadata of its document, plus the document's id as ``parent_id`` and its
+position as ``chunk_index``. Chunk ids are derived from the parent id and the
+position, so they stay deterministic for the record ledger. Parent ids are always
+scoped to the user, including the ids callers give documents they upsert.
+
+Splitting and hashing are CPU-bound. Large batches are therefore spread over a
+process pool (``RETRIEVAL_CHUNK_WORKERS`` processes, one per CPU by default), so
+chunking keeps up with embedding instead of holding the event loop.
+
+Functions:
+    chunk_id: Derive the id of a chunk from its parent id and position.
+    chunk_documents: Split documents into chunks and stamp their user and ids.
+    achunk_documents: Like `chunk_documents`, using the process pool for large batches.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import atexit
+import functools
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Optional, Sequence
+
+from langchain_core.documents import Document
+
+from retrieval_graph.ledger import document_id, upsert_id
+from retrieval_graph.utils import approximate_token_count
+
+if TYPE_CHECKING:
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+# Batches with less text than this are cheaper to split inline than to pickle.
+PROCESS_POOL_MIN_CHARS = 4_000_000
+
+_CHUNK_NAMESPACE = uuid.UUID("0d6f3c1e-7a51-4c1b-8e0a-2f4b9a6d3e21")
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=8)
+def _splitter(chunk_size: int, chunk_overlap: int) -> RecursiveCharacterTextSplitter:
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=approximate_token_count,
+    )
+
+
+def chunk_id(parent_id: str, index: int) -> str:
+    """Derive the id of a chunk from its parent id and position.
+
+    Args:
+        parent_id (str): The id of the document the chunk was split from.
+        index (int): The position of the chunk within its document.
+
+    Returns:
+        str: The chunk's id.
+    """
+    return str(uuid.uuid5(_CHUNK_NAMESPACE, f"{parent_id}\0{index}"))
+
+
+def chunk_documents(
+    docs: Sequence[Document],
+    user_id: str,
+    *,
+    chunk_size: Optional[int],
+    chunk_overlap: int = 0,
+    keep_ids: bool = False,
+) -> list[Document]:
+    """Split documents into chunks and stamp their user and deterministic ids.
+
+    Documents that fit in `chunk_size` tokens are kept whole, under the id given by
+    `document_id`. Longer ones are replaced by their chunks.
+
+    Args:
+        docs (Sequence[Document]): The documents to split.
+        user_id (str): The user that owns the documents.
+        chunk_size (Optional[int]): The maximum tokens per chunk; None disables
+            splitting.
+        chunk_overlap (int): The tokens shared by consecutive chunks.
+        keep_ids (bool): Derive the id from the ``id`` already in a document's
+            metadata, if any, with `upsert_id`, instead of from its content. The
+            caller's id is kept as ``external_id``.
+
+    Returns:
+        list[Document]: The stamped documents and chunks, in input order.
+    """
+    chunks = []
+    for doc in docs:
+        metadata = {**doc.metadata, "user_id": user_id}
+        caller_id = keep_ids and doc.metadata.get("id")
+        if caller_id:
+            parent_id = upsert_id(user_id, str(caller_id))
+            metadata["external_id"] = caller_id
+        else:
+            parent_id = document_id(user_id, doc)
+        if (
+            chunk_size is None
+            or approximate_token_count(doc.page_content) <= chunk_size
+        ):
+            chunks.append(
+                Document(
+                    page_content=doc.page_content,
+                    metadata={**metadata, "id": parent_id},
+                )
+            )
+            continue
+        for index, text in enumerate(
+            _splitter(chunk_size, chunk_overlap).split_text(doc.page_content)
+        ):
+            chunks.append(
+                Document(
+                    page_content=text,
+                    metadata={
+                        **metadata,
+                        "id": chunk_id(parent_id, index),
+                        "parent_id": parent_id,
+                        "chunk_index": index,
+                    },
+                )
+            )
+    return chunks
+
+
+async def achunk_documents(
+    docs: Sequence[Document],
+    user_id: str,
+    *,
+    chunk_size: Optional[int],
+    chunk_overlap: int = 0,
+    keep_ids: bool = False,
+) -> list[Document]:
+    """Split documents like `chunk_documents`, in worker processes for large batches."""
+    total_chars = sum(len(doc.page_content) for doc in docs)
+    if chunk_size is None or total_chars < PROCESS_POOL_MIN_CHARS:
+        return chunk_documents(
+            docs,
+            user_id,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            keep_ids=keep_ids,
+        )
+    pool = _process_pool()
+    # Slices of roughly equal text, so that one long document does not leave the
+    # other workers idle.
+    slices: list[list[Document]] = [[]]
+    target = total_chars / _worker_count()
+    size = 0
+    for doc in docs:
+        if size >= target:
+            slices.append([])
+            size = 0
+        slices[-1].append(doc)
+        size += len(doc.page_content)
+    loop = asyncio.get_running_loop()
+    parts = await asyncio.gather(
+        *(
+            loop.run_in_executor(
+                pool,
+                functools.partial(
+                    chunk_documents,
+                    part,
+                    user_id,
+                    chunk_size=chunk_size,
+                    chunk_overlap=chunk_overlap,
+                    keep_ids=keep_ids,
+                ),
+            )
+            for part in slices
+        )
+    )
+    return [chunk for part in parts for chunk in part]
+
+
+def _worker_count() -> int:
+    return int(os.environ.get("RETRIEVAL_CHUNK_WORKERS", "0")) or os.cpu_count() or 1
+
+
+def _process_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Forking a process that runs an event loop and client threads is not
+            # safe, so workers are spawned and import only what they need.
+            _pool = ProcessPoolExecutor(
+                max_workers=_worker_count(),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+@atexit.register
+def _shutdown_process_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
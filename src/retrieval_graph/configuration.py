@@ -32,12 +32,12 @@ class IndexConfiguration:
     )
 
     retriever_provider: Annotated[
-        Literal["elastic", "elastic-local", "pinecone", "mongodb"],
+        Literal["elastic", "elastic-local", "pinecone", "mongodb", "local"],
         {"__template_metadata__": {"kind": "retriever"}},
     ] = field(
         default="elastic",
         metadata={
-            "description": "The vector store provider to use for retrieval. Options are 'elastic', 'pinecone', or 'mongodb'."
+            "description": "The vector store provider to use for retrieval. Options are 'elastic', 'pinecone', 'mongodb', or 'local'."
         },
     )
 
@@ -48,6 +48,88 @@ class IndexConfiguration:
         },
     )
 
+    embedding_cache_path: Optional[str] = field(
+        default=None,
+        metadata={
+            "description": "Path of a SQLite file used to cache embeddings by content hash across runs and processes. "
+            "Leave unset to disable the embedding cache."
+        },
+    )
+
+    embedding_cache_max_bytes: int = field(
+        default=1024 * 1024 * 1024,
+        metadata={
+            "description": "Maximum size in bytes of the on-disk embedding cache before least recently used vectors are evicted."
+        },
+    )
+
+    embedding_batch_max_wait: Optional[float] = field(
+        default=None,
+        metadata={
+            "description": "Seconds a query embedding waits for concurrent queries to be embedded with it in one batched request, e.g. 0.005. "
+            "Leave unset to embed every query on its own."
+        },
+    )
+
+    embedding_batch_max_size: int = field(
+        default=64,
+        metadata={
+            "description": "Maximum number of distinct queries embedded in one batched request."
+        },
+    )
+
+    chunk_size: Optional[int] = field(
+        default=512,
+        metadata={
+            "description": "Maximum number of tokens per indexed chunk. Longer documents are split into overlapping chunks "
+            "that keep the document's id as parent_id. Documents are indexed whole when unset."
+        },
+    )
+
+    chunk_overlap: int = field(
+        default=64,
+        metadata={"description": "Number of tokens shared by consecutive chunks."},
+    )
+
+    index_batch_size: int = field(
+        default=128,
+        metadata={
+            "description": "Number of documents embedded and written to the vector store in a single batch."
+        },
+    )
+
+    index_max_concurrency: int = field(
+        default=4,
+        metadata={
+            "description": "Maximum number of indexing batches in flight at once. "
+            "With more than one, embedding the next batch overlaps with writing the previous one."
+        },
+    )
+
+    index_max_retries: int = field(
+        default=3,
+        metadata={
+            "description": "Number of times a failing indexing batch is retried before it is counted as failed."
+        },
+    )
+
+    record_ledger_path: Optional[str] = field(
+        default=None,
+        metadata={
+            "description": "Path of a SQLite ledger recording which documents have been indexed for each user. "
+            "When set, unchanged documents are skipped on re-upload."
+        },
+    )
+
+    index_cleanup: Optional[Literal["incremental", "full"]] = field(
+        default=None,
+        metadata={
+            "description": "How to delete stale documents after indexing with a record ledger. "
+            "'incremental' removes outdated documents of the sources seen in the upload, "
+            "'full' removes every document of the user that the upload did not contain."
+        },
+    )
+
     @classmethod
     def from_runnable_config(
         cls: Type[T], config: Optional[RunnableConfig] = None
@@ -99,3 +181,130 @@ class Configuration(IndexConfiguration):
             "description": "The language model used for processing and refining queries. Should be in the form: provider/model-name."
         },
     )
+
+    max_queries: int = field(
+        default=3,
+        metadata={
+            "description": "Maximum number of search queries generated per turn. They are searched concurrently."
+        },
+    )
+
+    retrieval_timeout: float = field(
+        default=10.0,
+        metadata={
+            "description": "Seconds to wait for a single search before dropping its results."
+        },
+    )
+
+    fused_top_k: int = field(
+        default=6,
+        metadata={
+            "description": "Number of documents kept after merging the results of all queries of a turn."
+        },
+    )
+
+    rrf_k: int = field(
+        default=60,
+        metadata={
+            "description": "Smoothing constant of the reciprocal rank fusion used to merge the results of several queries."
+        },
+    )
+
+    query_weights: list[float] = field(
+        default_factory=list,
+        metadata={
+            "description": "Fusion weight of each query of a turn, in order. Queries without a weight count with 1.0."
+        },
+    )
+
+    diversity_rerank: bool = field(
+        default=False,
+        metadata={
+            "description": "Over-fetch candidates for each query and re-rank them with maximal marginal relevance, "
+            "keeping the retriever's k (search_kwargs['k'], default 4) diverse documents per query."
+        },
+    )
+
+    diversity_fetch_multiplier: int = field(
+        default=4,
+        metadata={
+            "description": "How many times k candidates are fetched per query before diversity re-ranking."
+        },
+    )
+
+    diversity_lambda: float = field(
+        default=0.5,
+        metadata={
+            "description": "Trade-off of the diversity re-ranking: 1 ranks purely by relevance, 0 purely by diversity."
+        },
+    )
+
+    answer_cache: bool = field(
+        default=False,
+        metadata={
+            "description": "Return a cached answer when the user asks a first-turn question similar to one they asked before."
+        },
+    )
+
+    answer_cache_threshold: float = field(
+        default=0.95,
+        metadata={
+            "description": "Minimum cosine similarity between question embeddings for a cached answer to be reused."
+        },
+    )
+
+    answer_cache_ttl: float = field(
+        default=3600.0,
+        metadata={"description": "Seconds after which a cached answer expires."},
+    )
+
+    corpus_version: str = field(
+        default="",
+        metadata={
+            "description": "Version of the user's document corpus. Cached answers are only reused within the same version."
+        },
+    )
+
+    retrieved_docs_token_budget: Optional[int] = field(
+        default=None,
+        metadata={
+            "description": "Maximum number of tokens of retrieved documents included in the response prompt. "
+            "Documents are added in rank order and trimmed or skipped once the budget runs out. Unlimited when unset."
+        },
+    )
+
+    document_metadata_keys: Optional[list[str]] = field(
+        default=None,
+        metadata={
+            "description": "Metadata keys of retrieved documents rendered into the response prompt. All keys are rendered when unset."
+        },
+    )
+
+    history_token_budget: Optional[int] = field(
+        default=None,
+        metadata={
+            "description": "Maximum number of tokens of conversation history sent to the models. Once exceeded, older "
+            "messages are dropped until the history fits in half the budget. Unlimited when unset."
+        },
+    )
+
+    history_summary: bool = field(
+        default=False,
+        metadata={
+            "description": "Fold messages that drop out of the history window into a rolling summary included in the system prompts."
+        },
+    )
+
+    summary_system_prompt: str = field(
+        default=prompts.SUMMARY_SYSTEM_PROMPT,
+        metadata={
+            "description": "The system prompt used for updating the conversation summary."
+        },
+    )
+
+    summary_model: Annotated[str, {"__template_metadata__": {"kind": "llm"}}] = field(
+        default="anthropic/claude-3-haiku-20240307",
+        metadata={
+            "description": "The language model used for updating the conversation summary. Should be in the form: provider/model-name."
+        },
+    )
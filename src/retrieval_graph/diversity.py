@@ -0,0 +1,138 @@
+"""Maximal marginal relevance (MMR) re-ranking of search results.
+
+Plain similarity search often returns several near-identical chunks, which take up
+room in the response prompt without adding information. MMR instead picks, one at
+a time, the candidate that best trades relevance to the query off against
+similarity to the candidates picked so far.
+
+Functions:
+    maximal_marginal_relevance: Pick diverse, relevant candidates from their vectors.
+    adiversify: Re-rank the rankings of several queries with MMR.
+"""
+
+import asyncio
+from typing import Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from retrieval_graph.fusion import document_key
+
+EMBEDDING_METADATA_KEY = "embedding"
+"""Metadata key under which a store may return a document's vector for reuse."""
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def maximal_marginal_relevance(
+    query: Sequence[float],
+    candidates: Sequence[Sequence[float]],
+    *,
+    k: int,
+    lambda_mult: float = 0.5,
+) -> list[int]:
+    """Pick up to `k` candidates by maximal marginal relevance.
+
+    All pairwise cosine similarities are computed in one matrix product, after
+    which each pick only updates every candidate's similarity to its closest
+    picked neighbour.
+
+    Args:
+        query (Sequence[float]): The query vector.
+        candidates (Sequence[Sequence[float]]): The candidate vectors.
+        k (int): The number of candidates to pick.
+        lambda_mult (float): 1 ranks purely by relevance, 0 purely by diversity.
+
+    Returns:
+        list[int]: The indices of the picked candidates, in pick order.
+
+    Examples:
+        >>> near_duplicates = [[1, 0], [1, 0.01], [0.8, 0.6]]
+        >>> maximal_marginal_relevance([1, 0], near_duplicates, k=2, lambda_mult=0.3)
+        [0, 2]
+    """
+    matrix = _normalize(np.asarray(candidates, dtype=np.float32))
+    if not len(matrix) or k <= 0:
+        return []
+    relevance = matrix @ _normalize(np.asarray(query, dtype=np.float32))
+    similarity = matrix @ matrix.T
+    picked = [int(np.argmax(relevance))]
+    closest = similarity[picked[0]].copy()
+    for _ in range(min(k, len(matrix)) - 1):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * closest
+        scores[picked] = -np.inf
+        best = int(np.argmax(scores))
+        picked.append(best)
+        np.maximum(closest, similarity[best], out=closest)
+    return picked
+
+
+def _without_embedding(doc: Document) -> Document:
+    if EMBEDDING_METADATA_KEY not in doc.metadata:
+        return doc
+    metadata = {
+        key: value
+        for key, value in doc.metadata.items()
+        if key != EMBEDDING_METADATA_KEY
+    }
+    return Document(page_content=doc.page_content, metadata=metadata, id=doc.id)
+
+
+async def adiversify(
+    rankings: Sequence[Sequence[Document]],
+    queries: Sequence[str],
+    embeddings: Embeddings,
+    *,
+    k: int,
+    lambda_mult: float = 0.5,
+) -> list[list[Document]]:
+    """Re-rank each query's over-fetched candidates with MMR, keeping `k` per query.
+
+    Candidate vectors returned by the store under `EMBEDDING_METADATA_KEY` are
+    reused, and the key is removed from the returned documents. All other
+    candidates, deduplicated across queries, are embedded in one batch; with the
+    embedding cache enabled, these are usually hits from indexing time.
+
+    Args:
+        rankings (Sequence[Sequence[Document]]): The candidates of each query.
+        queries (Sequence[str]): The query of each ranking.
+        embeddings (Embeddings): The encoder used for queries and missing vectors.
+        k (int): The number of documents kept per query.
+        lambda_mult (float): 1 ranks purely by relevance, 0 purely by diversity.
+
+    Returns:
+        list[list[Document]]: The re-ranked documents of each query.
+    """
+    vectors: dict[str, Sequence[float]] = {}
+    missing: dict[str, str] = {}
+    for ranking in rankings:
+        for doc in ranking:
+            key = document_key(doc)
+            vector: Optional[Sequence[float]] = doc.metadata.get(EMBEDDING_METADATA_KEY)
+            if vector is not None:
+                vectors[key] = vector
+            elif key not in vectors:
+                missing[key] = doc.page_content
+    missing = {key: text for key, text in missing.items() if key not in vectors}
+    query_vectors, computed = await asyncio.gather(
+        asyncio.gather(*(embeddings.aembed_query(query) for query in queries)),
+        embeddings.aembed_documents(list(missing.values()))
+        if missing
+        else asyncio.sleep(0, result=[]),
+    )
+    vectors.update(zip(missing, computed))
+
+    reranked = []
+    for ranking, query_vector in zip(rankings, query_vectors):
+        picked = maximal_marginal_relevance(
+            query_vector,
+            [vectors[document_key(doc)] for doc in ranking],
+            k=k,
+            lambda_mult=lambda_mult,
+        )
+        reranked.append([_without_embedding(ranking[i]) for i in picked])
+    return reranked
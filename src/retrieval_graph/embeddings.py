@@ -0,0 +1,522 @@
+"""Embedding wrappers layered on top of the encoders built by `make_text_encoder`.
+
+Classes:
+    CachedEmbeddings: Caches vectors by (model, sha256(text)) in memory and on disk.
+    TimedEmbeddings: Records the latency and volume of every embedding call.
+    BatchingEmbeddings: Coalesces concurrent query embeddings into batched calls.
+
+Functions:
+    embed_queries: Embed several queries in one request where the provider allows it.
+    aembed_queries: The asynchronous variant of `embed_queries`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from retrieval_graph.metrics import METRICS
+
+
+def content_hash(text: str) -> str:
+    """Return the hex sha256 digest of a text, used as its cache key."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def embed_queries(encoder: Embeddings, texts: list[str]) -> list[list[float]]:
+    """Embed several queries, as queries rather than documents.
+
+    Providers such as Cohere embed queries differently from documents, so a batch of
+    queries must not be sent through `embed_documents`. Encoders that define their
+    own `embed_queries` method are used as is; Cohere gets a single request with the
+    query input type, and OpenAI, which embeds both alike, a document request. Any
+    other encoder embeds each query with its `embed_query` method.
+
+    Args:
+        encoder (Embeddings): The encoder to embed with.
+        texts (list[str]): The queries to embed.
+
+    Returns:
+        list[list[float]]: One vector per query.
+    """
+    method = getattr(encoder, "embed_queries", None)
+    if method is not None:
+        return method(texts)
+    match type(encoder).__name__:
+        case "CohereEmbeddings":
+            return encoder.embed(texts, input_type="search_query")  # type: ignore[attr-defined]
+        case "OpenAIEmbeddings":
+            return encoder.embed_documents(texts)
+        case _:
+            return [encoder.embed_query(text) for text in texts]
+
+
+async def aembed_queries(encoder: Embeddings, texts: list[str]) -> list[list[float]]:
+    """Asynchronously embed several queries, as queries rather than documents.
+
+    See `embed_queries` for how each encoder is called.
+    """
+    method = getattr(encoder, "aembed_queries", None)
+    if method is not None:
+        return await method(texts)
+    match type(encoder).__name__:
+        case "CohereEmbeddings":
+            return await encoder.aembed(texts, input_type="search_query")  # type: ignore[attr-defined]
+        case "OpenAIEmbeddings":
+            return await encoder.aembed_documents(texts)
+        case _:
+            return list(
+                await asyncio.gather(*(encoder.aembed_query(text) for text in texts))
+            )
+
+
+class TimedEmbeddings(Embeddings):
+    """Embeddings that record each call in `METRICS`, labelled by model.
+
+    `make_text_encoder` wraps every encoder in this class, whether or not metrics
+    are enabled yet; while they are disabled, recording is a no-op.
+    """
+
+    def __init__(self, underlying: Embeddings, model: str) -> None:
+        """Initialize the wrapper.
+
+        Args:
+            underlying (Embeddings): The encoder being timed.
+            model (str): The fully specified model name, used as a label.
+        """
+        self.underlying = underlying
+        self.model = model
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embed documents, recording the call."""
+        METRICS.increment("embedded_texts_total", len(texts), model=self.model)
+        with METRICS.timer("embedding_seconds", model=self.model, kind="documents"):
+            return self.underlying.embed_documents(texts)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Asynchronously embed documents, recording the call."""
+        METRICS.increment("embedded_texts_total", len(texts), model=self.model)
+        with METRICS.timer("embedding_seconds", model=self.model, kind="documents"):
+            return await self.underlying.aembed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        """Embed a query, recording the call."""
+        METRICS.increment("embedded_texts_total", model=self.model)
+        with METRICS.timer("embedding_seconds", model=self.model, kind="query"):
+            return self.underlying.embed_query(text)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        """Asynchronously embed a query, recording the call."""
+        METRICS.increment("embedded_texts_total", model=self.model)
+        with METRICS.timer("embedding_seconds", model=self.model, kind="query"):
+            return await self.underlying.aembed_query(text)
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        """Embed several queries, recording the call."""
+        METRICS.increment("embedded_texts_total", len(texts), model=self.model)
+        with METRICS.timer("embedding_seconds", model=self.model, kind="query"):
+            return embed_queries(self.underlying, texts)
+
+    async def aembed_queries(self, texts: list[str]) -> list[list[float]]:
+        """Asynchronously embed several queries, recording the call."""
+        METRICS.increment("embedded_texts_total", len(texts), model=self.model)
+        with METRICS.timer("embedding_seconds", model=self.model, kind="query"):
+            return await aembed_queries(self.underlying, texts)
+
+
+@dataclass
+class _Batch:
+    """Queries waiting to be embedded together, and the outcome they share."""
+
+    texts: dict[str, int] = field(default_factory=dict)
+    full: threading.Event = field(default_factory=threading.Event)
+    done: threading.Event = field(default_factory=threading.Event)
+    vectors: list[list[float]] = field(default_factory=list)
+    error: Optional[BaseException] = None
+    future: Optional[asyncio.Future[list[list[float]]]] = None
+    timer: Optional[asyncio.TimerHandle] = None
+
+
+class BatchingEmbeddings(Embeddings):
+    """Embeddings that coalesce concurrent queries into one batched request.
+
+    A query waits up to `max_wait` seconds for others to arrive, then all of them
+    are embedded together through `embed_queries`, so that asymmetric encoders still
+    return query vectors, and each caller gets its own vector back. A batch is sent early once it holds
+    `max_batch_size` distinct texts. Concurrent runs therefore share one provider
+    request instead of each spending one against the provider's rate limit.
+
+    Asynchronous queries are batched per event loop, and synchronous ones across
+    threads. If the batched request fails, every query in it raises the error.
+    Document embeddings are passed through unchanged, since they are batched already.
+    """
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        *,
+        max_batch_size: int = 64,
+        max_wait: float = 0.005,
+    ) -> None:
+        """Initialize the wrapper.
+
+        Args:
+            underlying (Embeddings): The encoder that embeds each batch.
+            max_batch_size (int): The most distinct texts sent in one request.
+            max_wait (float): Seconds a query waits for others to join its batch.
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1.")
+        self.underlying = underlying
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._pending: Optional[_Batch] = None
+        self._pending_async: dict[asyncio.AbstractEventLoop, _Batch] = {}
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embed documents with the underlying encoder."""
+        return self.underlying.embed_documents(texts)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Asynchronously embed documents with the underlying encoder."""
+        return await self.underlying.aembed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        """Embed a query in a batch with the queries of other threads."""
+        with self._lock:
+            batch = self._pending
+            leader = batch is None
+            if batch is None:
+                batch = self._pending = _Batch()
+            index = batch.texts.setdefault(text, len(batch.texts))
+            if len(batch.texts) >= self.max_batch_size:
+                self._pending = None
+                batch.full.set()
+        if leader:
+            # The first caller waits for the batch to fill, then embeds it for all.
+            batch.full.wait(self.max_wait)
+            with self._lock:
+                if self._pending is batch:
+                    self._pending = None
+            try:
+                batch.vectors = embed_queries(self.underlying, list(batch.texts))
+            except BaseException as error:
+                batch.error = error
+            finally:
+                batch.done.set()
+        else:
+            batch.done.wait()
+        if batch.error is not None:
+            raise batch.error
+        return batch.vectors[index]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        """Asynchronously embed a query in a batch with concurrent queries."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            batch = self._pending_async.get(loop)
+            if batch is None:
+                batch = self._pending_async[loop] = _Batch(future=loop.create_future())
+                batch.timer = loop.call_later(self.max_wait, self._flush, loop, batch)
+            index = batch.texts.setdefault(text, len(batch.texts))
+            full = len(batch.texts) >= self.max_batch_size
+        if full:
+            self._flush(loop, batch)
+        assert batch.future is not None
+        # Shielded, so that one cancelled caller does not fail the whole batch.
+        vectors = await asyncio.shield(batch.future)
+        return vectors[index]
+
+    def _flush(self, loop: asyncio.AbstractEventLoop, batch: _Batch) -> None:
+        # Runs on `loop`, either from the batch timer or when the batch is full.
+        with self._lock:
+            if self._pending_async.get(loop) is not batch:
+                return
+            del self._pending_async[loop]
+        if batch.timer is not None:
+            batch.timer.cancel()
+        task = loop.create_task(self._embed_batch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _embed_batch(self, batch: _Batch) -> None:
+        future = batch.future
+        assert future is not None
+        try:
+            future.set_result(await aembed_queries(self.underlying, list(batch.texts)))
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as error:
+            future.set_exception(error)
+            if not isinstance(error, Exception):
+                raise
+        finally:
+            # Whatever happened, no caller may be left waiting on the batch.
+            if not future.done():
+                future.cancel()
+
+
+# Providers such as Cohere embed queries differently from documents, so the two
+# are cached under separate keys: queries get a prefix, documents keep the bare
+# hash that existing cache files were written with.
+_DOCUMENT = ""
+_QUERY = "q:"
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings that are only computed once per distinct text.
+
+    Vectors are stored as float32 and keyed by the model name and the sha256 of
+    the text. Queries are embedded with the underlying encoder's query method and
+    cached apart from documents. Lookups go to a bounded in-memory LRU tier first, then to an
+    optional SQLite file that persists across processes and restarts. Both tiers
+    evict their least recently used vectors once they exceed their byte caps.
+
+    Because the cache is keyed by content, the same document re-indexed through the
+    index graph, and a question that was asked before, never hit the provider again.
+    """
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        model: str,
+        *,
+        path: Optional[str] = None,
+        max_memory_bytes: int = 64 * 1024 * 1024,
+        max_disk_bytes: int = 1024 * 1024 * 1024,
+    ) -> None:
+        """Initialize the cache.
+
+        Args:
+            underlying (Embeddings): The encoder used on cache misses.
+            model (str): The fully specified model name, part of every cache key.
+            path (Optional[str]): The SQLite file backing the disk tier. The disk
+                tier is disabled when no path is given.
+            max_memory_bytes (int): The byte cap of the in-memory tier.
+            max_disk_bytes (int): The byte cap of the disk tier.
+        """
+        self.underlying = underlying
+        self.model = model
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._lock = threading.Lock()
+        self._memory: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._memory_bytes = 0
+        self._db: Optional[sqlite3.Connection] = None
+        self._disk_bytes = 0
+        if path:
+            self._db = self._open(path)
+
+    ## Embeddings interface
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embed documents, only calling the underlying encoder for unseen texts."""
+        return self.embed_documents_array(texts).tolist()
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Asynchronously embed documents, only encoding unseen texts."""
+        return (await self.aembed_documents_array(texts)).tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        """Embed a query, reusing the vector of an identical earlier query."""
+        keys, found, missing = self._lookup([text], kind=_QUERY)
+        if missing:
+            computed = [self.underlying.embed_query(text)]
+            found.update(self._store(missing, computed))
+        return found[keys[0]].tolist()
+
+    async def aembed_query(self, text: str) -> list[float]:
+        """Asynchronously embed a query, reusing identical earlier queries."""
+        keys, found, missing = await asyncio.to_thread(
+            self._lookup, [text], kind=_QUERY
+        )
+        if missing:
+            computed = [await self.underlying.aembed_query(text)]
+            found.update(await asyncio.to_thread(self._store, missing, computed))
+        return found[keys[0]].tolist()
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        """Embed several queries, only calling the underlying encoder for unseen ones."""
+        keys, found, missing = self._lookup(texts, kind=_QUERY)
+        if missing:
+            computed = embed_queries(self.underlying, list(missing.values()))
+            found.update(self._store(missing, computed))
+        return [found[key].tolist() for key in keys]
+
+    async def aembed_queries(self, texts: list[str]) -> list[list[float]]:
+        """Asynchronously embed several queries, only encoding unseen ones."""
+        keys, found, missing = await asyncio.to_thread(self._lookup, texts, kind=_QUERY)
+        if missing:
+            computed = await aembed_queries(self.underlying, list(missing.values()))
+            found.update(await asyncio.to_thread(self._store, missing, computed))
+        return [found[key].tolist() for key in keys]
+
+    ## Compact array variants
+
+    def embed_documents_array(self, texts: Sequence[str]) -> np.ndarray:
+        """Embed documents into a `(len(texts), dim)` float32 array."""
+        keys, found, missing = self._lookup(texts)
+        if missing:
+            computed = self.underlying.embed_documents(list(missing.values()))
+            found.update(self._store(missing, computed))
+        return self._stack(keys, found)
+
+    async def aembed_documents_array(self, texts: Sequence[str]) -> np.ndarray:
+        """Asynchronously embed documents into a `(len(texts), dim)` float32 array."""
+        keys, found, missing = await asyncio.to_thread(self._lookup, texts)
+        if missing:
+            computed = await self.underlying.aembed_documents(list(missing.values()))
+            found.update(await asyncio.to_thread(self._store, missing, computed))
+        return self._stack(keys, found)
+
+    def close(self) -> None:
+        """Close the disk tier."""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    ## Internals
+
+    def _open(self, path: str) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL,"
+            " accessed REAL NOT NULL, PRIMARY KEY (model, hash))"
+        )
+        db.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_accessed ON embeddings (accessed)"
+        )
+        db.commit()
+        (self._disk_bytes,) = db.execute(
+            "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        ).fetchone()
+        return db
+
+    def _lookup(
+        self, texts: Sequence[str], *, kind: str = _DOCUMENT
+    ) -> tuple[list[str], dict[str, np.ndarray], dict[str, str]]:
+        """Split texts into cached vectors and the distinct texts still to embed."""
+        keys = [kind + content_hash(text) for text in texts]
+        found: dict[str, np.ndarray] = {}
+        missing: dict[str, str] = {}
+        with self._lock:
+            for key, text in zip(keys, texts):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+                else:
+                    missing[key] = text
+            if missing and self._db is not None:
+                for key, vector in self._read_disk(list(missing)).items():
+                    found[key] = vector
+                    del missing[key]
+                    self._remember(key, vector)
+        return keys, found, missing
+
+    def _store(
+        self, missing: dict[str, str], computed: list[list[float]]
+    ) -> dict[str, np.ndarray]:
+        """Add freshly computed vectors to both tiers."""
+        vectors = {
+            key: np.asarray(vector, dtype=np.float32)
+            for key, vector in zip(missing, computed)
+        }
+        with self._lock:
+            for key, vector in vectors.items():
+                self._remember(key, vector)
+            if self._db is not None:
+                self._write_disk(vectors)
+        return vectors
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        # Must be called with the lock held.
+        if key in self._memory:
+            return
+        self._memory[key] = vector
+        self._memory_bytes += vector.nbytes
+        while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes
+
+    def _read_disk(self, keys: list[str]) -> dict[str, np.ndarray]:
+        # Must be called with the lock held.
+        assert self._db is not None
+        found: dict[str, np.ndarray] = {}
+        # Stay well below SQLite's limit on the number of bound parameters.
+        for start in range(0, len(keys), 500):
+            chunk = keys[start : start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self._db.execute(
+                f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                (self.model, *chunk),
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+        if found:
+            now = time.time()
+            self._db.executemany(
+                "UPDATE embeddings SET accessed = ? WHERE model = ? AND hash = ?",
+                [(now, self.model, key) for key in found],
+            )
+            self._db.commit()
+        return found
+
+    def _write_disk(self, vectors: dict[str, np.ndarray]) -> None:
+        # Must be called with the lock held.
+        assert self._db is not None
+        now = time.time()
+        self._db.executemany(
+            "INSERT OR REPLACE INTO embeddings (model, hash, vector, accessed) VALUES (?, ?, ?, ?)",
+            [
+                (self.model, key, vector.tobytes(), now)
+                for key, vector in vectors.items()
+            ],
+        )
+        self._disk_bytes += sum(vector.nbytes for vector in vectors.values())
+        if self._disk_bytes > self.max_disk_bytes:
+            self._evict_disk()
+        self._db.commit()
+
+    def _evict_disk(self) -> None:
+        # Must be called with the lock held. Drop the least recently used rows until
+        # the file is back under 90% of its cap, so we do not evict on every write.
+        assert self._db is not None
+        target = int(self.max_disk_bytes * 0.9)
+        (self._disk_bytes,) = self._db.execute(
+            "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        ).fetchone()
+        while self._disk_bytes > target:
+            rows = self._db.execute(
+                "SELECT rowid, LENGTH(vector) FROM embeddings ORDER BY accessed LIMIT 256"
+            ).fetchall()
+            if not rows:
+                break
+            self._db.executemany(
+                "DELETE FROM embeddings WHERE rowid = ?",
+                [(rowid,) for rowid, _ in rows],
+            )
+            self._disk_bytes -= sum(size for _, size in rows)
+
+    @staticmethod
+    def _stack(keys: list[str], found: dict[str, np.ndarray]) -> np.ndarray:
+        if not keys:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.stack([found[key] for key in keys])
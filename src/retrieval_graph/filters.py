@@ -0,0 +1,107 @@
+"""Per-user search filters, compiled once into immutable plans.
+
+Every retriever must restrict its searches to the configured user's documents.
+Each provider expresses that tenant restriction differently, and it has to be
+combined with whatever filters the caller put in `search_kwargs`. A `FilterPlan`
+does this combination once per (provider, user, search kwargs) and is cached, so
+building a retriever never touches, let alone mutates, the caller's configuration.
+
+Classes:
+    FilterPlan: The search kwargs of one provider and user, frozen.
+
+Functions:
+    compile_filter_plan: Build, or fetch the cached, plan for a configuration.
+"""
+
+from __future__ import annotations
+
+import copy
+import json
+from dataclasses import dataclass
+from typing import Any, Mapping
+
+from retrieval_graph.registry import Registry
+
+ELASTIC_USER_ID_FIELD = "metadata.user_id.keyword"
+"""The field Elasticsearch matches user ids on, in searches and deletes alike.
+
+Metadata is mapped dynamically, so ``metadata.user_id`` is an analyzed text field
+that a term query only matches for ids that survive analysis unchanged; its keyword
+subfield holds the exact id.
+"""
+
+
+@dataclass(frozen=True)
+class FilterPlan:
+    """The search kwargs of one provider and user, with the tenant filter applied."""
+
+    provider: str
+    user_id: str
+    frozen_kwargs: str
+    """The compiled search kwargs, serialized so that the plan cannot be changed."""
+
+    def search_kwargs(self) -> dict[str, Any]:
+        """Return a fresh copy of the compiled search kwargs for a retriever."""
+        return json.loads(self.frozen_kwargs)
+
+
+FILTER_PLANS: Registry[FilterPlan] = Registry(maxsize=1024)
+"""Process-wide cache of compiled filter plans."""
+
+
+def _tenant_kwargs(
+    provider: str, user_id: str, search_kwargs: Mapping[str, Any]
+) -> dict[str, Any]:
+    kwargs = copy.deepcopy(dict(search_kwargs))
+    match provider:
+        case "elastic" | "elastic-local":
+            tenant = {"term": {ELASTIC_USER_ID_FIELD: user_id}}
+            clauses = kwargs.get("filter") or []
+            if isinstance(clauses, Mapping):
+                clauses = [clauses]
+            kwargs["filter"] = [clause for clause in clauses if clause != tenant]
+            kwargs["filter"].append(tenant)
+        case "mongodb":
+            kwargs["pre_filter"] = {
+                **(kwargs.get("pre_filter") or {}),
+                "user_id": {"$eq": user_id},
+            }
+        case "pinecone" | "local":
+            kwargs["filter"] = {**(kwargs.get("filter") or {}), "user_id": user_id}
+        case _:
+            raise ValueError(f"Unsupported retriever provider: {provider}")
+    return kwargs
+
+
+def compile_filter_plan(
+    provider: str, user_id: str, search_kwargs: Mapping[str, Any]
+) -> FilterPlan:
+    """Return the filter plan for a provider, user and caller-supplied search kwargs.
+
+    The tenant filter always wins: a caller-supplied ``user_id`` condition is
+    replaced rather than combined, and repeated compilation never duplicates it.
+
+    Args:
+        provider (str): The retriever provider, e.g. ``"elastic"``.
+        user_id (str): The user whose documents may be searched.
+        search_kwargs (Mapping[str, Any]): The caller's search kwargs; not modified.
+
+    Returns:
+        FilterPlan: The cached plan.
+
+    Examples:
+        >>> plan = compile_filter_plan("pinecone", "u1", {"k": 2, "filter": {"lang": "en"}})
+        >>> plan.search_kwargs()
+        {'k': 2, 'filter': {'lang': 'en', 'user_id': 'u1'}}
+    """
+    spec = json.dumps(search_kwargs, sort_keys=True, default=str)
+    return FILTER_PLANS.get_or_create(
+        (provider, user_id, spec),
+        lambda: FilterPlan(
+            provider=provider,
+            user_id=user_id,
+            frozen_kwargs=json.dumps(
+                _tenant_kwargs(provider, user_id, search_kwargs), default=str
+            ),
+        ),
+    )
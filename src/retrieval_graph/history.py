@@ -0,0 +1,76 @@
+"""Token-bounded windows over the conversation history.
+
+The retrieval graph only sends the most recent messages to its models once the
+history outgrows `history_token_budget`. The window start is stored in the state
+and only moves when the window overflows. Each time it moves, it leaves room for
+several turns, so the prompt prefix stays stable in between and any rolling
+summary is only refreshed now and then.
+
+Functions:
+    message_tokens: Estimate the number of tokens of a message.
+    history_tokens: Estimate the number of tokens of a list of messages.
+    window_start: Find where a token-bounded window of recent messages starts.
+"""
+
+from typing import Callable, Sequence
+
+from langchain_core.messages import AnyMessage, HumanMessage
+
+from retrieval_graph.utils import approximate_token_count, get_message_text
+
+# Role markers and separators the providers add around every message.
+_MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def message_tokens(message: AnyMessage) -> int:
+    """Estimate the number of tokens a message adds to a prompt."""
+    return approximate_token_count(get_message_text(message)) + _MESSAGE_OVERHEAD_TOKENS
+
+
+def history_tokens(
+    messages: Sequence[AnyMessage],
+    count_tokens: Callable[[AnyMessage], int] = message_tokens,
+) -> int:
+    """Estimate the number of tokens of a list of messages."""
+    return sum(count_tokens(message) for message in messages)
+
+
+def window_start(
+    messages: Sequence[AnyMessage],
+    token_budget: int,
+    *,
+    start: int = 0,
+    count_tokens: Callable[[AnyMessage], int] = message_tokens,
+) -> int:
+    """Return the index of the oldest message of the window that fits the budget.
+
+    The window always contains the last message, even if it alone exceeds the
+    budget. It is moved forward to begin with a human message, since providers
+    expect a conversation to open with the user.
+
+    Args:
+        messages (Sequence[AnyMessage]): The whole conversation.
+        token_budget (int): The maximum number of tokens in the window.
+        start (int): Messages before this index are never part of the window.
+        count_tokens (Callable[[AnyMessage], int]): Estimates a message's tokens.
+
+    Returns:
+        int: The index of the first message of the window.
+
+    Examples:
+        >>> from langchain_core.messages import AIMessage, HumanMessage
+        >>> messages = [HumanMessage("a"), AIMessage("b"), HumanMessage("c")]
+        >>> window_start(messages, 2, count_tokens=lambda message: 1)
+        2
+    """
+    index = len(messages)
+    total = 0
+    while index > start:
+        tokens = count_tokens(messages[index - 1])
+        if total + tokens > token_budget and index < len(messages):
+            break
+        total += tokens
+        index -= 1
+    while index < len(messages) - 1 and not isinstance(messages[index], HumanMessage):
+        index += 1
+    return index
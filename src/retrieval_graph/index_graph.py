@@ -1,64 +1,304 @@
-"""This "graph" simply exposes an endpoint for a user to upload docs to be indexed."""
+"""This "graph" exposes an endpoint for a user to upload, replace and delete indexed docs."""
 
-from typing import Optional, Sequence
+import asyncio
+import logging
+import uuid
+from typing import Any, Optional
 
 from langchain_core.documents import Document
 from langchain_core.runnables import RunnableConfig
+from langchain_core.vectorstores import VectorStoreRetriever
 from langgraph.graph import StateGraph
 
-from retrieval_graph import retrieval
+from retrieval_graph import chunking, indexing, retrieval
+from retrieval_graph.answer_cache import ANSWER_CACHE
 from retrieval_graph.configuration import IndexConfiguration
-from retrieval_graph.state import IndexState
+from retrieval_graph.ledger import RecordLedger, upsert_id
+from retrieval_graph.metrics import METRICS
+from retrieval_graph.state import IndexState, IndexSummary, reduce_docs
 
+logger = logging.getLogger(__name__)
 
-def ensure_docs_have_user_id(
-    docs: Sequence[Document], config: RunnableConfig
-) -> list[Document]:
-    """Ensure that all documents have a user_id in their metadata.
 
-        docs (Sequence[Document]): A sequence of Document objects to process.
-        config (RunnableConfig): A configuration object containing the user_id.
+async def _delete_stale(
+    retriever: VectorStoreRetriever,
+    ledger: RecordLedger,
+    configuration: IndexConfiguration,
+    run_id: str,
+    sources: set[str],
+) -> int:
+    """Delete the user's documents that this run superseded, per `index_cleanup`."""
+    stale = await asyncio.to_thread(
+        ledger.stale,
+        configuration.user_id,
+        run_id,
+        sources if configuration.index_cleanup == "incremental" else None,
+    )
+    if stale:
+        await retrieval.adelete_user_documents(
+            retriever.vectorstore, configuration.user_id, ids=stale
+        )
+        await asyncio.to_thread(ledger.forget, configuration.user_id, stale)
+    return len(stale)
+
+
+async def delete_docs(
+    state: IndexState, *, config: Optional[RunnableConfig] = None
+) -> dict[str, Any]:
+    """Delete the documents requested in the state from the user's index.
+
+    Documents listed in `delete_ids` are deleted together with their chunks, or all
+    of the user's documents if `delete_all` is set, through the provider's bulk
+    delete API. Either way only the configured user's documents are touched.
+
+    Args:
+        state (IndexState): The current state containing the deletion requests.
+        config (Optional[RunnableConfig]): Configuration for the deletion.
 
     Returns:
-        list[Document]: A new list of Document objects with updated metadata.
+        dict[str, Any]: The state update, clearing the requests and starting this
+        run's IndexSummary with the number of documents removed.
     """
-    user_id = config["configurable"]["user_id"]
-    return [
-        Document(
-            page_content=doc.page_content, metadata={**doc.metadata, "user_id": user_id}
+    if not config:
+        raise ValueError("Configuration required to run delete_docs.")
+    configuration = IndexConfiguration.from_runnable_config(config)
+    user_id = configuration.user_id
+    removed = 0
+    # Ids may be content-derived ids or the caller's own ids of upserted documents.
+    ids = [*state.delete_ids, *(upsert_id(user_id, id_) for id_ in state.delete_ids)]
+    if state.delete_ids or state.delete_all:
+        known_ids = (
+            await asyncio.to_thread(
+                _indexed_ids, configuration.record_ledger_path, user_id
+            )
+            if state.delete_all and configuration.record_ledger_path
+            else None
         )
-        for doc in docs
-    ]
+        async with retrieval.amake_retriever(config) as retriever:
+            with METRICS.timer(
+                "store_delete_seconds", provider=configuration.retriever_provider
+            ):
+                removed = await retrieval.adelete_user_documents(
+                    retriever.vectorstore,
+                    user_id,
+                    ids=ids,
+                    parent_ids=ids,
+                    everything=state.delete_all,
+                    known_ids=known_ids,
+                )
+        if configuration.record_ledger_path:
+            await asyncio.to_thread(
+                _forget_deleted,
+                configuration.record_ledger_path,
+                user_id,
+                None if state.delete_all else ids,
+            )
+        if removed:
+            ANSWER_CACHE.invalidate_user(user_id)
+    return {
+        "delete_ids": [],
+        "delete_all": False,
+        "summary": IndexSummary(removed=removed),
+    }
+
+
+def _indexed_ids(path: str, user_id: str) -> list[str]:
+    """List the ids of all of the user's documents in the ledger."""
+    ledger = RecordLedger(path)
+    try:
+        # No document was seen by a fresh run id, so every one of them is stale.
+        return ledger.stale(user_id, str(uuid.uuid4()))
+    finally:
+        ledger.close()
+
+
+def _forget_deleted(path: str, user_id: str, ids: Optional[list[str]]) -> None:
+    """Remove deleted documents and their chunks from the ledger, or all if no ids."""
+    if ids is None:
+        ids = _indexed_ids(path, user_id)
+    ledger = RecordLedger(path)
+    try:
+        ledger.forget(user_id, ids, with_chunks=True)
+    finally:
+        ledger.close()
 
 
 async def index_docs(
     state: IndexState, *, config: Optional[RunnableConfig] = None
-) -> dict[str, str]:
+) -> dict[str, Any]:
     """Asynchronously index documents in the given state using the configured retriever.
 
-    This function takes the documents from the state, ensures they have a user ID,
-    adds them to the retriever's index, and then signals for the documents to be
-    deleted from the state.
+    This function streams the documents from the state in batches, splits documents
+    longer than `chunk_size` tokens into chunks, ensures they have a user ID, adds
+    them to the retriever's index with bounded concurrency, and then signals for the
+    documents to be deleted from the state.
+
+    Document ids are derived from the user, source and content. With a record ledger
+    configured, documents that are already indexed are skipped, and stale documents
+    are deleted afterwards according to `index_cleanup`. Without any documents in
+    the state, nothing is indexed or cleaned up.
 
     Args:
         state (IndexState): The current state containing documents and retriever.
-        config (Optional[RunnableConfig]): Configuration for the indexing process.r
+        config (Optional[RunnableConfig]): Configuration for the indexing process.
+
+    Returns:
+        dict[str, Any]: The state update, clearing the docs and reporting an IndexSummary.
     """
     if not config:
         raise ValueError("Configuration required to run index_docs.")
-    with retrieval.make_retriever(config) as retriever:
-        stamped_docs = ensure_docs_have_user_id(state.docs, config)
+    if not state.docs:
+        # A request that only deletes must not reach the cleanup below, which
+        # would take every document of the user for stale.
+        return {
+            "docs": "delete",
+            "upsert": False,
+            "summary": state.summary or IndexSummary(),
+        }
+    configuration = IndexConfiguration.from_runnable_config(config)
+    user_id = configuration.user_id
+    run_id = str(uuid.uuid4())
+    ledger = (
+        await asyncio.to_thread(RecordLedger, configuration.record_ledger_path)
+        if configuration.record_ledger_path
+        else None
+    )
+    sources: set[str] = set()
+    skipped = 0
+    replaced = 0
+
+    async def prepare(batch: list[Document]) -> list[Document]:
+        nonlocal skipped
+        upserted = (
+            [
+                upsert_id(user_id, str(doc.metadata["id"]))
+                for doc in batch
+                if doc.metadata.get("id")
+            ]
+            if state.upsert
+            else []
+        )
+        stamped = await chunking.achunk_documents(
+            batch,
+            user_id,
+            chunk_size=configuration.chunk_size,
+            chunk_overlap=configuration.chunk_overlap,
+            keep_ids=state.upsert,
+        )
+        if ledger is None:
+            return stamped
+        # Documents without a source can only be unchanged or new, never outdated.
+        sources.update(
+            str(doc.metadata["source"]) for doc in stamped if doc.metadata.get("source")
+        )
+        replacing = set(upserted)
+        existing = await asyncio.to_thread(
+            ledger.touch_existing,
+            user_id,
+            [
+                doc.metadata["id"]
+                for doc in stamped
+                if doc.metadata.get("parent_id", doc.metadata["id"]) not in replacing
+            ],
+            run_id,
+        )
+        skipped += len(existing)
+        return [doc for doc in stamped if doc.metadata["id"] not in existing]
+
+    async def supersede(batch: list[Document]) -> None:
+        nonlocal replaced
+        # The new version is written first so a failed write keeps the old one; only
+        # then are the old chunks it did not overwrite deleted.
+        upserted = list(
+            {
+                doc.metadata.get("parent_id", doc.metadata["id"])
+                for doc in batch
+                if "external_id" in doc.metadata
+            }
+        )
+        if not upserted:
+            return
+        replaced += await retrieval.adelete_user_documents(
+            retriever.vectorstore,
+            user_id,
+            ids=upserted,
+            parent_ids=upserted,
+            keep_ids=[doc.metadata["id"] for doc in batch],
+        )
+        if ledger is not None:
+            # `record` re-records the chunks just written.
+            await asyncio.to_thread(ledger.forget, user_id, upserted, with_chunks=True)
+
+    async def record(batch: list[Document]) -> None:
+        assert ledger is not None
+        await asyncio.to_thread(
+            ledger.record,
+            user_id,
+            [
+                (
+                    doc.metadata["id"],
+                    str(doc.metadata.get("source", "")),
+                    doc.metadata.get("parent_id", doc.metadata["id"]),
+                )
+                for doc in batch
+            ],
+            run_id,
+        )
 
-        await retriever.aadd_documents(stamped_docs)
-    return {"docs": "delete"}
+    # The first write to a channel bypasses its reducer, so raw graph input (a
+    # string, a path, ...) can reach us here unnormalized.
+    docs = reduce_docs(None, state.docs)
+    try:
+        async with retrieval.amake_retriever(config) as retriever:
+            summary: IndexSummary = await indexing.index_in_batches(
+                retriever,
+                docs,
+                batch_size=configuration.index_batch_size,
+                max_in_flight=configuration.index_max_concurrency,
+                max_retries=configuration.index_max_retries,
+                prepare=prepare,
+                after_write=supersede if state.upsert else None,
+                on_indexed=record if ledger is not None else None,
+                metric_labels={"provider": configuration.retriever_provider},
+            )
+            summary.skipped = skipped
+            summary.replaced = replaced
+            if state.summary is not None:
+                summary.removed = state.summary.removed
+            if ledger is not None and configuration.index_cleanup:
+                if summary.failed:
+                    # Documents of failed batches look stale; deleting their previous
+                    # versions would lose data, so wait for a clean run.
+                    logger.warning(
+                        "Skipping %s cleanup because %d documents failed to index.",
+                        configuration.index_cleanup,
+                        summary.failed,
+                    )
+                else:
+                    with METRICS.timer(
+                        "store_delete_seconds",
+                        provider=configuration.retriever_provider,
+                    ):
+                        summary.deleted = await _delete_stale(
+                            retriever, ledger, configuration, run_id, sources
+                        )
+    finally:
+        if ledger is not None:
+            ledger.close()
+    if summary.indexed or summary.deleted or summary.replaced:
+        # Answers cached before this upload may now be incomplete or outdated.
+        ANSWER_CACHE.invalidate_user(user_id)
+    return {"docs": "delete", "upsert": False, "summary": summary}
 
 
 # Define a new graph
 
 
 builder = StateGraph(IndexState, config_schema=IndexConfiguration)
+builder.add_node(delete_docs)
 builder.add_node(index_docs)
-builder.add_edge("__start__", "index_docs")
+builder.add_edge("__start__", "delete_docs")
+builder.add_edge("delete_docs", "index_docs")
 # Finally, we compile it!
 # This compiles it into a graph you can invoke and deploy.
 graph = builder.compile()
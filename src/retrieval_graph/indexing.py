@@ -0,0 +1,147 @@
+"""Batched, bounded-concurrency writes of documents into a vector store.
+
+The index graph uses these helpers to split an upload into fixed-size batches and
+keep a limited number of them in flight. Each batch embeds its documents and then
+writes them, so with more than one batch in flight the embedding of one batch
+overlaps with the store write of the previous one.
+
+Functions:
+    index_in_batches: Write documents through a retriever in concurrent batches.
+"""
+
+import asyncio
+import logging
+import time
+from typing import (
+    Any,
+    AsyncIterable,
+    Awaitable,
+    Callable,
+    Iterable,
+    Mapping,
+    Optional,
+    Union,
+)
+
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStoreRetriever
+
+from retrieval_graph.metrics import METRICS
+from retrieval_graph.sources import aiter_batches
+from retrieval_graph.state import IndexSummary
+
+logger = logging.getLogger(__name__)
+
+
+async def index_in_batches(
+    retriever: VectorStoreRetriever,
+    docs: Union[Iterable[Document], AsyncIterable[Document]],
+    *,
+    batch_size: int,
+    max_in_flight: int,
+    max_retries: int,
+    prepare: Optional[Callable[[list[Document]], Awaitable[list[Document]]]] = None,
+    after_write: Optional[Callable[[list[Document]], Awaitable[None]]] = None,
+    on_indexed: Optional[Callable[[list[Document]], Awaitable[None]]] = None,
+    metric_labels: Optional[Mapping[str, str]] = None,
+) -> IndexSummary:
+    """Add documents to the retriever's vector store in concurrent batches.
+
+    At most `max_in_flight` batches are pending at any time; the next batch is only
+    pulled from `docs` once a slot frees up, which applies backpressure to the
+    source, so streaming sources are never read further ahead than needed. A batch
+    that fails is retried with exponential backoff and counted as failed once its
+    retries are exhausted, without aborting the other batches.
+
+    Args:
+        retriever (VectorStoreRetriever): The retriever whose store receives the documents.
+        docs (Union[Iterable[Document], AsyncIterable[Document]]): The documents to index.
+        batch_size (int): The number of documents embedded and written together.
+        max_in_flight (int): The maximum number of batches processed concurrently.
+        max_retries (int): How many times a failing batch is retried.
+        prepare (Optional[Callable[[list[Document]], Awaitable[list[Document]]]]):
+            Transforms each batch before it is written, e.g. to stamp metadata or
+            drop documents that are already indexed.
+        after_write (Optional[Callable[[list[Document]], Awaitable[None]]]): Called
+            with each batch once it was written, e.g. to delete the versions it
+            superseded. It is retried on its own, without writing the batch again,
+            and once its retries are exhausted the batch is counted as failed.
+        on_indexed (Optional[Callable[[list[Document]], Awaitable[None]]]): Called
+            with each batch once it has been written successfully.
+        metric_labels (Optional[Mapping[str, str]]): Labels for the store write
+            timings and document counters recorded in `METRICS`.
+
+    Documents that carry an ``id`` in their metadata are written under that id, so
+    writing the same document twice overwrites it instead of duplicating it.
+
+    Returns:
+        IndexSummary: Counts of indexed and failed documents and the elapsed time.
+    """
+    summary = IndexSummary()
+    labels = dict(metric_labels or {})
+    started = time.perf_counter()
+    slots = asyncio.Semaphore(max(1, max_in_flight))
+    pending: set[asyncio.Task[None]] = set()
+
+    async def retrying(
+        batch: list[Document], action: Callable[[], Awaitable[Any]]
+    ) -> bool:
+        # Runs one step of writing a batch; once its retries are exhausted, the batch
+        # is counted as failed.
+        for attempt in range(max_retries + 1):
+            try:
+                await action()
+                return True
+            except Exception:
+                if attempt == max_retries:
+                    logger.exception(
+                        "Giving up on a batch of %d documents.", len(batch)
+                    )
+                    summary.failed += len(batch)
+                    summary.failed_batches += 1
+                    METRICS.increment("documents_failed_total", len(batch), **labels)
+                    return False
+                METRICS.increment("store_write_retries_total", **labels)
+                await asyncio.sleep(0.5 * 2**attempt)
+        return False
+
+    async def write(batch: list[Document]) -> None:
+        try:
+            if prepare is not None:
+                batch = await prepare(batch)
+            if not batch:
+                return
+            ids = [doc.metadata.get("id") for doc in batch]
+            kwargs = {"ids": ids} if all(ids) else {}
+
+            async def add() -> None:
+                with METRICS.timer("store_write_seconds", **labels):
+                    await retriever.aadd_documents(batch, **kwargs)
+
+            if not await retrying(batch, add):
+                return
+            if after_write is not None and not await retrying(
+                batch, lambda: after_write(batch)
+            ):
+                return
+            summary.indexed += len(batch)
+            METRICS.increment("documents_indexed_total", len(batch), **labels)
+            if on_indexed is not None:
+                await on_indexed(batch)
+        finally:
+            slots.release()
+
+    try:
+        async for batch in aiter_batches(docs, batch_size):
+            await slots.acquire()
+            summary.batches += 1
+            task = asyncio.create_task(write(batch))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.gather(*pending)
+    finally:
+        for task in pending:
+            task.cancel()
+    summary.elapsed = time.perf_counter() - started
+    return summary
@@ -0,0 +1,198 @@
+"""Content-addressed document ids and a local ledger of what has been indexed.
+
+Document ids are derived from the owning user, the document's source and a hash
+of its content, so re-uploading the same corpus produces the same ids. The
+`RecordLedger` remembers which ids were written for each user, which lets the
+indexer skip unchanged documents and find stale ones after a sync.
+
+Classes:
+    RecordLedger: A SQLite record of the documents indexed for each user.
+
+Functions:
+    document_id: Derive the deterministic id of a document.
+    upsert_id: Derive the stored id of a document from the id its caller gave it.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Iterable, Optional
+
+from langchain_core.documents import Document
+
+_ID_NAMESPACE = uuid.UUID("5b3f0f9e-9c8e-4a6b-9c55-1f1f3c1d2b7a")
+_UPSERT_NAMESPACE = uuid.UUID("9a2e6c47-3d1b-4f0e-8b7a-6c5d4e3f2a19")
+
+
+def document_id(user_id: str, doc: Document) -> str:
+    """Derive the deterministic id of a document.
+
+    Args:
+        user_id (str): The user that owns the document.
+        doc (Document): The document; its `source` metadata is part of the id.
+
+    Returns:
+        str: A UUID derived from (user_id, source, sha256(page_content)).
+    """
+    content_hash = hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest()
+    source = str(doc.metadata.get("source", ""))
+    return str(uuid.uuid5(_ID_NAMESPACE, f"{user_id}\0{source}\0{content_hash}"))
+
+
+def upsert_id(user_id: str, caller_id: str) -> str:
+    """Derive the stored id of a document from the id its caller gave it.
+
+    Elasticsearch and Pinecone ids are global to the index, so a caller's id is
+    namespaced by its user; two users upserting the same id never collide.
+
+    Args:
+        user_id (str): The user that owns the document.
+        caller_id (str): The id the caller gave the document.
+
+    Returns:
+        str: A UUID derived from (user_id, caller_id).
+    """
+    return str(uuid.uuid5(_UPSERT_NAMESPACE, f"{user_id}\0{caller_id}"))
+
+
+class RecordLedger:
+    """A SQLite record of the documents indexed for each user.
+
+    Every row maps a (user_id, doc_id) pair to the document's source, the id of the
+    document it is a chunk of (its own id if it was not split), and the id of the
+    indexing run that last saw it. Rows are only written once the document has
+    been stored, so a crashed run never marks unindexed documents as present.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Open (and create, if needed) the ledger at `path`."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            " user_id TEXT NOT NULL, doc_id TEXT NOT NULL, source TEXT NOT NULL,"
+            " run_id TEXT NOT NULL, updated_at REAL NOT NULL,"
+            " PRIMARY KEY (user_id, doc_id))"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(records)")}
+        if "parent_id" not in columns:
+            # Ledgers written before chunking have no parent ids; their rows can
+            # still be forgotten by their own ids.
+            self._db.execute(
+                "ALTER TABLE records ADD COLUMN parent_id TEXT NOT NULL DEFAULT ''"
+            )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS records_source ON records (user_id, source)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS records_parent ON records (user_id, parent_id)"
+        )
+        self._db.commit()
+
+    def touch_existing(
+        self, user_id: str, doc_ids: Iterable[str], run_id: str
+    ) -> set[str]:
+        """Mark the already-recorded ids as seen by `run_id` and return them."""
+        doc_ids = list(doc_ids)
+        existing: set[str] = set()
+        with self._lock:
+            for start in range(0, len(doc_ids), 500):
+                chunk = doc_ids[start : start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                existing.update(
+                    doc_id
+                    for (doc_id,) in self._db.execute(
+                        f"SELECT doc_id FROM records WHERE user_id = ? AND doc_id IN ({placeholders})",
+                        (user_id, *chunk),
+                    )
+                )
+            self._db.executemany(
+                "UPDATE records SET run_id = ? WHERE user_id = ? AND doc_id = ?",
+                [(run_id, user_id, doc_id) for doc_id in existing],
+            )
+            self._db.commit()
+        return existing
+
+    def record(
+        self, user_id: str, entries: Iterable[tuple[str, str, str]], run_id: str
+    ) -> None:
+        """Record (doc_id, source, parent_id) triples as indexed by `run_id`."""
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO records"
+                " (user_id, doc_id, source, parent_id, run_id, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (user_id, doc_id, source, parent_id, run_id, now)
+                    for doc_id, source, parent_id in entries
+                ],
+            )
+            self._db.commit()
+
+    def stale(
+        self, user_id: str, run_id: str, sources: Optional[Iterable[str]] = None
+    ) -> list[str]:
+        """Return the ids of the user that `run_id` did not see.
+
+        Args:
+            user_id (str): The user whose records to check.
+            run_id (str): The current indexing run.
+            sources (Optional[Iterable[str]]): Only consider records of these sources.
+                All of the user's records are considered when omitted.
+        """
+        with self._lock:
+            if sources is None:
+                rows = self._db.execute(
+                    "SELECT doc_id FROM records WHERE user_id = ? AND run_id != ?",
+                    (user_id, run_id),
+                ).fetchall()
+            else:
+                rows = []
+                sources = list(sources)
+                for start in range(0, len(sources), 500):
+                    chunk = sources[start : start + 500]
+                    placeholders = ",".join("?" * len(chunk))
+                    rows.extend(
+                        self._db.execute(
+                            "SELECT doc_id FROM records WHERE user_id = ? AND run_id != ?"
+                            f" AND source IN ({placeholders})",
+                            (user_id, run_id, *chunk),
+                        ).fetchall()
+                    )
+        return [doc_id for (doc_id,) in rows]
+
+    def forget(
+        self, user_id: str, doc_ids: Iterable[str], *, with_chunks: bool = False
+    ) -> None:
+        """Remove records, e.g. after their documents were deleted from the store.
+
+        Args:
+            user_id (str): The user whose records to remove.
+            doc_ids (Iterable[str]): The ids of the records to remove.
+            with_chunks (bool): Also remove the chunks of the given documents.
+        """
+        doc_ids = list(doc_ids)
+        with self._lock:
+            self._db.executemany(
+                "DELETE FROM records WHERE user_id = ? AND doc_id = ?",
+                [(user_id, doc_id) for doc_id in doc_ids],
+            )
+            if with_chunks:
+                self._db.executemany(
+                    "DELETE FROM records WHERE user_id = ? AND parent_id = ?",
+                    [(user_id, doc_id) for doc_id in doc_ids],
+                )
+            self._db.commit()
+
+    def close(self) -> None:
+        """Close the underlying database."""
+        with self._lock:
+            self._db.close()
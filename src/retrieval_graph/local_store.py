@@ -0,0 +1,393 @@
+"""An in-process vector store backed by memory-mapped NumPy matrices.
+
+This store needs no external service, which makes it suitable for development,
+CI and edge deployments. Each user's documents live in their own directory:
+
+- ``vectors.f32``: a row-major float32 matrix of unit-normalized embeddings,
+  only ever appended to, and memory-mapped for search.
+- ``records.jsonl``: one line per matrix row with the id, text and metadata.
+- ``deleted.jsonl``: the id and matrix row of each record removed since it was
+  written, so that re-adding a deleted id survives a reload.
+
+Search is a single matrix-vector product followed by `argpartition`, so a query
+costs O(n) without per-document Python work (unless extra metadata filters are
+given on top of the user filter).
+
+Classes:
+    LocalVectorStore: A VectorStore partitioned by the `user_id` metadata field.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import uuid
+from typing import Any, Iterable, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+
+class _Partition:
+    """The documents of a single user, loaded lazily from disk."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.dim = 0
+        self.vectors: Optional[np.ndarray] = None
+        self.records: list[dict[str, Any]] = []
+        self.active = np.zeros(0, dtype=bool)
+        self.rows: dict[str, int] = {}
+        self._load()
+
+    @property
+    def _vectors_file(self) -> str:
+        return os.path.join(self.path, "vectors.f32")
+
+    @property
+    def _records_file(self) -> str:
+        return os.path.join(self.path, "records.jsonl")
+
+    @property
+    def _deleted_file(self) -> str:
+        return os.path.join(self.path, "deleted.jsonl")
+
+    def _load(self) -> None:
+        if not os.path.exists(self._records_file):
+            return
+        with open(self._records_file, encoding="utf-8") as file:
+            self.records = [json.loads(line) for line in file if line.strip()]
+        if self.records:
+            self.dim = self.records[0]["dim"]
+            # Vectors are written before their records, so after a crash there
+            # may be trailing vectors without a record; ignore them.
+            n_rows = min(len(self.records), self._vector_rows())
+            self.records = self.records[:n_rows]
+        self.active = np.ones(len(self.records), dtype=bool)
+        for row, record in enumerate(self.records):
+            self._claim(record["id"], row)
+        if os.path.exists(self._deleted_file):
+            with open(self._deleted_file, encoding="utf-8") as file:
+                for line in file:
+                    if line.strip():
+                        self._retire(json.loads(line))
+        self._map()
+
+    def _vector_rows(self) -> int:
+        if not self.dim or not os.path.exists(self._vectors_file):
+            return 0
+        return os.path.getsize(self._vectors_file) // (4 * self.dim)
+
+    def _map(self) -> None:
+        n_rows = len(self.records)
+        self.vectors = (
+            np.memmap(
+                self._vectors_file, dtype=np.float32, mode="r", shape=(n_rows, self.dim)
+            )
+            if n_rows
+            else None
+        )
+
+    def _claim(self, doc_id: str, row: int) -> None:
+        # A re-added id supersedes its previous row.
+        previous = self.rows.get(doc_id)
+        if previous is not None:
+            self.active[previous] = False
+        self.rows[doc_id] = row
+
+    def _deactivate(self, doc_id: str) -> Optional[int]:
+        row = self.rows.pop(doc_id, None)
+        if row is not None:
+            self.active[row] = False
+        return row
+
+    def _retire(self, tombstone: Any) -> None:
+        if isinstance(tombstone, str):
+            # Written before tombstones recorded their row.
+            self._deactivate(tombstone)
+            return
+        row = tombstone["row"]
+        if row >= len(self.records):
+            return
+        self.active[row] = False
+        # The id may have been re-added to a later row since this deletion.
+        if self.rows.get(tombstone["id"]) == row:
+            del self.rows[tombstone["id"]]
+
+    def append(self, vectors: np.ndarray, records: list[dict[str, Any]]) -> None:
+        if self.dim and vectors.shape[1] != self.dim:
+            raise ValueError(
+                f"Embedding dimension {vectors.shape[1]} does not match the "
+                f"existing dimension {self.dim} of this store."
+            )
+        os.makedirs(self.path, exist_ok=True)
+        self.dim = vectors.shape[1]
+        start = len(self.records)
+        with open(self._vectors_file, "ab") as file:
+            file.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        with open(self._records_file, "a", encoding="utf-8") as file:
+            for record in records:
+                file.write(json.dumps({**record, "dim": self.dim}) + "\n")
+        self.records.extend(records)
+        self.active = np.concatenate([self.active, np.ones(len(records), dtype=bool)])
+        for offset, record in enumerate(records):
+            self._claim(record["id"], start + offset)
+        self._map()
+
+    def delete(self, ids: Iterable[str]) -> int:
+        removed = [
+            {"id": doc_id, "row": row}
+            for doc_id in ids
+            if (row := self._deactivate(doc_id)) is not None
+        ]
+        if removed:
+            with open(self._deleted_file, "a", encoding="utf-8") as file:
+                file.writelines(json.dumps(tombstone) + "\n" for tombstone in removed)
+        return len(removed)
+
+    def ids_where(self, key: Optional[str], values: set[Any]) -> list[str]:
+        if key == "id":
+            return [doc_id for doc_id in values if doc_id in self.rows]
+        return [
+            doc_id
+            for doc_id, row in self.rows.items()
+            if key is None or self.records[row]["metadata"].get(key) in values
+        ]
+
+    def search(
+        self, query: np.ndarray, k: int, filter: dict[str, Any]
+    ) -> list[tuple[int, float]]:
+        if self.vectors is None or k <= 0:
+            return []
+        scores = self.vectors @ query
+        mask = self.active.copy()
+        for key, value in filter.items():
+            mask &= np.fromiter(
+                (record["metadata"].get(key) == value for record in self.records),
+                dtype=bool,
+                count=len(self.records),
+            )
+        scores = np.where(mask, scores, -np.inf)
+        n_candidates = int(mask.sum())
+        if not n_candidates:
+            return []
+        k = min(k, n_candidates)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(row), float(scores[row])) for row in top]
+
+
+class LocalVectorStore(VectorStore):
+    """A local vector store that keeps each user's embeddings in a memory-mapped file.
+
+    Documents are partitioned by their ``user_id`` metadata field and every search
+    must name the partition with ``filter={"user_id": ...}``, which gives the same
+    isolation between users as the filters applied to the remote providers.
+    Any other filter keys are matched for equality against document metadata.
+
+    The store is meant to be owned by a single process; concurrent writers in
+    several processes would interleave their appends.
+    """
+
+    def __init__(self, path: str, embedding: Embeddings) -> None:
+        """Initialize the store.
+
+        Args:
+            path (str): The directory holding one sub-directory per user.
+            embedding (Embeddings): The encoder used for documents and queries.
+        """
+        self.path = path
+        self.embedding = embedding
+        self._lock = threading.Lock()
+        self._partitions: dict[str, _Partition] = {}
+
+    @property
+    def embeddings(self) -> Embeddings:
+        """Access the query embedding object."""
+        return self.embedding
+
+    def _partition(self, user_id: str) -> _Partition:
+        # Must be called with the lock held. Hash the user id so that it is always
+        # a safe directory name and cannot escape the store's root.
+        name = hashlib.sha256(user_id.encode("utf-8")).hexdigest()[:32]
+        return self._load_partition(name)
+
+    def _load_partition(self, name: str) -> _Partition:
+        # Must be called with the lock held.
+        partition = self._partitions.get(name)
+        if partition is None:
+            partition = _Partition(os.path.join(self.path, name))
+            self._partitions[name] = partition
+        return partition
+
+    @staticmethod
+    def _normalize(vectors: Any) -> np.ndarray:
+        matrix = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[list[dict]] = None,
+        *,
+        ids: Optional[list[str]] = None,
+        **kwargs: Any,
+    ) -> list[str]:
+        """Embed texts and append them to their users' partitions.
+
+        Every metadata dict must contain a ``user_id``. Adding an existing id
+        replaces the previous version of that document.
+        """
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        if any("user_id" not in metadata for metadata in metadatas):
+            raise ValueError("Documents added to the local store need a user_id.")
+        vectors = self._normalize(self.embedding.embed_documents(texts))
+        by_user: dict[str, list[int]] = {}
+        for i, metadata in enumerate(metadatas):
+            by_user.setdefault(metadata["user_id"], []).append(i)
+        with self._lock:
+            for user_id, rows in by_user.items():
+                self._partition(user_id).append(
+                    vectors[rows],
+                    [
+                        {
+                            "id": ids[i],
+                            "page_content": texts[i],
+                            "metadata": metadatas[i],
+                        }
+                        for i in rows
+                    ],
+                )
+        return ids
+
+    def delete(self, ids: Optional[list[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """Delete documents by id, optionally only within one user's partition.
+
+        Args:
+            ids (Optional[list[str]]): The ids of the documents to delete.
+            user_id (Optional[str]): Restrict the deletion to this user's documents.
+
+        Returns:
+            Optional[bool]: True if any document was deleted.
+        """
+        if not ids:
+            return False
+        user_id = kwargs.get("user_id")
+        with self._lock:
+            if user_id is not None:
+                partitions = [self._partition(user_id)]
+            else:
+                partitions = self._all_partitions()
+            deleted = sum(partition.delete(ids) for partition in partitions)
+        return deleted > 0
+
+    def delete_where(
+        self,
+        user_id: str,
+        key: Optional[str] = None,
+        values: Iterable[Any] = (),
+        *,
+        keep: Iterable[str] = (),
+    ) -> int:
+        """Delete a user's documents whose metadata `key` is one of `values`.
+
+        Args:
+            user_id (str): The user whose documents are deleted.
+            key (Optional[str]): The metadata key to match, e.g. ``"parent_id"``.
+                Every document of the user is deleted when no key is given.
+            values (Iterable[Any]): The values of `key` to delete.
+            keep (Iterable[str]): Ids of documents never to delete.
+
+        Returns:
+            int: The number of documents deleted.
+        """
+        with self._lock:
+            partition = self._partition(user_id)
+            kept = set(keep)
+            return partition.delete(
+                doc_id
+                for doc_id in partition.ids_where(key, set(values))
+                if doc_id not in kept
+            )
+
+    def _all_partitions(self) -> list[_Partition]:
+        # Must be called with the lock held. Partitions of other processes or earlier
+        # runs may exist on disk without having been loaded yet.
+        if os.path.isdir(self.path):
+            for name in os.listdir(self.path):
+                self._load_partition(name)
+        return list(self._partitions.values())
+
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: list[float],
+        k: int = 4,
+        filter: Optional[dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> list[tuple[Document, float]]:
+        """Return the k documents with the highest cosine similarity to `embedding`."""
+        filter = dict(filter or {})
+        user_id = filter.pop("user_id", None)
+        if user_id is None:
+            raise ValueError("Searches of the local store must filter on user_id.")
+        query = self._normalize(embedding)[0]
+        with self._lock:
+            partition = self._partition(user_id)
+            hits = partition.search(query, k, filter)
+            records = [partition.records[row] for row, _ in hits]
+        return [
+            (
+                Document(
+                    id=record["id"],
+                    page_content=record["page_content"],
+                    metadata=record["metadata"],
+                ),
+                score,
+            )
+            for record, (_, score) in zip(records, hits)
+        ]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> list[tuple[Document, float]]:
+        """Return the k most similar documents to `query` with their scores."""
+        return self.similarity_search_with_score_by_vector(
+            self.embedding.embed_query(query), k, **kwargs
+        )
+
+    def similarity_search(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> list[Document]:
+        """Return the k most similar documents to `query`."""
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def _select_relevance_score_fn(self) -> Any:
+        # Scores are already cosine similarities.
+        return lambda score: score
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: list[str],
+        embedding: Embeddings,
+        metadatas: Optional[list[dict]] = None,
+        *,
+        path: str = ".vectorstore",
+        **kwargs: Any,
+    ) -> LocalVectorStore:
+        """Create a local store at `path` and add the given texts to it."""
+        store = cls(path, embedding)
+        store.add_texts(texts, metadatas, **kwargs)
+        return store
+
+    def close(self) -> None:
+        """Drop the loaded partitions, releasing their memory maps."""
+        with self._lock:
+            self._partitions.clear()
@@ -0,0 +1,212 @@
+"""Lightweight latency and throughput instrumentation for both graphs.
+
+The graphs time their expensive stages (building clients, embedding, searching,
+writing to the vector store, formatting documents and calling chat models) and
+count the documents they process. Each sample carries labels such as the provider,
+model and graph node.
+
+Instrumentation is off by default. While it is off, `Metrics.timer` returns a
+shared no-op context manager and `Metrics.increment` returns immediately, so the
+instrumented code pays for little more than an attribute check. Set
+``RETRIEVAL_GRAPH_METRICS=1`` (or ``=opentelemetry``), or call `METRICS.enable()`,
+to start recording.
+
+Recorded samples can be rendered in the Prometheus text exposition format. They
+can also be forwarded to OpenTelemetry (``METRICS.enable(opentelemetry=True)``,
+which requires the ``opentelemetry-api`` package and an SDK meter provider
+configured by the application).
+
+Classes:
+    Metrics: A registry of timers (histograms) and counters.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, ContextManager, Generator, Sequence
+
+DEFAULT_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+"""Histogram bucket upper bounds, in seconds."""
+
+_NAMESPACE = "retrieval_graph"
+_NOOP: ContextManager[None] = contextlib.nullcontext()
+
+_Labels = tuple[tuple[str, str], ...]
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, buckets: int) -> None:
+        self.counts = [0] * (buckets + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+class Metrics:
+    """A thread-safe registry of timers and counters, disabled by default."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        """Initialize an empty, disabled registry.
+
+        Args:
+            buckets (Sequence[float]): Ascending histogram bucket upper bounds.
+        """
+        self.enabled = False
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._histograms: dict[tuple[str, _Labels], _Histogram] = {}
+        self._counters: dict[tuple[str, _Labels], float] = {}
+        self._meter: Any = None
+        self._instruments: dict[str, Any] = {}
+
+    def enable(self, *, opentelemetry: bool = False) -> None:
+        """Start recording samples, optionally forwarding them to OpenTelemetry."""
+        if opentelemetry:
+            from opentelemetry import metrics as otel_metrics
+
+            self._meter = otel_metrics.get_meter(_NAMESPACE)
+        self.enabled = True
+
+    def disable(self) -> None:
+        """Stop recording samples; recorded samples are kept until `reset`."""
+        self.enabled = False
+        self._meter = None
+        self._instruments = {}
+
+    def reset(self) -> None:
+        """Drop every recorded sample."""
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def timer(self, name: str, **labels: Any) -> ContextManager[None]:
+        """Time the enclosed block and record it under `name`, in seconds.
+
+        Args:
+            name (str): The metric name, e.g. ``"vector_search_seconds"``.
+            **labels: Label values for the sample, e.g. ``provider="elastic"``.
+        """
+        if not self.enabled:
+            return _NOOP
+        return self._timed(name, labels)
+
+    @contextlib.contextmanager
+    def _timed(self, name: str, labels: dict[str, Any]) -> Generator[None, None, None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        """Record one sample of the histogram `name`."""
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(len(self.buckets))
+            histogram.counts[bisect_left(self.buckets, value)] += 1
+            histogram.sum += value
+            histogram.count += 1
+        if self._meter is not None:
+            self._instrument(name, "histogram").record(value, attributes=dict(key[1]))
+
+    def increment(self, name: str, value: float = 1, **labels: Any) -> None:
+        """Add `value` to the counter `name`."""
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        if self._meter is not None:
+            self._instrument(name, "counter").add(value, attributes=dict(key[1]))
+
+    def _instrument(self, name: str, kind: str) -> Any:
+        instrument = self._instruments.get(name)
+        if instrument is None:
+            full_name = f"{_NAMESPACE}.{name}"
+            if kind == "histogram":
+                instrument = self._meter.create_histogram(full_name, unit="s")
+            else:
+                instrument = self._meter.create_counter(full_name)
+            self._instruments[name] = instrument
+        return instrument
+
+    def render_prometheus(self) -> str:
+        """Render every recorded sample in the Prometheus text exposition format."""
+        with self._lock:
+            histograms = {
+                key: (list(h.counts), h.sum, h.count)
+                for key, h in self._histograms.items()
+            }
+            counters = dict(self._counters)
+        lines: list[str] = []
+        for name in sorted({name for name, _ in histograms}):
+            metric = f"{_NAMESPACE}_{name}"
+            lines.append(f"# TYPE {metric} histogram")
+            for (sample_name, labels), (counts, total, count) in histograms.items():
+                if sample_name != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    le = (("le", repr(bound)),)
+                    lines.append(
+                        f"{metric}_bucket{_format_labels(labels + le)} {cumulative}"
+                    )
+                lines.append(
+                    f"{metric}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}"
+                )
+                lines.append(f"{metric}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{metric}_count{_format_labels(labels)} {count}")
+        for name in sorted({name for name, _ in counters}):
+            metric = f"{_NAMESPACE}_{name}"
+            lines.append(f"# TYPE {metric} counter")
+            for (sample_name, labels), value in counters.items():
+                if sample_name == name:
+                    lines.append(f"{metric}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+def _label_key(labels: dict[str, Any]) -> _Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: _Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+METRICS = Metrics()
+"""The process-wide metrics registry used by both graphs."""
+
+if os.environ.get("RETRIEVAL_GRAPH_METRICS"):
+    METRICS.enable(
+        opentelemetry=os.environ["RETRIEVAL_GRAPH_METRICS"].lower() == "opentelemetry"
+    )
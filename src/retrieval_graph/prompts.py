@@ -12,3 +12,14 @@ QUERY_SYSTEM_PROMPT = """Generate search queries to retrieve documents that may
 </previous_queries>
 
 System time: {system_time}"""
+SUMMARY_SYSTEM_PROMPT = """Maintain a concise running summary of a conversation between a user and an AI assistant. Extend the current summary with the new messages provided by the user. Keep the facts, names, preferences and open questions the assistant may need later. Reply with the updated summary only.
+
+<current_summary>
+{summary}
+</current_summary>"""
+CONVERSATION_SUMMARY = """
+
+Summary of the earlier conversation:
+<conversation_summary>
+{summary}
+</conversation_summary>"""
@@ -0,0 +1,246 @@
+"""Bounded, process-wide registries for expensive, reusable objects.
+
+This module provides a small LRU registry used to share warmed clients (embedding
+encoders, chat models, vector stores, ...) across graph runs in the same worker
+process instead of rebuilding them on every invocation.
+
+Classes:
+    Registry: A thread-safe LRU mapping with optional idle eviction and hit/miss counters.
+    RegistryStats: A snapshot of a registry's counters.
+
+Functions:
+    env_fingerprint: Hash environment settings for use in registry keys.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Generic, Hashable, Iterator, Optional, TypeVar
+
+V = TypeVar("V")
+
+
+def env_fingerprint(names: tuple[str, ...]) -> str:
+    """Hash the given environment settings so secrets never appear in registry keys.
+
+    Including the fingerprint in a key means that rotating a credential or endpoint
+    yields a freshly built client instead of the one configured with the old value.
+    """
+    digest = hashlib.sha256()
+    for name in names:
+        digest.update(f"{name}={os.environ.get(name, '')}\0".encode())
+    return digest.hexdigest()
+
+
+@dataclass(frozen=True)
+class RegistryStats:
+    """A point-in-time snapshot of a registry's counters."""
+
+    hits: int
+    misses: int
+    evictions: int
+    size: int
+    maxsize: int
+
+
+class Registry(Generic[V]):
+    """A bounded, thread-safe LRU registry of shared objects.
+
+    Values are built lazily by a factory on first use and reused afterwards. The
+    internal lock is only held for bookkeeping and never across the factory call
+    or an `await`, so the registry is safe to use from threads and from coroutines
+    running on one or more event loops.
+
+    If two callers miss on the same key concurrently, both may build a value but
+    only the first one stored is kept and returned to both; the loser is handed to
+    `on_evict` so it can be closed.
+
+    Values obtained through `lease` are not handed to `on_evict` while leased: if
+    one is evicted meanwhile, it is closed when its last lease ends.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        *,
+        idle_ttl: Optional[float] = None,
+        on_evict: Optional[Callable[[V], None]] = None,
+    ) -> None:
+        """Initialize the registry.
+
+        Args:
+            maxsize (int): The maximum number of values to keep.
+            idle_ttl (Optional[float]): Seconds after which an unused value is evicted.
+            on_evict (Optional[Callable[[V], None]]): Called with every value that is
+                evicted, invalidated or discarded, e.g. to close its connections.
+        """
+        if maxsize < 1:
+            raise ValueError("Registry maxsize must be at least 1.")
+        self.maxsize = maxsize
+        self.idle_ttl = idle_ttl
+        self._on_evict = on_evict
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Hashable, tuple[V, float]] = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._leases: dict[int, int] = {}
+        self._retired: dict[int, V] = {}
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], V]) -> V:
+        """Return the value stored under `key`, building it with `factory` on a miss.
+
+        Args:
+            key (Hashable): The cache key.
+            factory (Callable[[], V]): Builds the value when it is not cached.
+
+        Returns:
+            V: The shared value for `key`.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+        return self.put(key, factory())
+
+    @contextmanager
+    def lease(self, key: Hashable, factory: Callable[[], V]) -> Iterator[V]:
+        """Use the value stored under `key` for the duration of the block.
+
+        Like `get_or_create`, but a value evicted while leased is only handed to
+        `on_evict` once its last lease ends, so eviction never closes a client
+        that another caller is still using.
+
+        Args:
+            key (Hashable): The cache key.
+            factory (Callable[[], V]): Builds the value when it is not cached.
+        """
+        while True:
+            value = self.get_or_create(key, factory)
+            with self._lock:
+                # The value may have been evicted since; lease the current one.
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] is value:
+                    self._leases[id(value)] = self._leases.get(id(value), 0) + 1
+                    break
+        try:
+            yield value
+        finally:
+            retired: Optional[V] = None
+            with self._lock:
+                remaining = self._leases.pop(id(value)) - 1
+                if remaining:
+                    self._leases[id(value)] = remaining
+                else:
+                    retired = self._retired.pop(id(value), None)
+            if retired is not None and self._on_evict is not None:
+                self._on_evict(retired)
+
+    def get(self, key: Hashable) -> Optional[V]:
+        """Return the value stored under `key`, or None, counting a hit or miss."""
+        expired: list[V] = []
+        try:
+            with self._lock:
+                self._expire(expired)
+                entry = self._entries.get(key)
+                if entry is None:
+                    self._misses += 1
+                    return None
+                self._hits += 1
+                self._entries[key] = (entry[0], time.monotonic())
+                self._entries.move_to_end(key)
+                return entry[0]
+        finally:
+            self._discard(expired)
+
+    def put(self, key: Hashable, value: V) -> V:
+        """Store `value` under `key` unless a value is already present.
+
+        Returns:
+            V: The value now stored under `key`.
+        """
+        evicted: list[V] = []
+        try:
+            with self._lock:
+                existing = self._entries.get(key)
+                if existing is not None:
+                    evicted.append(value)
+                    self._entries.move_to_end(key)
+                    return existing[0]
+                self._entries[key] = (value, time.monotonic())
+                while len(self._entries) > self.maxsize:
+                    _, (old, _) = self._entries.popitem(last=False)
+                    self._evictions += 1
+                    evicted.append(old)
+                return value
+        finally:
+            self._discard(evicted)
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        """Drop the value stored under `key`, or every value if no key is given."""
+        removed: list[V] = []
+        with self._lock:
+            if key is None:
+                removed.extend(value for value, _ in self._entries.values())
+                self._entries.clear()
+            elif key in self._entries:
+                removed.append(self._entries.pop(key)[0])
+        self._discard(removed)
+
+    def evict_idle(self) -> None:
+        """Evict every value that has been unused for longer than `idle_ttl`."""
+        expired: list[V] = []
+        with self._lock:
+            self._expire(expired)
+        self._discard(expired)
+
+    def stats(self) -> RegistryStats:
+        """Return a snapshot of the registry's counters."""
+        with self._lock:
+            return RegistryStats(
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                size=len(self._entries),
+                maxsize=self.maxsize,
+            )
+
+    def __len__(self) -> int:
+        """Return the number of cached values."""
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Return whether a value is cached under `key`, without touching its recency."""
+        return key in self._entries
+
+    def _expire(self, expired: list[V]) -> None:
+        # Must be called with the lock held. Entries are ordered by last use, so
+        # we can stop at the first one that is still fresh.
+        if self.idle_ttl is None:
+            return
+        deadline = time.monotonic() - self.idle_ttl
+        while self._entries:
+            key, (value, last_used) = next(iter(self._entries.items()))
+            if last_used > deadline:
+                break
+            del self._entries[key]
+            self._evictions += 1
+            expired.append(value)
+
+    def _discard(self, values: list[V]) -> None:
+        if self._on_evict is None or not values:
+            return
+        with self._lock:
+            released = []
+            for value in values:
+                if id(value) in self._leases:
+                    self._retired[id(value)] = value
+                else:
+                    released.append(value)
+        for value in released:
+            self._on_evict(value)
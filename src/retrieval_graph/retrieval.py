@@ -1,26 +1,86 @@
 """Manage the configuration of various retrievers.
 
 This module provides functionality to create and manage retrievers for different
-vector store backends, specifically Elasticsearch, Pinecone, and MongoDB.
+vector store backends, specifically Elasticsearch, Pinecone, MongoDB, and a local
+memory-mapped store.
+
+Encoders and vector stores are pooled per process, so each run only pays for
+building a lightweight retriever view over an already connected store. Identical
+searches that are in flight at the same time share a single request.
 
 The retrievers support filtering results by user_id to ensure data isolation between users.
 """
 
+import asyncio
+import atexit
+import itertools
+import json
+import logging
 import os
-from contextlib import contextmanager
-from typing import Generator
+from contextlib import ExitStack, asynccontextmanager, contextmanager
+from typing import Any, AsyncGenerator, Callable, Generator, Optional, Sequence
 
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun
+from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
 from langchain_core.runnables import RunnableConfig
-from langchain_core.vectorstores import VectorStoreRetriever
+from langchain_core.vectorstores import VectorStore, VectorStoreRetriever
 
+from retrieval_graph.chunking import chunk_id
 from retrieval_graph.configuration import Configuration, IndexConfiguration
+from retrieval_graph.embeddings import (
+    BatchingEmbeddings,
+    CachedEmbeddings,
+    TimedEmbeddings,
+)
+from retrieval_graph.filters import ELASTIC_USER_ID_FIELD, compile_filter_plan
+from retrieval_graph.metrics import METRICS
+from retrieval_graph.registry import Registry, env_fingerprint
+from retrieval_graph.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
 
 ## Encoder constructors
 
+# Environment settings that change how each provider's client is built. They are
+# part of the cache key so that rotating a key or endpoint yields a fresh client.
+_ENCODER_ENV_SETTINGS = {
+    "openai": (
+        "OPENAI_API_KEY",
+        "OPENAI_API_BASE",
+        "OPENAI_BASE_URL",
+        "OPENAI_ORGANIZATION",
+        "OPENAI_PROXY",
+    ),
+    "cohere": ("COHERE_API_KEY", "CO_API_URL"),
+}
+
+TEXT_ENCODERS: Registry[Embeddings] = Registry(maxsize=16)
+"""Process-wide cache of warmed text encoders, keyed by model and env settings."""
+
 
 def make_text_encoder(model: str) -> Embeddings:
-    """Connect to the configured text encoder."""
+    """Connect to the configured text encoder.
+
+    Encoders are shared across calls through `TEXT_ENCODERS`, so the HTTP client
+    and its connection pool are only set up once per model and set of credentials.
+    Use `TEXT_ENCODERS.invalidate()` to force a rebuild.
+    """
+    provider = model.split("/", maxsplit=1)[0]
+    key = (model, env_fingerprint(_ENCODER_ENV_SETTINGS.get(provider, ())))
+    return TEXT_ENCODERS.get_or_create(key, lambda: _timed_text_encoder(model))
+
+
+def _timed_text_encoder(model: str) -> Embeddings:
+    with METRICS.timer("client_build_seconds", kind="encoder", model=model):
+        encoder = _build_text_encoder(model)
+    # Always wrapped, so that encoders built before `METRICS.enable()` are timed
+    # too; while metrics are disabled, the wrapper records nothing.
+    return TimedEmbeddings(encoder, model)
+
+
+def _build_text_encoder(model: str) -> Embeddings:
+    """Build a new text encoder client for a fully specified model name."""
     provider, model = model.split("/", maxsplit=1)
     match provider:
         case "openai":
@@ -35,9 +95,369 @@ def make_text_encoder(model: str) -> Embeddings:
             raise ValueError(f"Unsupported embedding provider: {provider}")
 
 
+CACHED_ENCODERS: Registry[CachedEmbeddings] = Registry(
+    maxsize=16, on_evict=lambda cache: cache.close()
+)
+"""Process-wide embedding caches, so the in-memory tier outlives a single run."""
+
+BATCHING_ENCODERS: Registry[BatchingEmbeddings] = Registry(maxsize=16)
+"""Process-wide query batchers, so that concurrent runs share their batches."""
+
+
+def make_embeddings(configuration: IndexConfiguration) -> Embeddings:
+    """Build the encoder for a configuration, with the cache and query batcher if enabled."""
+    encoder = _cached_encoder(configuration)
+    if configuration.embedding_batch_max_wait is None:
+        return encoder
+    # The batcher keeps a reference to its encoder, so the id stays unique.
+    return BATCHING_ENCODERS.get_or_create(
+        (
+            id(encoder),
+            configuration.embedding_batch_max_size,
+            configuration.embedding_batch_max_wait,
+        ),
+        lambda: BatchingEmbeddings(
+            encoder,
+            max_batch_size=configuration.embedding_batch_max_size,
+            max_wait=configuration.embedding_batch_max_wait or 0.0,
+        ),
+    )
+
+
+def _cached_encoder(configuration: IndexConfiguration) -> Embeddings:
+    encoder = make_text_encoder(configuration.embedding_model)
+    if not configuration.embedding_cache_path:
+        return encoder
+    return CACHED_ENCODERS.get_or_create(
+        (
+            configuration.embedding_model,
+            id(encoder),
+            configuration.embedding_cache_path,
+            configuration.embedding_cache_max_bytes,
+        ),
+        lambda: CachedEmbeddings(
+            encoder,
+            configuration.embedding_model,
+            path=configuration.embedding_cache_path,
+            max_disk_bytes=configuration.embedding_cache_max_bytes,
+        ),
+    )
+
+
+## Shared vector stores
+
+# Vector stores own the client connection pools (and, for Pinecone, the result of
+# an index describe call), so they are built once per provider, connection settings
+# and encoder, then shared across runs. Per-user isolation lives entirely in the
+# retriever's search kwargs, which makes handing out a view per run cheap.
+
+VECTOR_STORES: Registry[VectorStore] = Registry(
+    maxsize=int(os.environ.get("RETRIEVAL_STORE_POOL_SIZE", "8")),
+    idle_ttl=float(os.environ.get("RETRIEVAL_STORE_IDLE_TIMEOUT", "900")),
+    on_evict=lambda vstore: _close_vector_store(vstore),
+)
+"""Process-wide pool of connected vector stores."""
+
+
+@contextmanager
+def _shared_vector_store(
+    connection_key: tuple[str, ...],
+    embedding_model: Embeddings,
+    build: Callable[[], VectorStore],
+) -> Generator[VectorStore, None, None]:
+    """Lease the pooled vector store for a connection, building it on first use.
+
+    A store evicted from the pool while leased is closed once the last lease ends.
+    """
+    # The pooled store keeps a reference to its encoder, so the encoder's id
+    # cannot be reused by another object while the entry is alive.
+    with VECTOR_STORES.lease((*connection_key, id(embedding_model)), build) as vstore:
+        yield vstore
+
+
+def _close_vector_store(vstore: VectorStore) -> None:
+    """Release the connections held by a vector store evicted from the pool."""
+    match type(vstore).__name__:
+        case "ElasticsearchStore":
+            client = getattr(vstore, "client", None)
+        case "MongoDBAtlasVectorSearch":
+            client = vstore._collection.database.client  # type: ignore[attr-defined]
+        case "PineconeVectorStore":
+            client = getattr(vstore, "_index", None)
+        case "LocalVectorStore":
+            client = vstore
+        case _:
+            client = None
+    close = getattr(client, "close", None)
+    if not callable(close):
+        return
+    try:
+        close()
+    except Exception:
+        logger.warning("Failed to close pooled vector store client.", exc_info=True)
+
+
+def close_vector_stores() -> None:
+    """Close every pooled vector store, or when its last lease ends if in use.
+
+    Registered to run at interpreter exit.
+    """
+    VECTOR_STORES.invalidate()
+
+
+atexit.register(close_vector_stores)
+
+
+## Bulk deletion
+
+# Deleting is always scoped to one user, mirroring the search filters below, so a
+# caller can never remove another user's documents by guessing their ids.
+
+
+async def adelete_user_documents(
+    vstore: VectorStore,
+    user_id: str,
+    *,
+    ids: Sequence[str] = (),
+    parent_ids: Sequence[str] = (),
+    everything: bool = False,
+    keep_ids: Sequence[str] = (),
+    known_ids: Optional[Sequence[str]] = None,
+) -> int:
+    """Delete a user's documents with each provider's native bulk API.
+
+    Args:
+        vstore (VectorStore): The store to delete from.
+        user_id (str): The user whose documents are deleted.
+        ids (Sequence[str]): Delete the documents with these ids.
+        parent_ids (Sequence[str]): Delete the chunks of these parent documents.
+        everything (bool): Delete every document of the user.
+        keep_ids (Sequence[str]): Never delete the documents with these ids, e.g.
+            the chunks an upsert has just written.
+        known_ids (Optional[Sequence[str]]): The ids of all of the user's documents,
+            as kept by the record ledger. Pinecone can only delete by id, so deleting
+            `everything` from it needs these.
+
+    Returns:
+        int: The number of documents deleted.
+    """
+    if not (ids or parent_ids or everything):
+        return 0
+    match type(vstore).__name__:
+        case "ElasticsearchStore":
+            return await asyncio.to_thread(
+                _delete_elastic, vstore, user_id, ids, parent_ids, everything, keep_ids
+            )
+        case "MongoDBAtlasVectorSearch":
+            return await asyncio.to_thread(
+                _delete_mongodb, vstore, user_id, ids, parent_ids, everything, keep_ids
+            )
+        case "PineconeVectorStore":
+            if everything:
+                if known_ids is None:
+                    raise ValueError(
+                        "Deleting all of a user's documents from Pinecone needs "
+                        "a record ledger to list their ids."
+                    )
+                ids, parent_ids = known_ids, ()
+            return await asyncio.to_thread(
+                _delete_pinecone, vstore, user_id, ids, parent_ids, keep_ids
+            )
+        case "LocalVectorStore":
+            delete_where = vstore.delete_where  # type: ignore[attr-defined]
+            if everything:
+                return await asyncio.to_thread(delete_where, user_id, keep=keep_ids)
+            removed = await asyncio.to_thread(
+                delete_where, user_id, "id", ids, keep=keep_ids
+            )
+            return removed + await asyncio.to_thread(
+                delete_where, user_id, "parent_id", parent_ids, keep=keep_ids
+            )
+        case name:
+            raise ValueError(f"Bulk deletion is not supported for {name}.")
+
+
+def _delete_elastic(
+    vstore: VectorStore,
+    user_id: str,
+    ids: Sequence[str],
+    parent_ids: Sequence[str],
+    everything: bool,
+    keep_ids: Sequence[str],
+) -> int:
+    should: list[dict[str, Any]] = []
+    if ids:
+        should.append({"ids": {"values": list(ids)}})
+    if parent_ids:
+        should.append({"terms": {"metadata.parent_id.keyword": list(parent_ids)}})
+    query: dict[str, Any] = {
+        "bool": {"filter": [{"term": {ELASTIC_USER_ID_FIELD: user_id}}]}
+    }
+    if not everything:
+        query["bool"].update(should=should, minimum_should_match=1)
+    if keep_ids:
+        query["bool"]["must_not"] = [{"ids": {"values": list(keep_ids)}}]
+    response = vstore.client.delete_by_query(  # type: ignore[attr-defined]
+        index=vstore.index_name,  # type: ignore[attr-defined]
+        query=query,
+        conflicts="proceed",
+        refresh=True,
+    )
+    return int(response["deleted"])
+
+
+def _delete_mongodb(
+    vstore: VectorStore,
+    user_id: str,
+    ids: Sequence[str],
+    parent_ids: Sequence[str],
+    everything: bool,
+    keep_ids: Sequence[str],
+) -> int:
+    query: dict[str, Any] = {"user_id": user_id}
+    if not everything:
+        query["$or"] = [
+            *([{"id": {"$in": list(ids)}}] if ids else []),
+            *([{"parent_id": {"$in": list(parent_ids)}}] if parent_ids else []),
+        ]
+    if keep_ids:
+        query["id"] = {"$nin": list(keep_ids)}
+    collection = vstore._collection  # type: ignore[attr-defined]
+    return int(collection.delete_many(query).deleted_count)
+
+
+# Pinecone deletes at most 1000 ids per request. Fetches send their ids in the URL,
+# so they are kept to smaller batches.
+_PINECONE_DELETE_BATCH = 1000
+_PINECONE_FETCH_BATCH = 100
+
+
+def _delete_pinecone(
+    vstore: VectorStore,
+    user_id: str,
+    ids: Sequence[str],
+    parent_ids: Sequence[str],
+    keep_ids: Sequence[str],
+) -> int:
+    # Serverless indexes, the default, cannot delete by metadata filter, so the
+    # user's matching ids are looked up by id and deleted in batches. Fetching by
+    # id is consistent, unlike queries, which keep returning deleted vectors for a
+    # while.
+    index = vstore._index  # type: ignore[attr-defined]
+    namespace = vstore._namespace  # type: ignore[attr-defined]
+    owned = _fetch_pinecone_owned(index, namespace, user_id, ids)
+    for parent_id in parent_ids:
+        # Chunks are written from position 0 without gaps, so probe positions page
+        # by page until a page is no longer full.
+        for start in itertools.count(0, _PINECONE_FETCH_BATCH):
+            page = [
+                chunk_id(parent_id, start + i) for i in range(_PINECONE_FETCH_BATCH)
+            ]
+            found = _fetch_pinecone_owned(index, namespace, user_id, page)
+            owned.update(found)
+            if len(found) < len(page):
+                break
+    doomed = sorted(owned.difference(keep_ids))
+    for start in range(0, len(doomed), _PINECONE_DELETE_BATCH):
+        index.delete(
+            ids=doomed[start : start + _PINECONE_DELETE_BATCH], namespace=namespace
+        )
+    return len(doomed)
+
+
+def _fetch_pinecone_owned(
+    index: Any, namespace: Any, user_id: str, ids: Sequence[str]
+) -> set[str]:
+    """Return those of `ids` that exist in the index and belong to the user."""
+    owned: set[str] = set()
+    ids = list(dict.fromkeys(ids))
+    for start in range(0, len(ids), _PINECONE_FETCH_BATCH):
+        response = index.fetch(
+            ids=ids[start : start + _PINECONE_FETCH_BATCH], namespace=namespace
+        )
+        owned.update(
+            vector_id
+            for vector_id, vector in response.vectors.items()
+            if (vector.metadata or {}).get("user_id") == user_id
+        )
+    return owned
+
+
+## Single-flight searches
+
+SEARCHES: SingleFlight[list[Document]] = SingleFlight()
+"""Process-wide registry of the searches in flight, shared by identical requests."""
+
+
+class SingleFlightRetriever(VectorStoreRetriever):
+    """A retriever whose identical concurrent searches share one store request.
+
+    When a popular question spikes, the runs asking it at the same moment await a
+    single embedding and search instead of each sending their own. Searches are keyed
+    by the store, the provider and user, the query with its whitespace collapsed
+    (embeddings are case-sensitive, so case is kept), and the effective search
+    kwargs. Both the user and the tenant filter in the kwargs are part of the key, so
+    users never share results.
+    """
+
+    provider: str
+    user_id: str
+
+    async def _aget_relevant_documents(
+        self,
+        query: str,
+        *,
+        run_manager: AsyncCallbackManagerForRetrieverRun,
+        **kwargs: Any,
+    ) -> list[Document]:
+        key = (
+            id(self.vectorstore),
+            self.provider,
+            self.user_id,
+            self.search_type,
+            " ".join(query.split()),
+            json.dumps({**self.search_kwargs, **kwargs}, sort_keys=True, default=str),
+        )
+        docs = await SEARCHES.do(
+            key,
+            lambda: super(SingleFlightRetriever, self)._aget_relevant_documents(
+                query, run_manager=run_manager, **kwargs
+            ),
+        )
+        # Each caller gets its own list, since callers may reorder or extend it.
+        return list(docs)
+
+
+def _single_flight(
+    retriever: VectorStoreRetriever, configuration: IndexConfiguration
+) -> SingleFlightRetriever:
+    return SingleFlightRetriever(
+        vectorstore=retriever.vectorstore,
+        search_type=retriever.search_type,
+        search_kwargs=retriever.search_kwargs,
+        tags=retriever.tags,
+        metadata=retriever.metadata,
+        provider=configuration.retriever_provider,
+        user_id=configuration.user_id,
+    )
+
+
 ## Retriever constructors
 
 
+def _search_kwargs(configuration: IndexConfiguration) -> dict[str, Any]:
+    """Return the configured search kwargs restricted to the configured user.
+
+    The combined filters are compiled once per provider, user and search kwargs, and
+    the caller's configuration is never modified.
+    """
+    return compile_filter_plan(
+        configuration.retriever_provider,
+        configuration.user_id,
+        configuration.search_kwargs,
+    ).search_kwargs()
+
+
 @contextmanager
 def make_elastic_retriever(
     configuration: IndexConfiguration, embedding_model: Embeddings
@@ -54,19 +474,31 @@ def make_elastic_retriever(
 
     else:
         connection_options = {"es_api_key": os.environ["ELASTICSEARCH_API_KEY"]}
+    es_url = os.environ["ELASTICSEARCH_URL"]
+    index_name = "langchain_index"
 
-    vstore = ElasticsearchStore(
-        **connection_options,  # type: ignore
-        es_url=os.environ["ELASTICSEARCH_URL"],
-        index_name="langchain_index",
-        embedding=embedding_model,
-    )
-
-    search_kwargs = configuration.search_kwargs
-
-    search_filter = search_kwargs.setdefault("filter", [])
-    search_filter.append({"term": {"metadata.user_id": configuration.user_id}})
-    yield vstore.as_retriever(search_kwargs=search_kwargs)
+    with _shared_vector_store(
+        (
+            configuration.retriever_provider,
+            es_url,
+            index_name,
+            env_fingerprint(
+                (
+                    "ELASTICSEARCH_USER",
+                    "ELASTICSEARCH_PASSWORD",
+                    "ELASTICSEARCH_API_KEY",
+                )
+            ),
+        ),
+        embedding_model,
+        lambda: ElasticsearchStore(
+            **connection_options,  # type: ignore
+            es_url=es_url,
+            index_name=index_name,
+            embedding=embedding_model,
+        ),
+    ) as vstore:
+        yield vstore.as_retriever(search_kwargs=_search_kwargs(configuration))
 
 
 @contextmanager
@@ -76,14 +508,15 @@ def make_pinecone_retriever(
     """Configure this agent to connect to a specific pinecone index."""
     from langchain_pinecone import PineconeVectorStore
 
-    search_kwargs = configuration.search_kwargs
-
-    search_filter = search_kwargs.setdefault("filter", {})
-    search_filter.update({"user_id": configuration.user_id})
-    vstore = PineconeVectorStore.from_existing_index(
-        os.environ["PINECONE_INDEX_NAME"], embedding=embedding_model
-    )
-    yield vstore.as_retriever(search_kwargs=search_kwargs)
+    index_name = os.environ["PINECONE_INDEX_NAME"]
+    with _shared_vector_store(
+        ("pinecone", index_name, env_fingerprint(("PINECONE_API_KEY",))),
+        embedding_model,
+        lambda: PineconeVectorStore.from_existing_index(
+            index_name, embedding=embedding_model
+        ),
+    ) as vstore:
+        yield vstore.as_retriever(search_kwargs=_search_kwargs(configuration))
 
 
 @contextmanager
@@ -93,15 +526,33 @@ def make_mongodb_retriever(
     """Configure this agent to connect to a specific MongoDB Atlas index & namespaces."""
     from langchain_mongodb.vectorstores import MongoDBAtlasVectorSearch
 
-    vstore = MongoDBAtlasVectorSearch.from_connection_string(
-        os.environ["MONGODB_URI"],
-        namespace="langgraph_retrieval_agent.default",
-        embedding=embedding_model,
-    )
-    search_kwargs = configuration.search_kwargs
-    pre_filter = search_kwargs.setdefault("pre_filter", {})
-    pre_filter["user_id"] = {"$eq": configuration.user_id}
-    yield vstore.as_retriever(search_kwargs=search_kwargs)
+    namespace = "langgraph_retrieval_agent.default"
+    with _shared_vector_store(
+        ("mongodb", namespace, env_fingerprint(("MONGODB_URI",))),
+        embedding_model,
+        lambda: MongoDBAtlasVectorSearch.from_connection_string(
+            os.environ["MONGODB_URI"],
+            namespace=namespace,
+            embedding=embedding_model,
+        ),
+    ) as vstore:
+        yield vstore.as_retriever(search_kwargs=_search_kwargs(configuration))
+
+
+@contextmanager
+def make_local_retriever(
+    configuration: IndexConfiguration, embedding_model: Embeddings
+) -> Generator[VectorStoreRetriever, None, None]:
+    """Configure this agent to use the in-process, memory-mapped vector store."""
+    from retrieval_graph.local_store import LocalVectorStore
+
+    path = os.path.abspath(os.environ.get("LOCAL_VECTORSTORE_PATH", ".vectorstore"))
+    with _shared_vector_store(
+        ("local", path),
+        embedding_model,
+        lambda: LocalVectorStore(path, embedding_model),
+    ) as vstore:
+        yield vstore.as_retriever(search_kwargs=_search_kwargs(configuration))
 
 
 @contextmanager
@@ -110,22 +561,26 @@ def make_retriever(
 ) -> Generator[VectorStoreRetriever, None, None]:
     """Create a retriever for the agent, based on the current configuration."""
     configuration = IndexConfiguration.from_runnable_config(config)
-    embedding_model = make_text_encoder(configuration.embedding_model)
+    embedding_model = make_embeddings(configuration)
     user_id = configuration.user_id
     if not user_id:
         raise ValueError("Please provide a valid user_id in the configuration.")
     match configuration.retriever_provider:
         case "elastic" | "elastic-local":
             with make_elastic_retriever(configuration, embedding_model) as retriever:
-                yield retriever
+                yield _single_flight(retriever, configuration)
 
         case "pinecone":
             with make_pinecone_retriever(configuration, embedding_model) as retriever:
-                yield retriever
+                yield _single_flight(retriever, configuration)
 
         case "mongodb":
             with make_mongodb_retriever(configuration, embedding_model) as retriever:
-                yield retriever
+                yield _single_flight(retriever, configuration)
+
+        case "local":
+            with make_local_retriever(configuration, embedding_model) as retriever:
+                yield _single_flight(retriever, configuration)
 
         case _:
             raise ValueError(
@@ -133,3 +588,41 @@ def make_retriever(
                 f"Expected one of: {', '.join(Configuration.__annotations__['retriever_provider'].__args__)}\n"
                 f"Got: {configuration.retriever_provider}"
             )
+
+
+@asynccontextmanager
+async def amake_retriever(
+    config: RunnableConfig,
+) -> AsyncGenerator[VectorStoreRetriever, None]:
+    """Create a retriever like `make_retriever`, without blocking the event loop.
+
+    Building an encoder or a store client does blocking I/O: Pinecone looks its
+    index up, and the pinned ``langchain-elasticsearch`` (<0.3) and
+    ``langchain-mongodb`` stores only accept synchronous clients. Construction
+    therefore runs in a worker thread, so that a cold start on one run does not
+    stall the other runs on the loop. Once the store is pooled this is a cheap
+    lookup; searches go through the retriever's own async methods.
+    """
+    stack = ExitStack()
+
+    def enter() -> VectorStoreRetriever:
+        return stack.enter_context(make_retriever(config))
+
+    def release(entered: asyncio.Future[VectorStoreRetriever]) -> None:
+        # Retrieve a failed build's error, so it is not reported as never retrieved.
+        if not entered.cancelled():
+            entered.exception()
+        stack.close()
+
+    # Shielded, so that a caller cancelled mid-build does not close the stack while
+    # the worker thread still takes the store lease; the lease is released once the
+    # thread is done instead.
+    entering = asyncio.ensure_future(asyncio.to_thread(enter))
+    try:
+        retriever = await asyncio.shield(entering)
+    except asyncio.CancelledError:
+        entering.add_done_callback(release)
+        raise
+    with stack:
+        # Leaving the context only releases the store lease, which never blocks.
+        yield retriever
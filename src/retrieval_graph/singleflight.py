@@ -0,0 +1,69 @@
+"""Coalescing of identical concurrent calls into one in-flight call.
+
+Classes:
+    SingleFlight: Shares the result of an in-flight coroutine among identical calls.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+from typing import Awaitable, Callable, Generic, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight(Generic[T]):
+    """Run at most one call per key at a time, sharing its outcome with every caller.
+
+    The first caller of a key starts the call as a task. Callers that arrive with
+    the same key before the task finishes await that task instead of starting their
+    own, and all of them get its result or its exception. Nothing is kept once the
+    task finishes, so later calls run again. This is not a cache.
+
+    A caller that is cancelled, e.g. by a timeout, stops waiting, but the shared
+    task runs on for the other callers. Calls are coalesced per event loop, because
+    a task cannot be awaited from another loop.
+    """
+
+    def __init__(self) -> None:
+        """Initialize with no calls in flight."""
+        self._lock = threading.Lock()
+        self._calls: dict[tuple[asyncio.AbstractEventLoop, Hashable], asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        """Return the number of calls in flight."""
+        return len(self._calls)
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        """Return the outcome of `call`, or of the identical call already in flight.
+
+        Args:
+            key (Hashable): Identifies calls that are interchangeable.
+            call (Callable[[], Awaitable[T]]): Starts the call when none is in flight.
+
+        Returns:
+            T: The result of the shared call.
+        """
+        loop = asyncio.get_running_loop()
+        slot = (loop, key)
+        with self._lock:
+            task = self._calls.get(slot)
+            if task is None:
+                task = self._calls[slot] = loop.create_task(_await(call))
+                task.add_done_callback(lambda done: self._finish(slot, done))
+        return await asyncio.shield(task)
+
+    def _finish(
+        self, slot: tuple[asyncio.AbstractEventLoop, Hashable], task: asyncio.Task
+    ) -> None:
+        with self._lock:
+            if self._calls.get(slot) is task:
+                del self._calls[slot]
+        # Mark the exception as retrieved, in case every caller was cancelled.
+        if not task.cancelled():
+            task.exception()
+
+
+async def _await(call: Callable[[], Awaitable[T]]) -> T:
+    return await call()
@@ -0,0 +1,198 @@
+"""Streaming document sources for the index graph.
+
+A `DocumentSource` lets the indexer consume an upload lazily instead of requiring
+the whole corpus as an in-memory list. Documents are pulled through a generator
+pipeline one batch at a time, so peak memory is bounded by the batch size and the
+number of batches in flight rather than by the size of the corpus.
+
+Graph input may name a JSONL file to read on the server. Such paths are only
+accepted below the directory set in ``RETRIEVAL_INGEST_ROOT``, so clients of the
+server cannot read arbitrary files.
+
+Classes:
+    DocumentSource: A lazily consumed stream of documents.
+
+Functions:
+    resolve_ingest_path: Resolve a path from graph input within the ingest root.
+    to_document: Coerce a string, dict or Document into a Document.
+    aiter_batches: Group a sync or async stream of documents into lists.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+from pathlib import Path
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Callable,
+    Iterable,
+    Union,
+)
+
+from langchain_core.documents import Document
+
+DocumentLike = Union[Document, dict[str, Any], str]
+
+_LINES_PER_READ = 1024
+
+INGEST_ROOT_ENV = "RETRIEVAL_INGEST_ROOT"
+"""Environment variable naming the directory that input paths must be under."""
+
+
+def resolve_ingest_path(path: Union[str, os.PathLike[str]]) -> Path:
+    """Resolve a path from graph input, refusing anything outside the ingest root.
+
+    Relative paths are resolved against the root, and symlinks are followed before
+    the check, so neither ``../`` nor a link can escape it.
+
+    Args:
+        path (Union[str, os.PathLike[str]]): The path given as graph input.
+
+    Returns:
+        Path: The resolved path.
+
+    Raises:
+        ValueError: If no ingest root is configured or the path is outside it.
+    """
+    root = os.environ.get(INGEST_ROOT_ENV)
+    if not root:
+        raise ValueError(
+            f"Reading documents from a path requires {INGEST_ROOT_ENV} to be set."
+        )
+    root_path = Path(root).resolve()
+    resolved = (root_path / path).resolve()
+    if not resolved.is_relative_to(root_path):
+        raise ValueError(f"{os.fspath(path)!r} is outside the ingest root.")
+    return resolved
+
+
+def to_document(item: DocumentLike) -> Document:
+    """Coerce a string, dict or Document into a Document.
+
+    Args:
+        item (DocumentLike): A Document, the keyword arguments of one, or its text.
+
+    Returns:
+        Document: The coerced document.
+    """
+    if isinstance(item, str):
+        return Document(page_content=item)
+    if isinstance(item, dict):
+        return Document(**item)
+    return item
+
+
+class DocumentSource:
+    """A lazily consumed stream of documents.
+
+    Sources yield Documents from a JSONL/NDJSON file, or from any sync or async
+    iterable of documents. Items may be Documents, dicts, strings, or lists of
+    those (chunked input), which are flattened.
+
+    Examples:
+        >>> source = DocumentSource.from_iterable(["a", ["b", {"page_content": "c"}]])
+        >>> async def collect():
+        ...     return [doc.page_content async for doc in source]
+        >>> asyncio.run(collect())
+        ['a', 'b', 'c']
+    """
+
+    def __init__(self, open_stream: Callable[[], AsyncIterator[Any]]) -> None:
+        """Initialize the source.
+
+        Args:
+            open_stream (Callable[[], AsyncIterator[Any]]): Starts a new pass over the
+                raw items of the source.
+        """
+        self._open_stream = open_stream
+
+    @classmethod
+    def from_path(cls, path: Union[str, os.PathLike[str]]) -> DocumentSource:
+        """Stream documents from a JSONL or NDJSON file, one JSON value per line.
+
+        The file is read in chunks of lines on a worker thread so that the event
+        loop is never blocked on disk I/O. Blank lines are skipped.
+        """
+        path = os.fspath(path)
+
+        async def stream() -> AsyncIterator[Any]:
+            with open(path, encoding="utf-8") as file:
+                while True:
+                    lines = await asyncio.to_thread(_read_lines, file)
+                    if not lines:
+                        return
+                    for line in lines:
+                        if line.strip():
+                            yield json.loads(line)
+
+        return cls(stream)
+
+    @classmethod
+    def from_iterable(
+        cls, items: Union[Iterable[Any], AsyncIterable[Any]]
+    ) -> DocumentSource:
+        """Stream documents from a sync or async iterable."""
+
+        async def stream() -> AsyncIterator[Any]:
+            if isinstance(items, AsyncIterable):
+                async for item in items:
+                    yield item
+            else:
+                for item in items:
+                    yield item
+
+        return cls(stream)
+
+    async def __aiter__(self) -> AsyncIterator[Document]:
+        """Yield the documents of the source, flattening chunked input."""
+        async for item in self._open_stream():
+            if isinstance(item, list):
+                for sub_item in item:
+                    yield to_document(sub_item)
+            else:
+                yield to_document(item)
+
+    def __repr__(self) -> str:
+        """Avoid rendering the underlying stream."""
+        return f"{type(self).__name__}()"
+
+
+def _read_lines(file: Any) -> list[str]:
+    lines = []
+    for line in file:
+        lines.append(line)
+        if len(lines) == _LINES_PER_READ:
+            break
+    return lines
+
+
+async def aiter_batches(
+    docs: Union[Iterable[Document], AsyncIterable[Document]], batch_size: int
+) -> AsyncIterator[list[Document]]:
+    """Yield successive lists of at most `batch_size` documents from a stream.
+
+    Args:
+        docs (Union[Iterable[Document], AsyncIterable[Document]]): The documents.
+        batch_size (int): The maximum number of documents per list.
+    """
+    if batch_size < 1:
+        raise ValueError("Batch size must be at least 1.")
+    batch: list[Document] = []
+    if isinstance(docs, AsyncIterable):
+        async for doc in docs:
+            batch.append(doc)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    else:
+        for doc in docs:
+            batch.append(doc)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
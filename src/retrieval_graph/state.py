@@ -6,11 +6,13 @@ and conversation management.
 
 Classes:
     IndexState: Represents the state for document indexing operations.
+    IndexSummary: Reports the outcome of an indexing run.
     RetrievalState: Represents the state for document retrieval operations.
     ConversationState: Represents the state of the ongoing conversation.
 
 Functions:
     reduce_docs: Processes and reduces document inputs into a sequence of Documents.
+    add_queries: Keeps the most recent distinct search queries.
     reduce_retriever: Updates the retriever in the state.
     reduce_messages: Manages the addition of new messages to the conversation state.
     reduce_retrieved_docs: Handles the updating of retrieved documents in the state.
@@ -19,57 +21,101 @@ The module also includes type definitions and utility functions to support
 these state management operations.
 """
 
-import uuid
+import os
 from dataclasses import dataclass, field
-from typing import Annotated, Any, Literal, Optional, Sequence, Union
+from typing import Annotated, Any, AsyncIterable, Literal, Optional, Sequence, Union
 
 from langchain_core.documents import Document
 from langchain_core.messages import AnyMessage
 from langgraph.graph import add_messages
 
+from retrieval_graph.sources import DocumentSource, resolve_ingest_path, to_document
+
 ############################  Doc Indexing State  #############################
 
 
 def reduce_docs(
-    existing: Optional[Sequence[Document]],
+    existing: Optional[Union[Sequence[Document], DocumentSource]],
     new: Union[
         Sequence[Document],
         Sequence[dict[str, Any]],
         Sequence[str],
         str,
+        DocumentSource,
+        AsyncIterable[Any],
+        os.PathLike[str],
         Literal["delete"],
     ],
-) -> Sequence[Document]:
+) -> Union[Sequence[Document], DocumentSource]:
     """Reduce and process documents based on the input type.
 
     This function handles various input types and converts them into a sequence of Document objects.
     It can delete existing documents, create new ones from strings or dictionaries, or return the existing documents.
+    Ids are not assigned here: the indexer derives them from the user, source and content of each document.
+
+    Streaming inputs are not materialized: a DocumentSource is kept as is, and a path to a
+    JSONL/NDJSON file (as an os.PathLike or a ``{"path": ...}`` dict) or an async iterable
+    is wrapped in a DocumentSource that the indexer consumes batch by batch. Paths must
+    lie within ``RETRIEVAL_INGEST_ROOT`` (see `resolve_ingest_path`).
 
     Args:
-        existing (Optional[Sequence[Document]]): The existing docs in the state, if any.
-        new (Union[Sequence[Document], Sequence[dict[str, Any]], Sequence[str], str, Literal["delete"]]):
+        existing (Optional[Union[Sequence[Document], DocumentSource]]): The existing docs in the state, if any.
+        new (Union[Sequence[Document], Sequence[dict[str, Any]], Sequence[str], str, DocumentSource, AsyncIterable[Any], os.PathLike[str], Literal["delete"]]):
             The new input to process. Can be a sequence of Documents, dictionaries, strings, a single string,
-            or the literal "delete".
+            a streaming source, or the literal "delete".
     """
-    if new == "delete":
+    if isinstance(new, str) and new == "delete":
         return []
+    if isinstance(new, DocumentSource):
+        return new
+    if isinstance(new, os.PathLike):
+        return DocumentSource.from_path(resolve_ingest_path(new))
+    if isinstance(new, dict) and set(new) == {"path"}:
+        return DocumentSource.from_path(resolve_ingest_path(new["path"]))
+    if isinstance(new, AsyncIterable):
+        return DocumentSource.from_iterable(new)
     if isinstance(new, str):
-        return [Document(page_content=new, metadata={"id": str(uuid.uuid4())})]
+        return [to_document(new)]
     if isinstance(new, list):
-        coerced = []
-        for item in new:
-            if isinstance(item, str):
-                coerced.append(
-                    Document(page_content=item, metadata={"id": str(uuid.uuid4())})
-                )
-            elif isinstance(item, dict):
-                coerced.append(Document(**item))
-            else:
-                coerced.append(item)
-        return coerced
+        return [to_document(item) for item in new]
     return existing or []
 
 
+@dataclass(kw_only=True)
+class IndexSummary:
+    """Reports the outcome of an indexing run."""
+
+    indexed: int = 0
+    """The number of documents written to the vector store."""
+
+    failed: int = 0
+    """The number of documents in batches that failed after all retries."""
+
+    skipped: int = 0
+    """The number of unchanged documents that were already indexed."""
+
+    deleted: int = 0
+    """The number of stale documents removed from the vector store."""
+
+    removed: int = 0
+    """The number of documents removed by `delete_ids` or `delete_all`."""
+
+    replaced: int = 0
+    """The number of stored chunks deleted because an upsert superseded them.
+
+    Versions the upsert overwrote in place under the same id are not counted.
+    """
+
+    batches: int = 0
+    """The number of batches the documents were split into."""
+
+    failed_batches: int = 0
+    """The number of batches that failed after all retries."""
+
+    elapsed: float = 0.0
+    """Wall-clock seconds spent indexing."""
+
+
 # The index state defines the simple IO for the single-node index graph
 @dataclass(kw_only=True)
 class IndexState:
@@ -80,8 +126,25 @@ class IndexState:
     these documents.
     """
 
-    docs: Annotated[Sequence[Document], reduce_docs]
-    """A list of documents that the agent can index."""
+    docs: Annotated[Union[Sequence[Document], DocumentSource], reduce_docs] = field(
+        default_factory=list
+    )
+    """A list of documents that the agent can index, or a stream of them."""
+
+    delete_ids: list[str] = field(default_factory=list)
+    """Ids of the user's documents to delete before indexing, with their chunks.
+
+    Either the ids the indexer derived, or the ids given to upserted documents."""
+
+    delete_all: bool = False
+    """Whether to delete every document of the user before indexing."""
+
+    upsert: bool = False
+    """Whether `docs` that carry an ``id`` in their metadata replace the stored
+    document (and its chunks) with that id, instead of being keyed by content."""
+
+    summary: Optional[IndexSummary] = None
+    """Populated by the indexer with the outcome of the last run."""
 
 
 #############################  Agent State  ###################################
@@ -134,17 +197,45 @@ class InputState:
 # This is the primary state of your agent, where you can store any information
 
 
-def add_queries(existing: Sequence[str], new: Sequence[str]) -> Sequence[str]:
-    """Combine existing queries with new queries.
+MAX_QUERY_HISTORY = int(os.environ.get("RETRIEVAL_QUERY_HISTORY_SIZE", "20"))
+"""The number of distinct past queries kept in `State.queries`."""
+
+
+def _normalize_query(query: str) -> str:
+    return " ".join(query.split()).casefold()
+
+
+def add_queries(
+    existing: Sequence[str], new: Sequence[str], *, max_length: Optional[int] = None
+) -> Sequence[str]:
+    """Combine existing queries with new queries, keeping the last distinct ones.
+
+    Queries are compared case-insensitively and ignoring whitespace. A repeated
+    query moves to the end, keeping its latest wording, and only the most recent
+    `max_length` queries are kept, so the state (and every checkpoint and prompt
+    it is rendered into) stays the same size however long the conversation runs.
 
     Args:
         existing (Sequence[str]): The current list of queries in the state.
         new (Sequence[str]): The new queries to be added.
+        max_length (Optional[int]): The number of queries to keep. Defaults to
+            `MAX_QUERY_HISTORY`.
 
     Returns:
-        Sequence[str]: A new list containing all queries from both input sequences.
+        Sequence[str]: The most recent distinct queries, oldest first.
+
+    Examples:
+        >>> add_queries(["cats", "Dogs"], ["dogs ", "birds"], max_length=2)
+        ['dogs ', 'birds']
     """
-    return list(existing) + list(new)
+    limit = MAX_QUERY_HISTORY if max_length is None else max_length
+    merged: dict[str, str] = {}
+    for query in (*existing, *new):
+        key = _normalize_query(query)
+        if key:
+            merged.pop(key, None)
+            merged[key] = query
+    return list(merged.values())[-limit:] if limit > 0 else []
 
 
 @dataclass(kw_only=True)
@@ -152,10 +243,22 @@ class State(InputState):
     """The state of your graph / agent."""
 
     queries: Annotated[list[str], add_queries] = field(default_factory=list)
-    """A list of search queries that the agent has generated."""
+    """The most recent distinct search queries the agent has generated."""
+
+    turn_queries: list[str] = field(default_factory=list)
+    """The search queries generated for the current turn, replaced every turn."""
 
     retrieved_docs: list[Document] = field(default_factory=list)
     """Populated by the retriever. This is a list of documents that the agent can reference."""
 
+    cache_hit: bool = False
+    """Whether the current turn was answered from the semantic answer cache."""
+
+    history_start: int = 0
+    """Index of the oldest message still sent to the models; see `history_token_budget`."""
+
+    summary: str = ""
+    """A rolling summary of the messages before `history_start`, if enabled."""
+
     # Feel free to add additional attributes to your state as needed.
     # Common examples include retrieved documents, extracted entities, API connections, etc.
@@ -5,16 +5,18 @@ and other common operations in project.
 
 Functions:
     get_message_text: Extract text content from various message formats.
-    format_docs: Convert documents to an xml-formatted string.
+    format_docs: Convert documents to an xml-formatted string, optionally within a token budget.
 """
 
-from typing import Optional
+from typing import Callable, Optional, Sequence
 
-from langchain.chat_models import init_chat_model
 from langchain_core.documents import Document
 from langchain_core.language_models import BaseChatModel
 from langchain_core.messages import AnyMessage
 
+from retrieval_graph.metrics import METRICS
+from retrieval_graph.registry import Registry, env_fingerprint
+
 
 def get_message_text(msg: AnyMessage) -> str:
     """Get the text content of a message.
@@ -46,16 +48,30 @@ def get_message_text(msg: AnyMessage) -> str:
         return "".join(txts).strip()
 
 
-def _format_doc(doc: Document) -> str:
+def approximate_token_count(text: str) -> int:
+    """Estimate the number of tokens in a text at roughly four characters per token.
+
+    Examples:
+        >>> approximate_token_count("Hello world!")
+        3
+    """
+    return (len(text) + 3) // 4
+
+
+def _format_doc(doc: Document, metadata_keys: Optional[Sequence[str]] = None) -> str:
     """Format a single document as XML.
 
     Args:
         doc (Document): The document to format.
+        metadata_keys (Optional[Sequence[str]]): The metadata keys to render, or None
+            to render all of them.
 
     Returns:
         str: The formatted document as an XML string.
     """
     metadata = doc.metadata or {}
+    if metadata_keys is not None:
+        metadata = {k: metadata[k] for k in metadata_keys if k in metadata}
     meta = "".join(f" {k}={v!r}" for k, v in metadata.items())
     if meta:
         meta = f" {meta}"
@@ -63,13 +79,50 @@ def _format_doc(doc: Document) -> str:
     return f"<document{meta}>\n{doc.page_content}\n</document>"
 
 
-def format_docs(docs: Optional[list[Document]]) -> str:
+def _trim_to_budget(
+    doc: Document,
+    metadata_keys: Optional[tuple[str, ...]],
+    budget: int,
+    count_tokens: Callable[[str], int],
+) -> Optional[str]:
+    """Cut a document's content so that its fragment fits within `budget` tokens."""
+    content = doc.page_content
+    keep = len(content)
+    while keep > 0:
+        trimmed = Document(page_content=content[:keep], metadata=doc.metadata)
+        fragment = _format_doc(trimmed, metadata_keys)
+        tokens = count_tokens(fragment)
+        if tokens <= budget:
+            return fragment
+        # Shrink proportionally to the overflow, and by at least one character.
+        keep = min(keep - 1, int(keep * budget / tokens))
+    return None
+
+
+def format_docs(
+    docs: Optional[list[Document]],
+    *,
+    token_budget: Optional[int] = None,
+    count_tokens: Callable[[str], int] = approximate_token_count,
+    metadata_keys: Optional[Sequence[str]] = None,
+    min_trimmed_tokens: int = 64,
+) -> str:
     """Format a list of documents as XML.
 
     This function takes a list of Document objects and formats them into a single XML string.
 
+    With a token budget, documents are added in rank order until the budget is
+    spent. A document that does not fit is trimmed to the remaining budget if at
+    least `min_trimmed_tokens` remain, and skipped otherwise, so that smaller,
+    lower-ranked documents can still fill the rest of the budget.
+
     Args:
         docs (Optional[list[Document]]): A list of Document objects to format, or None.
+        token_budget (Optional[int]): The maximum number of tokens of the output.
+        count_tokens (Callable[[str], int]): Counts the tokens of a text.
+        metadata_keys (Optional[Sequence[str]]): The metadata keys to render, or None
+            to render all of them.
+        min_trimmed_tokens (int): The smallest budget worth trimming a document to.
 
     Returns:
         str: A string containing the formatted documents in XML format.
@@ -88,18 +141,70 @@ def format_docs(docs: Optional[list[Document]]) -> str:
 
         >>> print(format_docs(None))
         <documents></documents>
+
+        >>> print(format_docs(docs, token_budget=16))
+        <documents>
+        <document>
+        Hello
+        </document>
+        </documents>
     """
     if not docs:
         return "<documents></documents>"
-    formatted = "\n".join(_format_doc(doc) for doc in docs)
+    keys = tuple(metadata_keys) if metadata_keys is not None else None
+    if token_budget is None:
+        formatted = "\n".join(_format_doc(doc, keys) for doc in docs)
+    else:
+        # Account for the enclosing tags and the newline before every fragment.
+        remaining = token_budget - count_tokens("<documents>\n\n</documents>")
+        parts = []
+        for doc in docs:
+            if remaining <= 0:
+                break
+            fragment = _format_doc(doc, keys)
+            tokens = count_tokens(fragment) + 1
+            if tokens > remaining:
+                if remaining < min_trimmed_tokens:
+                    continue
+                trimmed = _trim_to_budget(doc, keys, remaining - 1, count_tokens)
+                if trimmed is None:
+                    continue
+                fragment, tokens = trimmed, count_tokens(trimmed) + 1
+            parts.append(fragment)
+            remaining -= tokens
+        if not parts:
+            return "<documents></documents>"
+        formatted = "\n".join(parts)
     return f"""<documents>
 {formatted}
 </documents>"""
 
 
+# Environment settings that change how each provider's chat client is built.
+_CHAT_MODEL_ENV_SETTINGS = {
+    "anthropic": ("ANTHROPIC_API_KEY", "ANTHROPIC_API_URL", "ANTHROPIC_BASE_URL"),
+    "openai": ("OPENAI_API_KEY", "OPENAI_API_BASE", "OPENAI_BASE_URL"),
+    "fireworks": ("FIREWORKS_API_KEY", "FIREWORKS_API_BASE"),
+}
+
+CHAT_MODELS: Registry[BaseChatModel] = Registry(maxsize=16)
+"""Process-wide cache of chat model clients, keyed by model name and env settings."""
+
+
+def _build_chat_model(model: str, provider: str) -> BaseChatModel:
+    # `langchain` pulls in every chat model integration it knows about, so it is
+    # only imported once a chat model is actually needed.
+    from langchain.chat_models import init_chat_model
+
+    return init_chat_model(model, model_provider=provider)
+
+
 def load_chat_model(fully_specified_name: str) -> BaseChatModel:
     """Load a chat model from a fully specified name.
 
+    Models are shared across calls through `CHAT_MODELS`, so each model's client
+    and connection pool are only built once per set of credentials.
+
     Args:
         fully_specified_name (str): String in the format 'provider/model'.
     """
@@ -108,4 +213,15 @@ def load_chat_model(fully_specified_name: str) -> BaseChatModel:
     else:
         provider = ""
         model = fully_specified_name
-    return init_chat_model(model, model_provider=provider)
+    key = (
+        fully_specified_name,
+        env_fingerprint(_CHAT_MODEL_ENV_SETTINGS.get(provider, ())),
+    )
+
+    def build() -> BaseChatModel:
+        with METRICS.timer(
+            "client_build_seconds", kind="chat_model", model=fully_specified_name
+        ):
+            return _build_chat_model(model, provider)
+
+    return CHAT_MODELS.get_or_create(key, build)
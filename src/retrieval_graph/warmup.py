@@ -0,0 +1,129 @@
+"""Build, and optionally connect, the model clients before the first request.
+
+Chat models and text encoders are cached per process (see `load_chat_model` and
+`make_text_encoder`), so building them once at server start moves the cost of
+resolving provider integrations out of the first user's turn. With ``ping=True``,
+`awarm_up` also sends a minimal request through each client so that its HTTP
+connection pool already holds an open TLS connection.
+
+Set ``RETRIEVAL_GRAPH_WARM_UP=1`` to build the default models when the retrieval
+graph is loaded. With ``RETRIEVAL_GRAPH_WARM_UP=ping`` the clients are also pinged.
+Async clients keep their connections on the event loop that opened them, so the
+pings cannot run at import time. They start in the background on the server's loop
+when the first request arrives, and overlap with that request's retrieval.
+
+Functions:
+    warm_up: Build the clients for the given models.
+    awarm_up: Build the clients and optionally open their connections.
+    schedule_warm_up: Start `awarm_up` in the background, once per event loop.
+"""
+
+import asyncio
+import logging
+import weakref
+from dataclasses import fields
+from typing import Any, Optional, Sequence
+
+from retrieval_graph import retrieval
+from retrieval_graph.configuration import Configuration
+from retrieval_graph.utils import load_chat_model
+
+logger = logging.getLogger(__name__)
+
+_warmed_loops: weakref.WeakSet[asyncio.AbstractEventLoop] = weakref.WeakSet()
+_tasks: set[asyncio.Task[None]] = set()
+
+
+def _default(name: str) -> Any:
+    return next(f.default for f in fields(Configuration) if f.name == name)
+
+
+def _chat_model_names(chat_models: Optional[Sequence[str]]) -> list[str]:
+    if chat_models is not None:
+        return list(chat_models)
+    return list(dict.fromkeys([_default("query_model"), _default("response_model")]))
+
+
+def _embedding_model_names(embedding_models: Optional[Sequence[str]]) -> list[str]:
+    if embedding_models is not None:
+        return list(embedding_models)
+    return [_default("embedding_model")]
+
+
+def warm_up(
+    chat_models: Optional[Sequence[str]] = None,
+    embedding_models: Optional[Sequence[str]] = None,
+) -> None:
+    """Build the clients for the given models, defaulting to the configured defaults.
+
+    Failures are logged rather than raised, since a missing credential should not
+    prevent the server from starting.
+
+    Args:
+        chat_models (Optional[Sequence[str]]): Fully specified chat model names.
+        embedding_models (Optional[Sequence[str]]): Fully specified embedding model names.
+    """
+    for name in _chat_model_names(chat_models):
+        try:
+            load_chat_model(name)
+        except Exception:
+            logger.warning("Could not warm up chat model %s.", name, exc_info=True)
+    for name in _embedding_model_names(embedding_models):
+        try:
+            retrieval.make_text_encoder(name)
+        except Exception:
+            logger.warning("Could not warm up text encoder %s.", name, exc_info=True)
+
+
+async def awarm_up(
+    chat_models: Optional[Sequence[str]] = None,
+    embedding_models: Optional[Sequence[str]] = None,
+    *,
+    ping: bool = False,
+) -> None:
+    """Build the clients for the given models and optionally open their connections.
+
+    Args:
+        chat_models (Optional[Sequence[str]]): Fully specified chat model names.
+        embedding_models (Optional[Sequence[str]]): Fully specified embedding model names.
+        ping (bool): Send a one-token completion and a one-word embedding through
+            each client to establish its connection.
+    """
+    chat_names = _chat_model_names(chat_models)
+    embedding_names = _embedding_model_names(embedding_models)
+    await asyncio.to_thread(warm_up, chat_names, embedding_names)
+    if not ping:
+        return
+
+    async def ping_chat_model(name: str) -> None:
+        await load_chat_model(name).ainvoke("ping", max_tokens=1)
+
+    async def ping_encoder(name: str) -> None:
+        await retrieval.make_text_encoder(name).aembed_query("ping")
+
+    results = await asyncio.gather(
+        *(ping_chat_model(name) for name in chat_names),
+        *(ping_encoder(name) for name in embedding_names),
+        return_exceptions=True,
+    )
+    for name, result in zip([*chat_names, *embedding_names], results):
+        if isinstance(result, Exception):
+            logger.warning("Could not connect to %s: %s", name, result)
+
+
+def schedule_warm_up(*, ping: bool = True) -> None:
+    """Start `awarm_up` in the background on the running loop, once per loop.
+
+    Must be called from a coroutine. It returns immediately, so the caller's
+    request is not delayed by the warm-up.
+
+    Args:
+        ping (bool): Also open each client's connection, see `awarm_up`.
+    """
+    loop = asyncio.get_running_loop()
+    if loop in _warmed_loops:
+        return
+    _warmed_loops.add(loop)
+    task = loop.create_task(awarm_up(ping=ping))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
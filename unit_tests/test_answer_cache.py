@@ -0,0 +1,24 @@
+from langchain_core.documents import Document
+
+from retrieval_graph.answer_cache import SemanticAnswerCache
+
+
+def test_answer_cache_threshold_scope_and_ttl() -> None:
+    cache = SemanticAnswerCache(max_entries_per_scope=2)
+    sources = [Document(page_content="cats")]
+
+    assert cache.lookup(("u", ""), "q", [1.0, 0.0], threshold=0.9, ttl=60) is None
+    cache.store(("u", ""), "q", "answer", sources)
+
+    hit = cache.lookup(("u", ""), "q?", [0.99, 0.05], threshold=0.9, ttl=60)
+    assert hit is not None and hit.answer == "answer" and hit.sources == sources
+    assert cache.lookup(("u", ""), "z", [0.0, 1.0], threshold=0.9, ttl=60) is None
+    assert cache.lookup(("v", ""), "q", [1.0, 0.0], threshold=0.9, ttl=60) is None
+    assert cache.lookup(("u", ""), "q", [1.0, 0.0], threshold=0.9, ttl=0) is None
+
+    stats = cache.stats()
+    assert (stats.hits, stats.misses) == (1, 4)
+
+    cache.store(("u", ""), "q", "answer", sources)
+    cache.invalidate_user("u")
+    assert cache.lookup(("u", ""), "q", [1.0, 0.0], threshold=0.9, ttl=60) is None
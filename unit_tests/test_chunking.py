@@ -0,0 +1,71 @@
+import asyncio
+
+from langchain_core.documents import Document
+
+from retrieval_graph import chunking
+from retrieval_graph.ledger import document_id, upsert_id
+from retrieval_graph.utils import approximate_token_count
+
+LONG_TEXT = "\n\n".join(
+    f"Paragraph {i}. " + "Cats swim in their water bowls. " * 12 for i in range(40)
+)
+
+
+def test_long_documents_are_split_with_parent_ids() -> None:
+    short = Document(page_content="short", metadata={"source": "a.txt"})
+    long = Document(page_content=LONG_TEXT, metadata={"source": "b.txt"})
+
+    chunks = chunking.chunk_documents(
+        [short, long], "u", chunk_size=128, chunk_overlap=16
+    )
+
+    assert chunks[0].metadata == {
+        "source": "a.txt",
+        "user_id": "u",
+        "id": document_id("u", short),
+    }
+    parts = chunks[1:]
+    assert len(parts) > 1
+    assert all(approximate_token_count(c.page_content) <= 128 for c in parts)
+    assert {c.metadata["parent_id"] for c in parts} == {document_id("u", long)}
+    assert [c.metadata["chunk_index"] for c in parts] == list(range(len(parts)))
+    assert len({c.metadata["id"] for c in parts}) == len(parts)
+    again = chunking.chunk_documents([long], "u", chunk_size=128, chunk_overlap=16)
+    assert [c.metadata["id"] for c in again] == [c.metadata["id"] for c in parts]
+
+
+def test_caller_ids_are_scoped_to_their_user() -> None:
+    doc = Document(page_content=LONG_TEXT, metadata={"id": "a"})
+    ids = {
+        user_id: {
+            c.metadata["id"]
+            for c in chunking.chunk_documents(
+                [doc], user_id, chunk_size=128, keep_ids=True
+            )
+        }
+        for user_id in ("u1", "u2")
+    }
+    assert ids["u1"] and ids["u2"] and not ids["u1"] & ids["u2"]
+    (short,) = chunking.chunk_documents(
+        [Document(page_content="x", metadata={"id": "a"})],
+        "u1",
+        chunk_size=128,
+        keep_ids=True,
+    )
+    assert short.metadata["id"] == upsert_id("u1", "a")
+    assert short.metadata["external_id"] == "a"
+
+
+def test_large_batches_are_split_in_worker_processes(monkeypatch) -> None:
+    monkeypatch.setattr(chunking, "PROCESS_POOL_MIN_CHARS", 0)
+    monkeypatch.setenv("RETRIEVAL_CHUNK_WORKERS", "2")
+    docs = [Document(page_content=LONG_TEXT, metadata={"n": n}) for n in range(4)]
+
+    chunks = asyncio.run(
+        chunking.achunk_documents(docs, "u", chunk_size=128, chunk_overlap=16)
+    )
+
+    assert chunks == chunking.chunk_documents(
+        docs, "u", chunk_size=128, chunk_overlap=16
+    )
+    chunking._shutdown_process_pool()
@@ -0,0 +1,41 @@
+import asyncio
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from retrieval_graph.diversity import adiversify
+
+VECTORS = {
+    "cats swim": [1.0, 0.0],
+    "cats swim!": [1.0, 0.01],
+    "cats purr": [0.8, 0.6],
+}
+
+
+class TableEmbeddings(Embeddings):
+    def __init__(self) -> None:
+        self.embedded: list[str] = []
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.embedded.extend(texts)
+        return [VECTORS[text] for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return VECTORS[text]
+
+
+def test_adiversify_drops_near_duplicates_and_reuses_vectors() -> None:
+    embeddings = TableEmbeddings()
+    ranking = [
+        Document(page_content="cats swim"),
+        Document(page_content="cats swim!", metadata={"embedding": [1.0, 0.01]}),
+        Document(page_content="cats purr"),
+    ]
+
+    [reranked] = asyncio.run(
+        adiversify([ranking], ["cats swim"], embeddings, k=2, lambda_mult=0.3)
+    )
+
+    assert [doc.page_content for doc in reranked] == ["cats swim", "cats purr"]
+    assert sorted(embeddings.embedded) == ["cats purr", "cats swim"]
+    assert all("embedding" not in doc.metadata for doc in reranked)
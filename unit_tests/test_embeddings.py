@@ -0,0 +1,195 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from retrieval_graph.embeddings import BatchingEmbeddings, CachedEmbeddings
+
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    calls: list[list[str]] = []
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.calls.append(list(texts))
+        return super().embed_documents(texts)
+
+
+class AsymmetricEmbedding(DeterministicFakeEmbedding):
+    def embed_query(self, text: str) -> list[float]:
+        return super().embed_query("query: " + text)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return self.embed_query(text)
+
+
+class QueryCountingEmbedding(AsymmetricEmbedding):
+    calls: list[list[str]] = []
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        self.calls.append(list(texts))
+        return [self.embed_query(text) for text in texts]
+
+    async def aembed_queries(self, texts: list[str]) -> list[list[float]]:
+        return self.embed_queries(texts)
+
+
+def test_cached_embeddings_persist_across_instances(tmp_path) -> None:
+    path = str(tmp_path / "embeddings.sqlite")
+    encoder = CountingEmbedding(size=8)
+    encoder.calls = []
+
+    cache = CachedEmbeddings(encoder, "fake/model", path=path)
+    vectors = cache.embed_documents_array(["a", "b", "a"])
+    assert vectors.dtype == np.float32 and vectors.shape == (3, 8)
+    assert encoder.calls == [["a", "b"]]
+    assert cache.embed_query("b") == vectors[1].tolist()
+    cache.close()
+
+    reopened = CachedEmbeddings(encoder, "fake/model", path=path)
+    assert asyncio.run(reopened.aembed_documents(["a", "c"]))[0] == vectors[0].tolist()
+    assert encoder.calls == [["a", "b"], ["c"]]
+    reopened.close()
+
+
+def test_cached_embeddings_respect_byte_caps(tmp_path) -> None:
+    encoder = CountingEmbedding(size=8)
+    cache = CachedEmbeddings(
+        encoder,
+        "fake/model",
+        path=str(tmp_path / "embeddings.sqlite"),
+        max_memory_bytes=64,
+        max_disk_bytes=256,
+    )
+    cache.embed_documents([str(i) for i in range(20)])
+    assert cache._memory_bytes <= 64
+    assert cache._disk_bytes <= 256
+    cache.close()
+
+
+def test_cached_embeddings_keep_queries_apart_from_documents() -> None:
+    encoder = AsymmetricEmbedding(size=8)
+    cache = CachedEmbeddings(encoder, "fake/model")
+    document = cache.embed_documents(["a"])[0]
+    query = encoder.embed_query("a")
+    assert np.allclose(cache.embed_query("a"), query)
+    assert not np.allclose(query, document)
+    assert np.allclose(asyncio.run(cache.aembed_query("a")), query)
+    assert cache.embed_documents(["a"])[0] == document
+
+
+def test_batching_embeddings_coalesce_concurrent_queries() -> None:
+    encoder = QueryCountingEmbedding(size=8)
+    encoder.calls = []
+    batcher = BatchingEmbeddings(encoder, max_batch_size=3, max_wait=0.05)
+
+    async def main() -> list[list[float]]:
+        return await asyncio.gather(
+            *(batcher.aembed_query(text) for text in ["a", "b", "a", "c", "d"])
+        )
+
+    vectors = asyncio.run(main())
+    assert encoder.calls == [["a", "b", "c"], ["d"]]
+    assert vectors[0] == vectors[2] == encoder.embed_query("a")
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        assert list(pool.map(batcher.embed_query, ["x", "y"])) == [
+            encoder.embed_query("x"),
+            encoder.embed_query("y"),
+        ]
+
+
+def test_batching_embeddings_propagate_errors() -> None:
+    class FailingEmbedding(DeterministicFakeEmbedding):
+        async def aembed_query(self, text: str) -> list[float]:
+            raise RuntimeError("rate limited")
+
+    batcher = BatchingEmbeddings(FailingEmbedding(size=8), max_wait=0.01)
+
+    async def main() -> list:
+        return await asyncio.gather(
+            batcher.aembed_query("a"), batcher.aembed_query("b"), return_exceptions=True
+        )
+
+    errors = asyncio.run(main())
+    assert [str(error) for error in errors] == ["rate limited", "rate limited"]
+
+
+def test_batching_embeddings_release_callers_when_the_batch_is_cancelled() -> None:
+    class HangingEmbedding(DeterministicFakeEmbedding):
+        async def aembed_query(self, text: str) -> list[float]:
+            await asyncio.Event().wait()
+            return []
+
+    batcher = BatchingEmbeddings(HangingEmbedding(size=8), max_wait=0)
+
+    async def main() -> list:
+        waiters = asyncio.gather(
+            batcher.aembed_query("a"), batcher.aembed_query("b"), return_exceptions=True
+        )
+        await asyncio.sleep(0.01)
+        for task in list(batcher._tasks):
+            task.cancel()
+        return await asyncio.wait_for(waiters, timeout=1)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, asyncio.CancelledError) for result in results)
+
+
+def test_batched_queries_get_query_vectors() -> None:
+    class CohereEmbeddings(DeterministicFakeEmbedding):
+        calls: list[tuple[list[str], str]] = []
+
+        def embed(self, texts: list[str], *, input_type: str) -> list[list[float]]:
+            self.calls.append((list(texts), input_type))
+            return [
+                DeterministicFakeEmbedding.embed_query(self, f"{input_type}: {text}")
+                for text in texts
+            ]
+
+        async def aembed(
+            self, texts: list[str], *, input_type: str
+        ) -> list[list[float]]:
+            return self.embed(texts, input_type=input_type)
+
+        def embed_query(self, text: str) -> list[float]:
+            return self.embed([text], input_type="search_query")[0]
+
+        def embed_documents(self, texts: list[str]) -> list[list[float]]:
+            return self.embed(texts, input_type="search_document")
+
+    cohere = CohereEmbeddings(size=8)
+    for encoder in (cohere, AsymmetricEmbedding(size=8)):
+        query = encoder.embed_query("a")
+        assert not np.allclose(query, encoder.embed_documents(["a"])[0])
+        for wrapped in (encoder, CachedEmbeddings(encoder, "fake/model")):
+            batcher = BatchingEmbeddings(wrapped, max_wait=0.01)
+
+            async def main() -> list[list[float]]:
+                return await asyncio.gather(
+                    batcher.aembed_query("a"), batcher.aembed_query("b")
+                )
+
+            assert np.allclose(asyncio.run(main())[0], query)
+            assert np.allclose(batcher.embed_query("a"), query)
+    assert (["a", "b"], "search_query") in cohere.calls
+
+
+def test_encoders_built_before_metrics_are_enabled_are_timed(monkeypatch) -> None:
+    from retrieval_graph import retrieval
+    from retrieval_graph.metrics import METRICS
+
+    monkeypatch.setattr(
+        retrieval, "_build_text_encoder", lambda _: DeterministicFakeEmbedding(size=8)
+    )
+    retrieval.TEXT_ENCODERS.invalidate()
+    encoder = retrieval.make_text_encoder("fake/model")
+    METRICS.enable()
+    try:
+        retrieval.make_text_encoder("fake/model").embed_query("a")
+        assert retrieval.make_text_encoder("fake/model") is encoder
+        assert "retrieval_graph_embedding_seconds_count" in METRICS.render_prometheus()
+    finally:
+        METRICS.disable()
+        METRICS.reset()
+        retrieval.TEXT_ENCODERS.invalidate()
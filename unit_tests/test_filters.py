@@ -0,0 +1,39 @@
+import pytest
+
+from retrieval_graph.filters import FILTER_PLANS, compile_filter_plan
+
+
+def test_filter_plans_are_cached_and_never_mutate_the_caller() -> None:
+    FILTER_PLANS.invalidate()
+    search_kwargs = {"k": 3, "filter": [{"term": {"metadata.lang": "en"}}]}
+
+    plan = compile_filter_plan("elastic", "u1", search_kwargs)
+    assert compile_filter_plan("elastic", "u1", search_kwargs) is plan
+    assert search_kwargs == {"k": 3, "filter": [{"term": {"metadata.lang": "en"}}]}
+
+    first = plan.search_kwargs()
+    first["filter"].append({"term": {"metadata.user_id": "someone-else"}})
+    assert plan.search_kwargs() == {
+        "k": 3,
+        "filter": [
+            {"term": {"metadata.lang": "en"}},
+            {"term": {"metadata.user_id.keyword": "u1"}},
+        ],
+    }
+    FILTER_PLANS.invalidate()
+
+
+@pytest.mark.parametrize(
+    ("provider", "search_kwargs", "expected"),
+    [
+        ("pinecone", {"filter": {"user_id": "u2"}}, {"filter": {"user_id": "u1"}}),
+        ("local", {}, {"filter": {"user_id": "u1"}}),
+        ("mongodb", {}, {"pre_filter": {"user_id": {"$eq": "u1"}}}),
+    ],
+)
+def test_tenant_filter_always_wins(
+    provider: str, search_kwargs: dict, expected: dict
+) -> None:
+    assert (
+        compile_filter_plan(provider, "u1", search_kwargs).search_kwargs() == expected
+    )
@@ -0,0 +1,16 @@
+from langchain_core.documents import Document
+
+from retrieval_graph.fusion import reciprocal_rank_fusion
+
+
+def test_rrf_dedupes_weights_and_truncates() -> None:
+    a = Document(page_content="a", metadata={"id": "1"})
+    a_again = Document(page_content="a (other chunk copy)", metadata={"id": "1"})
+    b = Document(page_content="b")
+    c = Document(page_content="c")
+
+    fused = reciprocal_rank_fusion([[a, b], [a_again, c]], k=1)
+    assert [doc.page_content for doc in fused] == ["a", "b", "c"]
+
+    fused = reciprocal_rank_fusion([[a, b], [c]], weights=[1.0, 5.0], k=1, top_n=2)
+    assert [doc.page_content for doc in fused] == ["c", "a"]
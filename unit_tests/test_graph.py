@@ -0,0 +1,88 @@
+import asyncio
+import importlib
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.vectorstores import InMemoryVectorStore, VectorStoreRetriever
+
+from retrieval_graph import retrieval
+from retrieval_graph.answer_cache import SemanticAnswerCache
+from retrieval_graph.metrics import Metrics
+
+graph_module = importlib.import_module("retrieval_graph.graph")
+
+
+def test_sources_are_sent_before_the_answer_streams(monkeypatch) -> None:
+    store = InMemoryVectorStore(DeterministicFakeEmbedding(size=8))
+    store.add_documents([Document("cats purr", metadata={"source": "cats.md"})])
+
+    @contextmanager
+    def fake_make_retriever(config: Any) -> Iterator[VectorStoreRetriever]:
+        yield store.as_retriever()
+
+    monkeypatch.setattr(retrieval, "make_retriever", fake_make_retriever)
+    monkeypatch.setattr(
+        graph_module,
+        "load_chat_model",
+        lambda name: GenericFakeChatModel(messages=iter([AIMessage("they purr")])),
+    )
+
+    async def main() -> list[dict[str, Any]]:
+        return [
+            event
+            async for event in graph_module.graph.astream_events(
+                {"messages": [("user", "do cats purr?")]},
+                {"configurable": {"user_id": "u"}},
+                version="v2",
+            )
+            if event["event"] in ("on_custom_event", "on_chat_model_stream")
+        ]
+
+    events = asyncio.run(main())
+    assert events[0]["name"] == graph_module.SOURCES_EVENT
+    assert events[0]["data"]["sources"][0]["source"] == "cats.md"
+    tokens = [event["data"]["chunk"].content for event in events[1:]]
+    assert len(tokens) > 1 and "".join(tokens) == "they purr"
+
+
+def test_answer_cache_hits_report_the_saved_latency(monkeypatch) -> None:
+    store = InMemoryVectorStore(DeterministicFakeEmbedding(size=8))
+    metrics = Metrics()
+    metrics.enable()
+
+    @contextmanager
+    def fake_make_retriever(config: Any) -> Iterator[VectorStoreRetriever]:
+        yield store.as_retriever()
+
+    monkeypatch.setattr(retrieval, "make_retriever", fake_make_retriever)
+    monkeypatch.setattr(
+        retrieval, "_build_text_encoder", lambda _: DeterministicFakeEmbedding(size=8)
+    )
+    retrieval.TEXT_ENCODERS.invalidate()
+    monkeypatch.setattr(graph_module, "METRICS", metrics)
+    monkeypatch.setattr(graph_module, "ANSWER_CACHE", SemanticAnswerCache())
+    monkeypatch.setattr(
+        graph_module,
+        "load_chat_model",
+        lambda name: GenericFakeChatModel(messages=iter([AIMessage("they purr")])),
+    )
+
+    async def ask() -> Any:
+        return await graph_module.graph.ainvoke(
+            {"messages": [("user", "do cats purr?")]},
+            {"configurable": {"user_id": "u", "answer_cache": True}},
+        )
+
+    asyncio.run(ask())
+    assert asyncio.run(ask())["cache_hit"]
+    saved = [
+        float(line.split()[-1])
+        for line in metrics.render_prometheus().splitlines()
+        if line.startswith("retrieval_graph_answer_cache_saved_seconds_total")
+    ]
+    assert len(saved) == 1 and saved[0] > 0
+    retrieval.TEXT_ENCODERS.invalidate()
@@ -0,0 +1,39 @@
+import asyncio
+import importlib
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+
+from retrieval_graph.state import State
+
+graph_module = importlib.import_module("retrieval_graph.graph")
+
+
+def test_trim_history_summarizes_dropped_messages(monkeypatch) -> None:
+    monkeypatch.setattr(
+        graph_module,
+        "load_chat_model",
+        lambda name: FakeListChatModel(responses=["the user likes cats"]),
+    )
+    messages = []
+    for turn in range(10):
+        messages += [HumanMessage(f"question {turn} " * 20), AIMessage("answer " * 20)]
+    messages.append(HumanMessage("last question"))
+    config = {
+        "configurable": {
+            "user_id": "u",
+            "history_token_budget": 200,
+            "history_summary": True,
+        }
+    }
+
+    update = asyncio.run(
+        graph_module.trim_history(State(messages=messages), config=config)
+    )
+    assert update["summary"] == "the user likes cats"
+    window = messages[update["history_start"] :]
+    assert isinstance(window[0], HumanMessage) and window[-1] is messages[-1]
+    assert graph_module.history_tokens(window) <= 100
+
+    state = State(messages=messages, **update)
+    assert asyncio.run(graph_module.trim_history(state, config=config)) == {}
@@ -0,0 +1,48 @@
+import json
+import os
+import subprocess
+import sys
+
+# Seconds `import retrieval_graph` may take in a fresh interpreter.
+IMPORT_BUDGET = float(os.environ.get("RETRIEVAL_GRAPH_IMPORT_BUDGET", "0.25"))
+
+
+def _import_in_subprocess(statement: str) -> dict:
+    script = f"""
+import json, sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"elapsed": elapsed, "modules": sorted(sys.modules)}}))
+"""
+    output = subprocess.run(
+        [sys.executable, "-c", script],
+        capture_output=True,
+        check=True,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+        text=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def test_package_import_is_within_budget() -> None:
+    result = _import_in_subprocess("import retrieval_graph")
+    assert result["elapsed"] < IMPORT_BUDGET
+    assert "langchain_core" not in result["modules"]
+    assert "langgraph" not in result["modules"]
+
+
+def test_index_graph_does_not_import_retrieval_graph() -> None:
+    result = _import_in_subprocess("from retrieval_graph import index_graph")
+    assert "retrieval_graph.graph" not in result["modules"]
+    assert "langchain.chat_models" not in result["modules"]
+
+
+def test_graph_attributes_survive_submodule_imports() -> None:
+    result = _import_in_subprocess(
+        "import retrieval_graph.graph, retrieval_graph.index_graph\n"
+        "from retrieval_graph import graph, index_graph\n"
+        "assert graph.name == 'RetrievalGraph', graph\n"
+        "assert not isinstance(index_graph, type(sys))"
+    )
+    assert "retrieval_graph.graph" in result["modules"]
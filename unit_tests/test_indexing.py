@@ -0,0 +1,223 @@
+import asyncio
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from retrieval_graph import indexing
+from retrieval_graph.ledger import RecordLedger, document_id
+
+
+class FlakyStore(InMemoryVectorStore):
+    failures: int = 1
+
+    async def aadd_documents(self, documents, **kwargs):  # type: ignore[no-untyped-def]
+        if len(documents) == 2 and self.failures:
+            self.failures -= 1
+            raise ConnectionError("transient")
+        return await super().aadd_documents(documents, **kwargs)
+
+
+def test_index_in_batches_retries_and_reports(monkeypatch) -> None:
+    sleep = asyncio.sleep
+    monkeypatch.setattr(asyncio, "sleep", lambda _: sleep(0))
+    store = FlakyStore(DeterministicFakeEmbedding(size=4))
+    docs = [Document(page_content=str(i)) for i in range(5)]
+
+    summary = asyncio.run(
+        indexing.index_in_batches(
+            store.as_retriever(),
+            docs,
+            batch_size=2,
+            max_in_flight=2,
+            max_retries=1,
+        )
+    )
+
+    assert (summary.indexed, summary.failed, summary.batches) == (5, 0, 3)
+    assert len(store.store) == 5
+
+
+def test_index_in_batches_retries_after_write_without_rewriting(monkeypatch) -> None:
+    sleep = asyncio.sleep
+    monkeypatch.setattr(asyncio, "sleep", lambda _: sleep(0))
+    store = FlakyStore(DeterministicFakeEmbedding(size=4))
+    store.failures = 0
+    writes: list[int] = []
+    add_documents = store.aadd_documents
+
+    async def counting_add(documents, **kwargs):  # type: ignore[no-untyped-def]
+        writes.append(len(documents))
+        return await add_documents(documents, **kwargs)
+
+    async def after_write(batch: list[Document]) -> None:
+        raise ConnectionError("transient")
+
+    monkeypatch.setattr(store, "aadd_documents", counting_add)
+    summary = asyncio.run(
+        indexing.index_in_batches(
+            store.as_retriever(),
+            [Document(page_content=str(i), metadata={"id": str(i)}) for i in range(3)],
+            batch_size=3,
+            max_in_flight=1,
+            max_retries=2,
+            after_write=after_write,
+        )
+    )
+
+    assert writes == [3]
+    assert (summary.indexed, summary.failed, summary.failed_batches) == (0, 3, 1)
+
+
+def test_document_ids_and_ledger(tmp_path) -> None:
+    doc = Document(page_content="hello", metadata={"source": "a.txt"})
+    assert document_id("u1", doc) == document_id("u1", doc)
+    assert document_id("u1", doc) != document_id("u2", doc)
+
+    ledger = RecordLedger(str(tmp_path / "ledger.sqlite"))
+    ledger.record(
+        "u1", [("id-1", "a.txt", "id-1"), ("id-2", "b.txt", "id-2")], run_id="run-1"
+    )
+    assert ledger.touch_existing("u1", ["id-1", "id-3"], run_id="run-2") == {"id-1"}
+    assert ledger.stale("u1", "run-2", sources=["a.txt"]) == []
+    assert ledger.stale("u1", "run-2") == ["id-2"]
+    assert ledger.stale("u2", "run-2") == []
+    ledger.close()
+
+
+def test_index_graph_upserts_and_deletes(monkeypatch, tmp_path) -> None:
+    from retrieval_graph import retrieval
+    from retrieval_graph.index_graph import graph as index_graph
+
+    monkeypatch.setenv("LOCAL_VECTORSTORE_PATH", str(tmp_path))
+    monkeypatch.setattr(
+        retrieval, "_build_text_encoder", lambda _: DeterministicFakeEmbedding(size=8)
+    )
+    retrieval.TEXT_ENCODERS.invalidate()
+
+    def run(user_id: str, **state):  # type: ignore[no-untyped-def]
+        config = {
+            "configurable": {
+                "user_id": user_id,
+                "retriever_provider": "local",
+                "chunk_size": 8,
+                "chunk_overlap": 0,
+            }
+        }
+        return asyncio.run(index_graph.ainvoke(state, config))["summary"]
+
+    long_text = " ".join(f"word{i}" for i in range(40))
+    assert (
+        run(
+            "u",
+            docs=[{"page_content": long_text, "metadata": {"id": "a"}}],
+            upsert=True,
+        ).indexed
+        > 1
+    )
+    summary = run(
+        "u", docs=[{"page_content": "short", "metadata": {"id": "a"}}], upsert=True
+    )
+    assert summary.indexed == 1 and summary.replaced > 1
+    run(
+        "v",
+        docs=[
+            {"page_content": "other", "metadata": {"id": "b"}},
+            {"page_content": "v's own a", "metadata": {"id": "a"}},
+        ],
+        upsert=True,
+    )
+
+    assert run("u", delete_ids=["b"]).removed == 0
+    assert run("u", delete_ids=["a"]).removed == 1
+    assert run("v", delete_all=True).removed == 2
+    retrieval.VECTOR_STORES.invalidate()
+    retrieval.TEXT_ENCODERS.invalidate()
+
+
+def test_deletes_keep_the_ledger_in_sync(monkeypatch, tmp_path) -> None:
+    from retrieval_graph import retrieval
+    from retrieval_graph.index_graph import graph as index_graph
+    from retrieval_graph.local_store import LocalVectorStore
+
+    monkeypatch.setenv("LOCAL_VECTORSTORE_PATH", str(tmp_path / "store"))
+    monkeypatch.setattr(
+        retrieval, "_build_text_encoder", lambda _: DeterministicFakeEmbedding(size=8)
+    )
+    retrieval.TEXT_ENCODERS.invalidate()
+    config = {
+        "configurable": {
+            "user_id": "u",
+            "retriever_provider": "local",
+            "record_ledger_path": str(tmp_path / "ledger.sqlite"),
+            "chunk_size": 8,
+            "chunk_overlap": 0,
+        }
+    }
+    doc = Document(page_content=" ".join(f"word{i}" for i in range(40)))
+
+    def run(**state):  # type: ignore[no-untyped-def]
+        return asyncio.run(index_graph.ainvoke(state, config))["summary"]
+
+    indexed = run(docs=[doc]).indexed
+    assert indexed > 1
+    assert run(delete_ids=[document_id("u", doc)]).removed == indexed
+    summary = run(docs=[doc])
+    assert (summary.indexed, summary.skipped) == (indexed, 0)
+
+    config["configurable"]["index_cleanup"] = "full"
+    assert run(delete_ids=["nonexistent"]).removed == 0
+    summary = run(docs=[doc])
+    assert (summary.indexed, summary.skipped, summary.deleted) == (0, indexed, 0)
+
+    def unscoped(self):  # type: ignore[no-untyped-def]
+        raise AssertionError("cleanup must only touch the user's partition")
+
+    monkeypatch.setattr(LocalVectorStore, "_all_partitions", unscoped)
+    summary = run(docs=[Document(page_content="replacement")])
+    assert (summary.indexed, summary.deleted) == (1, indexed)
+    retrieval.VECTOR_STORES.invalidate()
+    retrieval.TEXT_ENCODERS.invalidate()
+
+
+def test_failed_upsert_keeps_the_stored_version(monkeypatch, tmp_path) -> None:
+    from retrieval_graph import retrieval
+    from retrieval_graph.index_graph import graph as index_graph
+    from retrieval_graph.local_store import LocalVectorStore
+
+    monkeypatch.setenv("LOCAL_VECTORSTORE_PATH", str(tmp_path))
+    monkeypatch.setattr(
+        retrieval, "_build_text_encoder", lambda _: DeterministicFakeEmbedding(size=8)
+    )
+    retrieval.TEXT_ENCODERS.invalidate()
+    config = {
+        "configurable": {
+            "user_id": "u",
+            "retriever_provider": "local",
+            "chunk_size": 8,
+            "chunk_overlap": 0,
+            "index_max_retries": 0,
+        }
+    }
+    long_text = " ".join(f"word{i}" for i in range(40))
+
+    def upsert(text: str):  # type: ignore[no-untyped-def]
+        state = {
+            "docs": [{"page_content": text, "metadata": {"id": "a"}}],
+            "upsert": True,
+        }
+        return asyncio.run(index_graph.ainvoke(state, config))["summary"]
+
+    stored = upsert(long_text).indexed
+
+    def fail(*args, **kwargs):  # type: ignore[no-untyped-def]
+        raise ConnectionError("transient")
+
+    monkeypatch.setattr(LocalVectorStore, "add_texts", fail)
+    summary = upsert("short")
+
+    assert (summary.indexed, summary.failed, summary.replaced) == (0, 1, 0)
+    deleted = asyncio.run(index_graph.ainvoke({"delete_ids": ["a"]}, config))
+    assert deleted["summary"].removed == stored > 1
+    retrieval.VECTOR_STORES.invalidate()
+    retrieval.TEXT_ENCODERS.invalidate()
@@ -0,0 +1,53 @@
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from retrieval_graph.local_store import LocalVectorStore
+
+
+def test_local_store_isolates_users_and_persists(tmp_path) -> None:
+    embedding = DeterministicFakeEmbedding(size=16)
+    store = LocalVectorStore(str(tmp_path), embedding)
+    store.add_texts(
+        ["cats", "dogs", "cats"],
+        [{"user_id": "a"}, {"user_id": "a"}, {"user_id": "b"}],
+        ids=["1", "2", "3"],
+    )
+    store.add_texts(["birds"], [{"user_id": "a"}], ids=["4"])
+
+    hits = store.similarity_search_with_score("cats", k=2, filter={"user_id": "a"})
+    assert [doc.id for doc, _ in hits][0] == "1"
+    assert hits[0][1] == pytest.approx(1.0, abs=1e-5)
+    assert {doc.id for doc, _ in hits} <= {"1", "2", "4"}
+
+    store.delete(["1"], user_id="b")
+    store.delete(["1"], user_id="a")
+    store.add_texts(["dogs v2"], [{"user_id": "a"}], ids=["2"])
+
+    reopened = LocalVectorStore(str(tmp_path), embedding)
+    docs = reopened.similarity_search("cats", k=10, filter={"user_id": "a"})
+    assert sorted(doc.page_content for doc in docs) == ["birds", "dogs v2"]
+    assert [
+        doc.id for doc in reopened.similarity_search("x", filter={"user_id": "b"})
+    ] == ["3"]
+
+    with pytest.raises(ValueError):
+        reopened.similarity_search("cats")
+
+
+def test_local_store_keeps_a_re_added_id_after_reload(tmp_path) -> None:
+    embedding = DeterministicFakeEmbedding(size=16)
+    store = LocalVectorStore(str(tmp_path), embedding)
+    store.add_texts(["x"], [{"user_id": "a"}], ids=["x"])
+    store.delete(["x"], user_id="a")
+    store.add_texts(["x again"], [{"user_id": "a"}], ids=["x"])
+
+    reopened = LocalVectorStore(str(tmp_path), embedding)
+    docs = reopened.similarity_search("x", k=10, filter={"user_id": "a"})
+    assert [(doc.id, doc.page_content) for doc in docs] == [("x", "x again")]
+    assert reopened.delete(["x"], user_id="a")
+    assert (
+        LocalVectorStore(str(tmp_path), embedding).similarity_search(
+            "x", filter={"user_id": "a"}
+        )
+        == []
+    )
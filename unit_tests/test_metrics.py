@@ -0,0 +1,27 @@
+from retrieval_graph.metrics import Metrics
+
+
+def test_disabled_metrics_record_nothing() -> None:
+    metrics = Metrics()
+    with metrics.timer("vector_search_seconds", provider="local"):
+        pass
+    metrics.increment("documents_indexed_total", 3)
+    assert metrics.render_prometheus() == ""
+
+
+def test_prometheus_export() -> None:
+    metrics = Metrics(buckets=(0.1, 1.0))
+    metrics.enable()
+    metrics.observe("llm_seconds", 0.5, model="openai/gpt-4o", node="respond")
+    metrics.increment("documents_indexed_total", 3, provider='local "disk"')
+
+    text = metrics.render_prometheus()
+    assert "# TYPE retrieval_graph_llm_seconds histogram" in text
+    labels = 'model="openai/gpt-4o",node="respond"'
+    assert f'retrieval_graph_llm_seconds_bucket{{{labels},le="0.1"}} 0' in text
+    assert f'retrieval_graph_llm_seconds_bucket{{{labels},le="1.0"}} 1' in text
+    assert f'retrieval_graph_llm_seconds_bucket{{{labels},le="+Inf"}} 1' in text
+    assert f"retrieval_graph_llm_seconds_count{{{labels}}} 1" in text
+    assert (
+        'retrieval_graph_documents_indexed_total{provider="local \\"disk\\""} 3' in text
+    )
@@ -0,0 +1,77 @@
+from retrieval_graph import retrieval, utils
+from retrieval_graph.registry import Registry
+
+
+def test_registry_lru_eviction_and_counters() -> None:
+    evicted: list[str] = []
+    registry: Registry[str] = Registry(maxsize=2, on_evict=evicted.append)
+
+    assert registry.get_or_create("a", lambda: "A") == "A"
+    assert registry.get_or_create("b", lambda: "B") == "B"
+    assert registry.get_or_create("a", lambda: "unused") == "A"
+    registry.get_or_create("c", lambda: "C")
+
+    assert evicted == ["B"]
+    assert "a" in registry and "b" not in registry
+    stats = registry.stats()
+    assert (stats.hits, stats.misses, stats.evictions, stats.size) == (1, 3, 1, 2)
+
+    registry.invalidate("a")
+    assert evicted == ["B", "A"]
+    registry.invalidate()
+    assert len(registry) == 0
+
+
+def test_registry_closes_leased_values_after_release() -> None:
+    closed: list[str] = []
+    registry: Registry[str] = Registry(maxsize=1, on_evict=closed.append)
+
+    with registry.lease("a", lambda: "A") as value:
+        with registry.lease("a", lambda: "unused"):
+            registry.put("b", "B")
+        assert value == "A" and closed == []
+    assert closed == ["A"]
+    registry.invalidate()
+    assert closed == ["A", "B"]
+
+
+def test_registry_idle_eviction() -> None:
+    registry: Registry[int] = Registry(maxsize=4, idle_ttl=0)
+    registry.put("a", 1)
+    registry.evict_idle()
+    assert registry.get("a") is None
+
+
+def test_text_encoder_is_reused(monkeypatch) -> None:
+    built: list[str] = []
+
+    def fake_build(model: str):
+        built.append(model)
+        return object()
+
+    monkeypatch.setattr(retrieval, "_build_text_encoder", fake_build)
+    retrieval.TEXT_ENCODERS.invalidate()
+
+    first = retrieval.make_text_encoder("openai/text-embedding-3-small")
+    assert retrieval.make_text_encoder("openai/text-embedding-3-small") is first
+
+    monkeypatch.setenv("OPENAI_API_KEY", "rotated")
+    assert retrieval.make_text_encoder("openai/text-embedding-3-small") is not first
+    assert len(built) == 2
+    retrieval.TEXT_ENCODERS.invalidate()
+
+
+def test_chat_models_are_reused(monkeypatch) -> None:
+    built: list[tuple[str, str]] = []
+
+    def fake_build(model: str, provider: str):
+        built.append((model, provider))
+        return object()
+
+    monkeypatch.setattr(utils, "_build_chat_model", fake_build)
+    utils.CHAT_MODELS.invalidate()
+
+    first = utils.load_chat_model("anthropic/claude-3-haiku-20240307")
+    assert utils.load_chat_model("anthropic/claude-3-haiku-20240307") is first
+    assert built == [("claude-3-haiku-20240307", "anthropic")]
+    utils.CHAT_MODELS.invalidate()
@@ -0,0 +1,165 @@
+import asyncio
+import threading
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Any, Iterator
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from retrieval_graph import retrieval
+from retrieval_graph.chunking import chunk_id
+from retrieval_graph.singleflight import SingleFlight
+
+
+def test_amake_retriever_builds_off_the_event_loop(monkeypatch) -> None:
+    built_on: list[int] = []
+
+    @contextmanager
+    def fake_make_retriever(config: Any) -> Iterator[str]:
+        built_on.append(threading.get_ident())
+        yield "retriever"
+
+    monkeypatch.setattr(retrieval, "make_retriever", fake_make_retriever)
+
+    async def main() -> str:
+        async with retrieval.amake_retriever({}) as retriever:
+            return retriever
+
+    assert asyncio.run(main()) == "retriever"
+    assert built_on and built_on[0] != threading.get_ident()
+
+
+def test_amake_retriever_releases_the_store_when_cancelled(monkeypatch) -> None:
+    building = threading.Event()
+    proceed = threading.Event()
+    released = threading.Event()
+
+    class Lease:
+        # Unlike a generator, this is not released when garbage collected.
+        def __enter__(self) -> str:
+            building.set()
+            proceed.wait(5)
+            return "retriever"
+
+        def __exit__(self, *exc_info: Any) -> None:
+            released.set()
+
+    def slow_make_retriever(config: Any) -> Lease:
+        return Lease()
+
+    monkeypatch.setattr(retrieval, "make_retriever", slow_make_retriever)
+
+    async def main() -> None:
+        async def use() -> None:
+            async with retrieval.amake_retriever({}):
+                pass
+
+        task = asyncio.create_task(use())
+        await asyncio.to_thread(building.wait, 5)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        proceed.set()
+        assert await asyncio.to_thread(released.wait, 5)
+
+    asyncio.run(main())
+
+
+def test_identical_concurrent_searches_share_one_request() -> None:
+    class CountingEmbedding(DeterministicFakeEmbedding):
+        queries: list[str] = []
+
+        def embed_query(self, text: str) -> list[float]:
+            self.queries.append(text)
+            return super().embed_query(text)
+
+    embedding = CountingEmbedding(size=8)
+    store = InMemoryVectorStore(embedding)
+    store.add_documents([Document("cats purr")])
+
+    def retriever(user_id: str) -> retrieval.SingleFlightRetriever:
+        return retrieval.SingleFlightRetriever(
+            vectorstore=store, provider="local", user_id=user_id
+        )
+
+    async def main() -> list[list[Document]]:
+        return await asyncio.gather(
+            retriever("u1").ainvoke("do cats purr?"),
+            retriever("u1").ainvoke("do  cats purr? "),
+            retriever("u2").ainvoke("do cats purr?"),
+        )
+
+    first, second, other_user = asyncio.run(main())
+    assert first == second == other_user and first is not second
+    assert len(embedding.queries) == 2
+    assert len(retrieval.SEARCHES) == 0
+
+
+def test_single_flight_propagates_errors_to_every_caller() -> None:
+    flight: SingleFlight[int] = SingleFlight()
+    calls: list[int] = []
+
+    async def fail() -> int:
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("store unavailable")
+
+    async def main() -> list:
+        return await asyncio.gather(
+            flight.do("key", fail), flight.do("key", fail), return_exceptions=True
+        )
+
+    errors = asyncio.run(main())
+    assert [str(error) for error in errors] == ["store unavailable"] * 2
+    assert calls == [1]
+
+
+def test_pinecone_bulk_delete_deletes_by_id() -> None:
+    class FakeIndex:
+        def __init__(self, vectors: dict[str, str]) -> None:
+            self.vectors = vectors
+            self.deleted: list[list[str]] = []
+
+        def fetch(self, ids: list[str], namespace: Any) -> Any:
+            assert len(ids) <= retrieval._PINECONE_FETCH_BATCH
+            return SimpleNamespace(
+                vectors={
+                    id_: SimpleNamespace(metadata={"user_id": self.vectors[id_]})
+                    for id_ in ids
+                    if id_ in self.vectors
+                }
+            )
+
+        def delete(self, ids: list[str], namespace: Any) -> None:
+            assert len(ids) <= retrieval._PINECONE_DELETE_BATCH
+            self.deleted.append(ids)
+            for id_ in ids:
+                del self.vectors[id_]
+
+    chunks = [chunk_id("p", i) for i in range(1500)]
+    index = FakeIndex({"a": "u1", "b": "u2", **dict.fromkeys(chunks, "u1")})
+
+    class PineconeVectorStore:
+        _index = index
+        _namespace = None
+
+    store: Any = PineconeVectorStore()
+    removed = asyncio.run(
+        retrieval.adelete_user_documents(
+            store, "u1", ids=["a", "b"], parent_ids=["p"], keep_ids=chunks[:2]
+        )
+    )
+    assert removed == 1 + 1498
+    assert [len(ids) for ids in index.deleted] == [1000, 499]
+    assert set(index.vectors) == {"b", *chunks[:2]}
+
+    with pytest.raises(ValueError):
+        asyncio.run(retrieval.adelete_user_documents(store, "u1", everything=True))
+    removed = asyncio.run(
+        retrieval.adelete_user_documents(
+            store, "u1", everything=True, known_ids=chunks[:2]
+        )
+    )
+    assert removed == 2 and set(index.vectors) == {"b"}
@@ -0,0 +1,41 @@
+import pytest
+
+from retrieval_graph.sources import DocumentSource
+from retrieval_graph.state import add_queries, reduce_docs
+
+
+def test_add_queries_dedupes_and_bounds_history() -> None:
+    history: list[str] = []
+    for turn in range(50):
+        history = list(
+            add_queries(history, [f"query {turn}", "Cats  swim"], max_length=5)
+        )
+    assert len(history) == 5
+    assert history[-1] == "Cats  swim"
+    assert history[:-1] == [f"query {turn}" for turn in range(46, 50)]
+    assert add_queries(["a"], ["", "  "], max_length=5) == ["a"]
+
+
+def test_state_reducers_are_accepted_by_langgraph() -> None:
+    from langgraph.graph import StateGraph
+
+    from retrieval_graph.state import State
+
+    StateGraph(State)
+
+
+def test_path_inputs_must_be_inside_the_ingest_root(monkeypatch, tmp_path) -> None:
+    root = tmp_path / "uploads"
+    root.mkdir()
+    (root / "docs.jsonl").write_text('"hello"\n')
+    secret = tmp_path / "secret.txt"
+    secret.write_text("password")
+
+    with pytest.raises(ValueError, match="RETRIEVAL_INGEST_ROOT"):
+        reduce_docs(None, {"path": "docs.jsonl"})
+
+    monkeypatch.setenv("RETRIEVAL_INGEST_ROOT", str(root))
+    assert isinstance(reduce_docs(None, {"path": "docs.jsonl"}), DocumentSource)
+    for path in ["../secret.txt", str(secret), "/etc/passwd"]:
+        with pytest.raises(ValueError, match="outside the ingest root"):
+            reduce_docs(None, {"path": path})
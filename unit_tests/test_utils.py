@@ -0,0 +1,32 @@
+from langchain_core.documents import Document
+
+from retrieval_graph.utils import approximate_token_count, format_docs
+
+
+def test_format_docs_fills_budget_in_rank_order() -> None:
+    docs = [
+        Document(page_content="a" * 400, metadata={"id": "1", "source": "x", "n": 1}),
+        Document(page_content="b" * 4000, metadata={"id": "2"}),
+        Document(page_content="c" * 40, metadata={"id": "3"}),
+    ]
+
+    formatted = format_docs(docs, token_budget=300, metadata_keys=["source"])
+
+    assert approximate_token_count(formatted) <= 300
+    assert "<document  source='x'>" in formatted and "n=1" not in formatted
+    assert formatted.index("a" * 400) < formatted.index("b" * 100)
+    assert "b" * 4000 not in formatted and "c" * 40 not in formatted
+
+
+def test_format_docs_skips_overflowing_docs_when_budget_is_small() -> None:
+    docs = [Document(page_content="x" * 400), Document(page_content="small")]
+    formatted = format_docs(docs, token_budget=40, min_trimmed_tokens=64)
+    assert "small" in formatted and "x" not in formatted
+
+
+def test_format_docs_does_not_reuse_fragments_across_contents() -> None:
+    first = Document(page_content="u1 secret", metadata={"id": "a", "user_id": "u1"})
+    second = Document(page_content="u2 notes", metadata={"id": "a", "user_id": "u2"})
+    assert "u1 secret" in format_docs([first])
+    rendered = format_docs([second])
+    assert "u2 notes" in rendered and "u1 secret" not in rendered
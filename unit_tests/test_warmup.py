@@ -0,0 +1,21 @@
+import asyncio
+
+from retrieval_graph import warmup
+
+
+def test_schedule_warm_up_runs_once_per_loop(monkeypatch) -> None:
+    calls: list[bool] = []
+
+    async def fake_awarm_up(*, ping: bool) -> None:
+        calls.append(ping)
+
+    monkeypatch.setattr(warmup, "awarm_up", fake_awarm_up)
+
+    async def main() -> None:
+        warmup.schedule_warm_up()
+        warmup.schedule_warm_up()
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+    asyncio.run(main())
+    assert calls == [True, True]